@@ -0,0 +1,352 @@
+#!/usr/bin/python
+'''
+Benchmarks for Fitzcairns Macro Interpreter.
+
+Runs each stage of the pipeline over the bundled macro files, and
+reports throughput, p50/p99 latency and peak memory for each.  The
+stages are timed separately:
+
+  lex       -- MacroCommandTokenizer, per command
+  parse     -- MacroParser, per command, over already-lexed tokens
+  validate  -- validate_macro, per macro
+  interpret -- MacroInterpreter, per macro
+  memo      -- MacroInterpreter with the condition memo, per macro
+  render    -- render_macro_html, per macro, over interpreted macros
+  template  -- the same html rendered through the Django template,
+               render_macro_template_html, to compare render against
+
+Everything runs offline: spell and item data comes from the test
+source, and neither the lex cache nor memcache is used.  The
+condition memo is only used in the memo stage.  Each stage
+runs in its own process so that peak memory is its own.
+
+Results can be saved as a baseline, and later runs compared against
+it.  Baselines are specific to a machine, so save one before making
+changes.
+
+The tokens mode instead counts the token objects constructed, the
+size of the pickled InterpretedMacro as stored in memcache, and the
+size of its rendered html, per interpreted macro.
+'''
+
+import os
+import sys
+import time
+import cPickle
+import logging
+import resource
+import multiprocessing
+
+from django.utils                    import simplejson
+
+from macro.exceptions                import *
+from macro.data.wow                  import SOURCE_TEST
+from macro.lex.lexer                 import MacroCommandTokenizer
+from macro.parse.parser              import MacroParser
+from macro.parse.validate            import validate_macro
+from macro.interpret.interpreter     import MacroInterpreter
+from macro.interpret.cond_cache      import CondCache
+from macro.interpret.txt_token       import TxtToken
+from macro.lex.token                 import MacroToken
+from interpret_batch                 import read_macros
+
+
+# Workloads, by name.
+WORKLOADS = [('tests',  'tests/test_macros.txt'),
+             ('doc',    'doc/test_macros.txt'),
+             ('parser', 'doc/test_example_parser.txt')]
+
+STAGES = ('lex', 'parse', 'validate', 'interpret', 'memo', 'render',
+          'template')
+
+# Defaults for the command line.
+DEFAULT_BASELINE  = 'tests/benchmark_baseline.json'
+DEFAULT_REPEAT    = 5
+DEFAULT_THRESHOLD = 0.2
+
+# The small workloads are repeated until there are at least this many
+# samples, so their percentiles aren't noise.
+MIN_SAMPLES = 1000
+
+# Save the template path.
+_TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), 'templates')
+
+
+# Read the macros, and the commands in them, from a workload file.
+def read_workload(path):
+    in_file = open(path, 'r')
+    try:
+        macros = [macro for macro_id, macro in read_macros(in_file, 'blocks')]
+    finally:
+        in_file.close()
+    commands = [c for m in macros for c in m.splitlines() if c and not c.isspace()]
+    return (macros, commands)
+
+
+# Get the value at fraction q of a sorted list.
+def percentile(values, q):
+    if len(values) == 0: return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+# Time func over every item, repeat times, after one untimed pass
+# to warm up.  Errors the pipeline raises on bad input are part of
+# the work.
+def time_items(func, items, repeat):
+    for item in items:
+        try:
+            func(item)
+        except MacroError:
+            pass
+    samples = []
+    for r in range(repeat):
+        for item in items:
+            start = time.time()
+            try:
+                func(item)
+            except MacroError:
+                pass
+            samples.append(time.time() - start)
+    return samples
+
+
+# Helpers to set up and run each stage.
+def _lex_stage(macros, commands):
+    lexer = MacroCommandTokenizer(use_cache=False)
+    return (lexer.reset, commands)
+
+def _parse_stage(macros, commands):
+    parser = MacroParser(lexer_obj=MacroCommandTokenizer(use_cache=False))
+    # Lex outside the timer; only parse_macro is timed.
+    items = []
+    for command in commands:
+        try:
+            parser.lex_macro(command, 0)
+            items.append(command)
+        except MacroError:
+            pass
+    def parse(command):
+        parser.lex_macro(command, 0)
+        start = time.time()
+        try:
+            parser.parse_macro()
+        finally:
+            parse.elapsed = time.time() - start
+    return (parse, items)
+
+def _validate_stage(macros, commands):
+    parser = MacroParser(lexer_obj=MacroCommandTokenizer(use_cache=False))
+    return (lambda m: validate_macro(m, parser), macros)
+
+def _interpret_stage(macros, commands):
+    mi     = MacroInterpreter(data_source=SOURCE_TEST)
+    mi.cond_cache = None
+    parser = MacroParser(lexer_obj=MacroCommandTokenizer(use_cache=False))
+    return (lambda m: mi.interpret_macro(m, parser), macros)
+
+def _memo_stage(macros, commands):
+    mi     = MacroInterpreter(data_source=SOURCE_TEST)
+    mi.cond_cache = CondCache()
+    parser = MacroParser(lexer_obj=MacroCommandTokenizer(use_cache=False))
+    return (lambda m: mi.interpret_macro(m, parser), macros)
+
+def _render_stage(macros, commands):
+    from macro.render.util import render_macro_html
+    mi = MacroInterpreter(data_source=SOURCE_TEST)
+    interpreted = [o for m, o, e in mi.interpret_macros(macros) if o is not None]
+    return (lambda o: render_macro_html(o, _TEMPLATE_PATH), interpreted)
+
+def _template_stage(macros, commands):
+    from macro.render.util import render_macro_template_html
+    mi = MacroInterpreter(data_source=SOURCE_TEST)
+    interpreted = [o for m, o, e in mi.interpret_macros(macros) if o is not None]
+    return (lambda o: render_macro_template_html(o, _TEMPLATE_PATH), interpreted)
+
+_STAGE_FUNCS = {'lex':       _lex_stage,
+                'parse':     _parse_stage,
+                'validate':  _validate_stage,
+                'interpret': _interpret_stage,
+                'memo':      _memo_stage,
+                'render':    _render_stage,
+                'template':  _template_stage}
+
+
+# Run one stage over a workload, returning its stats.  Run in a
+# child process.
+def run_stage(args):
+    stage, path, repeat = args
+    macros, commands = read_workload(path)
+    func, items = _STAGE_FUNCS[stage](macros, commands)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if len(items) > 0:
+        repeat = max(repeat, -(-MIN_SAMPLES // len(items)))
+
+    # Parsing times itself, so lexing can be left out.
+    if stage == 'parse':
+        samples = []
+        def timed(item):
+            try:
+                func(item)
+            finally:
+                samples.append(func.elapsed)
+        time_items(timed, items, repeat)
+        del samples[:len(items)]
+    else:
+        samples = time_items(func, items, repeat)
+
+    total = sum(samples)
+    samples.sort()
+    return {'items':      len(items),
+            'throughput': len(samples) / max(total, 1e-9),
+            'p50_us':     percentile(samples, 0.50) * 1e6,
+            'p99_us':     percentile(samples, 0.99) * 1e6,
+            'peak_kb':    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss}
+
+
+# Run every stage over every workload.  Returns
+# {workload: {stage: stats}}.
+def run_benchmarks(repeat=DEFAULT_REPEAT, workloads=WORKLOADS):
+    results = {}
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        for name, path in workloads:
+            results[name] = {}
+            for stage in STAGES:
+                results[name][stage] = pool.apply(run_stage, ((stage, path, repeat),))
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+# Helper to count calls to cls.__init__ in counts, by class name.
+def _count_inits(cls, counts):
+    init = cls.__init__
+    counts[cls.__name__] = 0
+    def counted(self, *args, **kwargs):
+        counts[cls.__name__] += 1
+        init(self, *args, **kwargs)
+    cls.__init__ = counted
+
+
+# Count the tokens constructed, and the pickled and rendered sizes, per
+# interpreted macro.  Run in a child process, as it patches the token
+# classes.
+def run_tokens(path):
+    macros, commands = read_workload(path)
+    counts = {}
+    for cls in (MacroToken, TxtToken):
+        _count_inits(cls, counts)
+    mi     = MacroInterpreter(data_source=SOURCE_TEST)
+    parser = MacroParser(lexer_obj=MacroCommandTokenizer(use_cache=False))
+    interpreted = [mi.interpret_macro(m, parser) for m in macros]
+    pickled = sum([len(cPickle.dumps(o, cPickle.HIGHEST_PROTOCOL)) for o in interpreted])
+    stats = {'macros': len(macros), 'pickle_bytes': pickled / float(max(len(interpreted), 1))}
+    for name, count in counts.items():
+        stats[name] = count / float(max(len(macros), 1))
+
+    from macro.render.util import render_macro_html
+    html = sum([len(render_macro_html(o, _TEMPLATE_PATH).encode('utf-8')) for o in interpreted])
+    stats['html_bytes'] = html / float(max(len(interpreted), 1))
+    return stats
+
+
+# Run run_tokens over every workload.  Returns {workload: stats}.
+def run_token_counts(workloads=WORKLOADS):
+    results = {}
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        for name, path in workloads:
+            results[name] = pool.apply(run_tokens, (path,))
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+# Compare results against a baseline.  Returns a list of
+# (workload, stage, metric, baseline, current) regressions, where
+# throughput fell or latency rose by more than threshold.
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    regressions = []
+    for name, stages in results.items():
+        for stage, stats in stages.items():
+            base = baseline.get(name, {}).get(stage)
+            if not base: continue
+            if stats['throughput'] < base['throughput'] * (1 - threshold):
+                regressions.append((name, stage, 'throughput', base['throughput'], stats['throughput']))
+            if stats['p99_us'] > base['p99_us'] * (1 + threshold):
+                regressions.append((name, stage, 'p99_us', base['p99_us'], stats['p99_us']))
+    return regressions
+
+
+# Helper to print results as a table.
+def str_results(results, baseline={}):
+    lines = ["%-8s %-10s %6s %12s %10s %10s %9s" % \
+             ('workload', 'stage', 'items', 'per sec', 'p50 us', 'p99 us', 'peak kb')]
+    for name, path in WORKLOADS:
+        if name not in results: continue
+        for stage in STAGES:
+            stats = results[name][stage]
+            line  = "%-8s %-10s %6d %12.1f %10.1f %10.1f %9d" % \
+                    (name, stage, stats['items'], stats['throughput'],
+                     stats['p50_us'], stats['p99_us'], stats['peak_kb'])
+            base = baseline.get(name, {}).get(stage)
+            if base and base['throughput']:
+                line += "  (%+.1f%%)" % ((stats['throughput'] / base['throughput'] - 1) * 100)
+            lines.append(line)
+    return "\n".join(lines)
+
+
+# Helper to print token counts as a table.
+def str_token_counts(results):
+    lines = ["%-8s %6s %12s %10s %13s %11s" % \
+             ('workload', 'macros', 'MacroToken', 'TxtToken', 'pickle bytes', 'html bytes')]
+    for name, path in WORKLOADS:
+        if name not in results: continue
+        stats = results[name]
+        lines.append("%-8s %6d %12.1f %10.1f %13.1f %11.1f" % \
+                     (name, stats['macros'], stats['MacroToken'],
+                      stats['TxtToken'], stats['pickle_bytes'], stats['html_bytes']))
+    return "\n".join(lines)
+
+
+#### MAIN #####
+if __name__ == "__main__":
+    # Set up the logger
+    logging.basicConfig(level=logging.INFO,
+                        format='%(message)s')
+
+    args = sys.argv[1:]
+    if len(args) > 0 and args[0] not in ('compare', 'save', 'tokens'):
+        print "Usage: %s [compare|save|tokens] [baseline_file] [repeat] [threshold]" % (sys.argv[0],)
+        sys.exit(1)
+    mode      = args[0] if len(args) > 0 else 'compare'
+    if mode == 'tokens':
+        print str_token_counts(run_token_counts())
+        sys.exit(0)
+    base_name = args[1] if len(args) > 1 else DEFAULT_BASELINE
+    repeat    = int(args[2]) if len(args) > 2 else DEFAULT_REPEAT
+    threshold = float(args[3]) if len(args) > 3 else DEFAULT_THRESHOLD
+
+    results = run_benchmarks(repeat)
+    if mode == 'save':
+        out_file = open(base_name, 'w')
+        out_file.write(simplejson.dumps(results, indent=1, sort_keys=True))
+        out_file.close()
+        print str_results(results)
+        logging.info("Saved baseline to %s." % base_name)
+        sys.exit(0)
+
+    baseline = {}
+    if os.path.exists(base_name):
+        baseline = simplejson.loads(open(base_name, 'r').read())
+    print str_results(results, baseline)
+    if not baseline:
+        logging.info("No baseline at %s; run with 'save' to make one." % base_name)
+        sys.exit(0)
+
+    regressions = compare(results, baseline, threshold)
+    for name, stage, metric, base, curr in regressions:
+        logging.warning("REGRESSION %s/%s %s: %.1f -> %.1f" % (name, stage, metric, base, curr))
+    sys.exit(1 if regressions else 0)
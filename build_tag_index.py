@@ -0,0 +1,57 @@
+#!/usr/bin/python
+'''
+Build the tag index served by search (see
+macro/data/local/tagindex.py) from an export of the SavedMacro
+entities, the csv written by
+
+  appcfg.py download_data --kind=SavedMacro --config_file=bulkloader.yaml
+
+Rerun this and redeploy to pick up macros saved since the last build.
+'''
+
+import sys
+import csv
+import time
+import logging
+
+from macro.data.local.tagindex       import TagIndex, TAG_INDEX
+
+
+# Read (index, tags, views, rating) tuples from an export.
+def read_export(in_file):
+    # The bulkloader export has a header row of the column names.
+    reader = csv.reader(in_file)
+    header = reader.next()
+    index_col, tags_col, views_col, rating_col = \
+               [header.index(c) for c in ('index', 'tags', 'views', 'rating')]
+    for row in reader:
+        yield (int(row[index_col]),
+               [t for t in row[tags_col].decode('utf-8').split(",") if t],
+               int(row[views_col] or 0),
+               int(row[rating_col] or 0))
+
+
+#### MAIN #####
+if __name__ == "__main__":
+    # Set up the logger
+    logging.basicConfig(level=logging.INFO,
+                        format='%(message)s')
+
+    args = sys.argv[1:]
+    if len(args) < 1 or args[0] in ('-h', '--help'):
+        print "Usage: %s export_csv [out_file]" % (sys.argv[0],)
+        sys.exit(1)
+    in_name  = args[0]
+    out_name = args[1] if len(args) > 1 else TAG_INDEX
+
+    start   = time.time()
+    in_file = open(in_name, 'rb')
+    try:
+        macros = list(read_export(in_file))
+    finally:
+        in_file.close()
+    index = TagIndex(macros)
+    index.save(out_name)
+    logging.info("Indexed %s tags over %s macros to %s in %.2fs." % \
+                 (index.num_tags(), len(macros), out_name,
+                  time.time() - start))
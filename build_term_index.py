@@ -0,0 +1,127 @@
+#!/usr/bin/python
+'''
+Build the term index of what saved macros do (see
+macro/data/local/termindex.py) from an export of the SavedMacro
+entities, the csv written by
+
+  appcfg.py download_data --kind=SavedMacro --config_file=bulkloader.yaml
+
+Every macro is interpreted, so the export is sharded across a pool of
+worker processes as in reinterpret_corpus.py, each with its own
+MacroInterpreter.  By default spell and item data comes from the
+in-process index over the data/ csvs (see macro/data/local/wow.py).
+Rerun this and redeploy to pick up macros saved since the last build.
+'''
+
+import sys
+import csv
+import time
+import logging
+import multiprocessing
+
+from macro.data.wow                  import SOURCE_TEST, SOURCE_LOCAL
+from macro.data.local.wow            import get_local_index
+from macro.data.local.tagindex       import TagIndex
+from macro.data.local.termindex      import get_macro_terms, TERM_INDEX
+from macro.interpret.interpreter     import MacroInterpreter
+from reinterpret_corpus              import make_shards
+from interpret_batch                 import SOURCES
+
+
+# Number of macros handed to a worker at a time.
+_SHARD_SIZE = 500
+
+# The interpreter for this worker process, created once by the pool.
+_worker_mi = None
+
+
+# Read (index, macro, views, rating) tuples from an export.
+def read_export(in_file):
+    # The bulkloader export has a header row of the column names.
+    reader = csv.reader(in_file)
+    header = reader.next()
+    index_col, macro_col, views_col, rating_col = \
+               [header.index(c) for c in ('index', 'macro', 'views', 'rating')]
+    for row in reader:
+        yield (int(row[index_col]),
+               row[macro_col].decode('utf-8'),
+               int(row[views_col] or 0),
+               int(row[rating_col] or 0))
+
+
+# Pool initializer, creates the interpreter for a worker.
+def init_worker(source):
+    global _worker_mi
+    _worker_mi = MacroInterpreter(data_source=source)
+
+    # Build the index up front, rather than in the first shard.
+    if source == SOURCE_LOCAL: get_local_index()
+
+
+# Get the terms for a shard in a worker.  Returns ([(index, terms,
+# views, rating)], errors).
+def index_shard(shard):
+    mi     = _worker_mi or MacroInterpreter(data_source=SOURCE_TEST)
+    rows   = []
+    errors = 0
+    macros = (macro for index, macro, views, rating in shard)
+    for i, (macro, int_macro, error) in enumerate(mi.interpret_macros(macros)):
+        index, macro, views, rating = shard[i]
+        if error is not None:
+            # Macros that can't be interpreted are left out.
+            logging.warning("Macro %s: %s" % (index, error))
+            errors += 1
+            continue
+        rows.append((index, get_macro_terms(int_macro), views, rating))
+    return (rows, errors)
+
+
+# Build the index for an export, with processes workers.  Returns
+# (TagIndex, count, errors).
+def build_term_index(macros, processes=None, source=SOURCE_TEST,
+                     shard_size=_SHARD_SIZE):
+    rows   = []
+    errors = 0
+    pool   = multiprocessing.Pool(processes, init_worker, (source,))
+    try:
+        for shard_rows, shard_errors in pool.imap_unordered(index_shard,
+                                                            make_shards(macros, shard_size)):
+            rows.extend(shard_rows)
+            errors += shard_errors
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return (TagIndex(rows), len(rows) + errors, errors)
+
+
+#### MAIN #####
+if __name__ == "__main__":
+    # Set up the logger
+    logging.basicConfig(level=logging.INFO,
+                        format='%(message)s')
+
+    args = sys.argv[1:]
+    if len(args) < 1 or args[0] in ('-h', '--help'):
+        print "Usage: %s export_csv [out_file] [processes] [local|test|datastore]" % (sys.argv[0],)
+        sys.exit(1)
+    in_name   = args[0]
+    out_name  = args[1] if len(args) > 1 else TERM_INDEX
+    processes = int(args[2]) if len(args) > 2 else None
+    source    = args[3].lower() if len(args) > 3 else 'local'
+    if source not in SOURCES:
+        print "Unknown data source %s." % source
+        sys.exit(1)
+
+    start   = time.time()
+    in_file = open(in_name, 'rb')
+    try:
+        index, count, errors = build_term_index(read_export(in_file), processes,
+                                                SOURCES[source])
+    finally:
+        in_file.close()
+    index.save(out_name)
+    logging.info("Indexed %s terms over %s macros (%s errors) to %s in %.2fs." % \
+                 (index.num_tags(), count, errors, out_name, time.time() - start))
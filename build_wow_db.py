@@ -0,0 +1,34 @@
+#!/usr/bin/python
+'''
+Compile the spell and item csvs into the binary database read by the
+local data source (see macro/data/local/wowdb.py).  Rerun this
+whenever the csvs change.
+'''
+
+import sys
+import time
+import logging
+
+from macro.data.local.wow            import LocalIndex, SPELL_CSV, ITEM_CSV, WOW_DB
+from macro.data.local.wowdb          import build_db
+
+
+if __name__ == "__main__":
+    # Set up the logger
+    logging.basicConfig(level=logging.INFO,
+                        format='%(message)s')
+
+    args = sys.argv[1:]
+    if len(args) > 0 and args[0] in ('-h', '--help'):
+        print "Usage: %s [out_file] [spell_csv] [item_csv]" % (sys.argv[0],)
+        sys.exit(1)
+    out_name  = args[0] if len(args) > 0 else WOW_DB
+    spell_csv = args[1] if len(args) > 1 else SPELL_CSV
+    item_csv  = args[2] if len(args) > 2 else ITEM_CSV
+
+    start = time.time()
+    index = LocalIndex(spell_csv, item_csv)
+    size  = build_db(out_name, index)
+    logging.info("Wrote %s spells and %s items to %s, %s bytes, in %.2fs." % \
+                 (index.num_spells(), index.num_items(), out_name, size,
+                  time.time() - start))
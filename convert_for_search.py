@@ -11,7 +11,7 @@ import copy
 #sys.path.append("C:\Program Files\Google\google_appengine\lib\yaml\lib")
 
 from google.appengine.ext            import db
-from macro.data.appengine.macrotag   import save_macro_tags
+from macro.data.appengine.macrotag   import save_macro_tags, MacroTag
 from macro.data.appengine.savedmacro import SavedMacro
 from google.appengine.ext.remote_api import remote_api_stub
 from google.appengine.ext            import db
@@ -126,6 +126,18 @@ class MacroUpdater(Mapper):
         # Create tags for the macro.
         save_macro_tags(tags)
         return ([entity], [])
+
+
+class MacroTagUpdater(Mapper):
+    ''' Updater for MacroTag entities. '''
+    def __init__(self):
+        self.KIND = MacroTag
+
+    def map(self, entity):
+        ''' Write the tag back, which drops the prefix list it was
+        saved with; typeahead no longer queries it.
+        '''
+        return ([entity], [])
     
 
 #### MAIN #####
@@ -157,6 +169,7 @@ if __name__ == "__main__":
     # Update data.
     logger.info("Updating existing data...")
     MacroUpdater().run()
+    MacroTagUpdater().run()
 
     # Done.
     logger.info("Process complete.")
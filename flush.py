@@ -0,0 +1,40 @@
+'''
+Flush buffered counts to the datastore, from cron.
+'''
+
+import logging
+from google.appengine.ext             import webapp
+from google.appengine.ext.webapp.util import run_wsgi_app
+
+from macro.render.defs                import URL_FLUSH
+from macro.data.appengine.savedmacro  import flush_counters
+
+
+class CounterFlush(webapp.RequestHandler):
+  '''
+  Flushes the write-behind view, send and rating counters, so counts
+  reach the datastore even when there is no traffic to flush them.
+  '''
+
+  def get(self):
+    '''
+    Flush, and report how many macros were written.
+    '''
+    count = flush_counters()
+    logging.info("Flushed counts for %s macros." % count)
+    self.response.out.write(str(count))
+
+    
+''' Register handlers for WSCGI. '''
+application = webapp.WSGIApplication(
+  [
+  (URL_FLUSH, CounterFlush),
+  ],
+  debug=False)
+
+
+def real_main():
+  run_wsgi_app(application)
+
+if __name__ == "__main__":
+  real_main()
@@ -0,0 +1,176 @@
+#!/usr/bin/python
+'''
+Fuzzing harness for the lexer regexes.
+
+Searches for inputs that make lexing slow, and reports how the time
+taken grows with input length:
+
+  rules -- For each rule in macro/lex/rules.py, search for the input
+           that takes its regexp the longest, then time it at lengths
+           up to the maximum macro length.
+  lexer -- The same, for lexing whole commands with
+           MacroCommandTokenizer, counting rule applications (steps)
+           as well as time.
+
+Inputs are built in the classic shape for regexp blowups: a prefix, a
+"pump" repeated to the target length, and a suffix, all taken from
+fragments of the macro language.  The growth exponent is estimated
+from the smallest and largest lengths; anything much over 1 is
+super-linear and gets flagged.
+
+The step counts found for whole commands are what MAX_LEX_STEPS in
+macro/lex/lexer.py is set against.
+'''
+
+import sys
+import math
+import time
+import random
+import logging
+
+from macro.exceptions                import *
+from macro.lex                       import rules
+from macro.lex.lexer                 import MacroCommandTokenizer
+from macro.interpret.errors          import MAX_LEN_ALLOWED
+
+
+# Fragments inputs are built from.
+PREFIXES  = ['', '/cast ', '/castsequence ', '/use ', '/target ', '/say ', '#showtooltip ',
+             '/cast [', '/cast [target=', '/cast [mod:', '/castsequence reset=']
+PUMPS     = ['a', ' ', '1', 'a1', '[', ']', '[]', ',', ', ', ';', '; ', '/', 'a/', ':', '=',
+             '-', 'a-', '@', '!', '[a', 'no', 'nomod', 'mod:', 'target', 'pet', 'pettarget',
+             'target-', 'party1', 'item:1', '%t', 'a,', '1 ', 'reset=1', 'shift/',
+             '[combat]', '[mod:shift,', 'help,', 'a b', '- ', '\'', '()']
+SUFFIXES  = ['', ']', '[', ';', ',', '/', ' x', '=', ':', '-', '1', '!']
+
+# Lengths to time at.
+LENGTHS   = [64, 128, 256, 512, MAX_LEN_ALLOWED]
+
+# Growth exponents over this are flagged.
+SUPERLINEAR = 1.5
+
+
+# Build an input of about length chars from a prefix, pump and suffix.
+def build_input(prefix, pump, suffix, length):
+    n = max(1, (length - len(prefix) - len(suffix)) // len(pump))
+    return prefix + pump * n + suffix
+
+
+# Time func(input), in seconds per call.  Calls are repeated until
+# they take long enough to time, and the best of 3 is taken.
+def time_call(func, input, min_secs=0.002):
+    best = None
+    for r in range(3):
+        n = 0
+        start = time.time()
+        while True:
+            try:
+                func(input)
+            except MacroError:
+                pass
+            n += 1
+            secs = time.time() - start
+            if secs >= min_secs: break
+        if best is None or secs / n < best: best = secs / n
+    return best
+
+
+# Estimate the growth exponent of cost with length.
+def growth(lengths, costs):
+    if costs[0] <= 0 or costs[-1] <= 0: return 0.0
+    return math.log(float(costs[-1]) / costs[0]) / math.log(float(lengths[-1]) / lengths[0])
+
+
+# Get every distinct rule reachable from the root, in order.
+def get_rules(rule=rules.LEX_RULE_ROOT, seen=None):
+    if seen is None: seen = {}
+    if id(rule) in seen: return []
+    seen[id(rule)] = True
+    found = [rule]
+    for subrule in rules.decompose_rule(rule)[5] or ():
+        found.extend(get_rules(subrule, seen))
+    return found
+
+
+# Get all the candidate (prefix, pump, suffix) triples, or a random
+# sample of them.
+def get_candidates(samples=None, rand=None):
+    candidates = [(p, m, s) for p in PREFIXES for m in PUMPS for s in SUFFIXES]
+    if samples is not None and samples < len(candidates):
+        candidates = (rand or random).sample(candidates, samples)
+    return candidates
+
+
+# Search for the worst input for cost_func at search_len, then cost
+# it at every length.  Returns (worst candidate, [costs by length]).
+def search(cost_func, candidates, search_len=256, lengths=LENGTHS):
+    worst = None
+    for candidate in candidates:
+        cost = cost_func(build_input(*(candidate + (search_len,))))
+        if worst is None or cost > worst[0]: worst = (cost, candidate)
+    costs = [cost_func(build_input(*(worst[1] + (l,)))) for l in lengths]
+    return (worst[1], costs)
+
+
+# Fuzz a single rule's regexp.  Uses re.search, as in rules.apply_rule.
+def fuzz_rule(rule, candidates, lengths=LENGTHS):
+    re_obj = rules.decompose_rule(rule)[4]
+    def cost(input):
+        return time_call(re_obj.search, input, 0.0005)
+    return search(cost, candidates, lengths=lengths)
+
+
+# Fuzz whole commands.  Returns (worst candidate, [steps by length],
+# [secs by length]).
+def fuzz_lexer(candidates, lengths=LENGTHS):
+    # No budget here; the point is to see how far past it inputs go.
+    lexer = MacroCommandTokenizer(use_cache=False, max_steps=None)
+    def steps(input):
+        try:
+            lexer.reset(input)
+        except MacroError:
+            pass
+        return lexer.steps
+    worst, worst_steps = search(steps, candidates, lengths=lengths)
+    secs = [time_call(lexer.reset, build_input(*(worst + (l,)))) for l in lengths]
+    return (worst, worst_steps, secs)
+
+
+# Helper to show a candidate.
+def str_candidate(candidate):
+    return "%r + %r* + %r" % candidate
+
+
+#### MAIN #####
+if __name__ == "__main__":
+    # Set up the logger
+    logging.basicConfig(level=logging.INFO,
+                        format='%(message)s')
+
+    args = sys.argv[1:]
+    if len(args) > 0 and not args[0].isdigit():
+        print "Usage: %s [samples] [seed]" % (sys.argv[0],)
+        sys.exit(1)
+    samples = int(args[0]) if len(args) > 0 else 200
+    rand    = random.Random(int(args[1]) if len(args) > 1 else 0)
+
+    flagged = 0
+    print "%-36s %8s  %s" % ('rule', 'growth', ' '.join(['%9s' % ('us@%d' % l) for l in LENGTHS]))
+    for rule in get_rules():
+        worst, costs = fuzz_rule(rule, get_candidates(samples, rand))
+        slope = growth(LENGTHS, costs)
+        flag  = ''
+        if slope > SUPERLINEAR:
+            flag = '  SUPERLINEAR ' + str_candidate(worst)
+            flagged += 1
+        print "%-36s %8.2f  %s%s" % (rules.decompose_rule(rule)[0][:36], slope,
+                                     ' '.join(['%9.1f' % (c * 1e6) for c in costs]), flag)
+
+    worst, steps, secs = fuzz_lexer(get_candidates(samples, rand))
+    print
+    print "Whole commands, worst input %s" % str_candidate(worst)
+    print "%8s %8s %10s" % ('length', 'steps', 'us')
+    for l, s, t in zip(LENGTHS, steps, secs):
+        print "%8d %8d %10.1f" % (l, s, t * 1e6)
+    print "Growth: steps %.2f, time %.2f" % (growth(LENGTHS, steps), growth(LENGTHS, secs))
+    logging.info("%s rules flagged as super-linear." % flagged)
@@ -0,0 +1,420 @@
+#!/usr/bin/python
+'''
+Synthetic macro corpus generator for Fitzcairns Macro Interpreter.
+
+Builds random macros from the grammar in doc/EBNF.txt:
+
+  command          = "/", command-verb, [ {command-object, ";" } command-object] ]
+  command-object   = { condition } parameters
+  condition        = "[" condition-phrase { "," condition-phrase } "]"
+  condition-phrase = [ "no" ], option-word, [ ":" option-argument { "/" option-argument } ]
+
+with verbs, options, option arguments and targets drawn from the live
+VERB_MAP, OPTION_MAP, ARG_MAP and TARGET_MAP, so the corpus follows
+the language tables as they change.  Parameters are built to suit
+each verb (spells, items, units, numbers, lists with reset=).
+
+A fraction of macros are made near-valid by applying one mutation
+(misspelled verbs or options, unbalanced brackets, bad arguments,
+over-long macros, ...) so that error paths get load too.
+
+Macros are generated one at a time and written as they go, so corpora
+of any size run in constant memory.  Output is either JSON-lines, as
+read by interpret_batch.py and reinterpret_corpus.py, or blank-line
+separated blocks, as in tests/test_macros.txt.  The same seed and
+settings always give the same corpus.
+'''
+
+import sys
+import random
+import logging
+
+from django.utils                    import simplejson
+
+from macro.language.verb             import VERB_MAP
+from macro.language.option           import OPTION_MAP
+from macro.language.arg              import ARG_MAP
+from macro.language.target           import TARGET_MAP
+from macro.interpret.errors          import MAX_LEN_ALLOWED
+
+
+# Output formats.
+FORMATS = ('json', 'blocks')
+
+# Default verb mix, by relative weight.  '*' is the weight given to
+# each verb not listed.  Weighted towards what people actually write.
+DEFAULT_VERB_MIX = {'/cast':          30,
+                    '/castsequence':  8,
+                    '/use':           10,
+                    '/target':        4,
+                    '/focus':         3,
+                    '/assist':        2,
+                    '/startattack':   4,
+                    '/stopattack':    1,
+                    '/stopcasting':   3,
+                    '/petattack':     3,
+                    '/petfollow':     1,
+                    '/equip':         2,
+                    '/cancelaura':    2,
+                    '/dismount':      1,
+                    '/stopmacro':     1,
+                    '/say':           3,
+                    '*':              0.1}
+
+# Spells and items to use as parameters.  Any name works with the
+# test data source.
+SPELL_NAMES = ['Attack', 'Shoot', 'Heroic Strike', 'Cleave', 'Charge', 'Intercept',
+               'Shield Bash', 'Pummel', 'Frostbolt', 'Fireball', 'Polymorph',
+               'Counterspell', 'Blink', 'Ice Block', 'Flash Heal', 'Renew',
+               'Power Word: Shield', 'Shadow Word: Pain', 'Holy Light', 'Judgement',
+               'Cat Form', 'Bear Form', 'Rejuvenation', 'Regrowth', 'Moonfire',
+               'Hunter\'s Mark', 'Arcane Shot', 'Steady Shot', 'Misdirection',
+               'Sinister Strike', 'Eviscerate', 'Kick', 'Vanish', 'Stealth',
+               'Earth Shock', 'Lightning Bolt', 'Corruption', 'Fear', 'Death Coil']
+ITEM_NAMES  = ['Hearthstone', 'Healthstone', 'Super Healing Potion', 'Runic Mana Potion',
+               'Heavy Frostweave Bandage', 'Battlemaster\'s Audacity', 'Titanium Shield',
+               'Mirror of Truth', 'Drums of Battle']
+PET_NAMES   = ['Voidwalker', 'Felhunter', 'Imp', 'Succubus', 'Felguard']
+ITEM_TYPES  = ['Shields', 'Daggers', 'Bows', 'Guns', 'Wands', 'Staves', 'Plate']
+NAMES       = ['Fitzcairn', 'Thrall', 'Jaina', 'Arthas']
+CHAT_WORDS  = ['incoming', 'interrupting', 'sheeping', 'moon', 'pulling', 'now', 'on',
+               'me', 'the', 'skull', 'in', 'five', 'go']
+
+# Defaults for the size and shape of macros.  Counts are drawn from
+# a geometric distribution with the given mean, capped at the max.
+DEFAULTS = {'lines':          3,      # Commands per macro
+            'max_lines':      16,
+            'clauses':        1.5,    # ; separated objects per command
+            'max_clauses':    6,
+            'conditions':     1,      # [] blocks per object
+            'max_conditions': 4,
+            'phrases':        1.5,    # , separated phrases per block
+            'max_phrases':    6,
+            'args':           1.2,    # / separated args per phrase
+            'max_args':       4,
+            'show_rate':      0.3,    # Macros starting with #showtooltip
+            'target_rate':    0.2,    # Blocks with a target
+            'error_rate':     0.05,   # Macros with a mutation
+            'max_len':        MAX_LEN_ALLOWED}
+
+
+# Helper to parse a verb mix from the command line, i.e.
+# "/cast:30,/use:10,*:0.1"
+def parse_verb_mix(mix):
+    verbs = {}
+    for entry in mix.split(","):
+        verb, weight = entry.rsplit(":", 1)
+        verbs[verb] = float(weight)
+    return verbs
+
+
+class MacroGenerator(object):
+    ''' Generates random macros.  Settings are as in DEFAULTS, plus:
+
+    seed: (Optional)
+    Seed for the generator's own random number generator.
+    Default None (random).
+
+    verbs: (Optional)
+    Dict of verb to relative weight, as in DEFAULT_VERB_MIX.
+    Default DEFAULT_VERB_MIX.
+    '''
+
+    def __init__(self, seed=None, verbs=None, **settings):
+        for name in settings:
+            if name not in DEFAULTS:
+                raise ValueError("Unknown setting: %s" % name)
+        self.settings = dict(DEFAULTS)
+        self.settings.update(settings)
+        self.rand = random.Random(seed)
+
+        # Build the cumulative weights for picking verbs.  Meta
+        # commands only ever go on the first line.
+        if verbs is None: verbs = DEFAULT_VERB_MIX
+        self.verbs   = []
+        self.weights = []
+        total = 0.0
+        for verb, obj in sorted(VERB_MAP.items()):
+            if obj.meta or not verb.startswith('/') or verb != verb.strip(): continue
+            weight = verbs.get(verb, verbs.get('*', 0))
+            if weight <= 0: continue
+            total += weight
+            self.verbs.append(verb)
+            self.weights.append(total)
+        if total == 0:
+            raise ValueError("Verb mix has no verbs in it.")
+
+        # The language parts options can be built from.
+        self.options   = sorted(OPTION_MAP.keys())
+        self.mod_args  = sorted([a for a, obj in ARG_MAP.items() if obj.is_key and obj.is_option_arg])
+        self.reset_args = sorted([a for a, obj in ARG_MAP.items() if obj.is_reset_arg])
+        self.targets   = sorted([t for t in TARGET_MAP.keys() if not t.startswith('%')])
+
+        # Spell names that can be option arguments.
+        self.arg_spells = [s for s in SPELL_NAMES if ':' not in s]
+
+    # Helper to draw a count from a geometric distribution with the
+    # given mean, between low and high.
+    def __count(self, mean, high, low=1):
+        n = low
+        if mean > low:
+            p = 1.0 / (mean - low + 1)
+            while n < high and self.rand.random() > p: n += 1
+        return n
+
+    def __pick_verb(self):
+        x = self.rand.random() * self.weights[-1]
+        lo, hi = 0, len(self.weights) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.weights[mid] < x: lo = mid + 1
+            else: hi = mid
+        return self.verbs[lo]
+
+    def __pick(self, choices):
+        return choices[self.rand.randrange(len(choices))]
+
+    # Build a target unit, i.e. focus, party2, targettarget
+    def __target(self):
+        unit = self.__pick(self.targets)
+        if TARGET_MAP[unit].req_num_arg: unit += str(self.rand.randint(1, 5))
+        if self.rand.random() < 0.2: unit += 'target'
+        return unit
+
+    # Build the arguments for an option.
+    def __option_args(self, option):
+        n = self.__count(self.settings['args'], self.settings['max_args'])
+        obj = OPTION_MAP[option]
+        if option in ('mod', 'modifier'):
+            args = self.__sample(self.mod_args, n)
+        elif option == 'group':
+            # The parser takes words after the first as options of
+            # their own, so these only get one.
+            args = [self.__pick(['party', 'raid'])]
+        elif option == 'channeling':
+            args = [self.__pick(self.arg_spells)]
+        elif option in ('equipped', 'worn'):
+            args = self.__sample(ITEM_TYPES, n)
+        elif option == 'pet':
+            args = self.__sample(PET_NAMES, n)
+        elif option == 'spec':
+            args = [str(self.rand.randint(1, 2))]
+        else:
+            args = [str(i) for i in self.__sample(range(1, 7), n)]
+        return args
+
+    # Helper to pick n distinct choices, in order.
+    def __sample(self, choices, n):
+        return self.rand.sample(choices, min(n, len(choices)))
+
+    # condition-phrase = [ "no" ], option-word, [ ":" option-argument { "/" option-argument } ]
+    def __phrase(self):
+        option = self.__pick(self.options)
+        obj    = OPTION_MAP[option]
+        phrase = option
+        if obj.no_args or not obj.req_args:
+            if self.rand.random() < 0.3: phrase = 'no' + phrase
+        if not obj.no_args and (obj.req_args or self.rand.random() < 0.7):
+            phrase += ':' + '/'.join(self.__option_args(option))
+        return phrase
+
+    # condition = "[" condition-phrase { "," condition-phrase } "]"
+    def __condition(self):
+        phrases = [self.__phrase() for i in range(self.__count(self.settings['phrases'],
+                                                               self.settings['max_phrases']))]
+        if self.rand.random() < self.settings['target_rate']:
+            if self.rand.random() < 0.5:
+                phrases.insert(0, '@' + self.__target())
+            else:
+                phrases.insert(0, 'target=' + self.__target())
+        return '[' + ','.join(phrases) + ']'
+
+    # Build the parameters for a verb.
+    def __params(self, verb):
+        obj = VERB_MAP[verb]
+        if not obj.secure:
+            if obj.takes_units and not obj.req_target:
+                return self.__pick(NAMES) if self.rand.random() < 0.3 else ''
+            n = self.__count(4, 12)
+            params = ' '.join([self.__pick(CHAT_WORDS) for i in range(n)])
+            if obj.req_target: params = self.__pick(NAMES) + ' ' + params
+            return params
+        if obj.takes_list:
+            names = SPELL_NAMES if obj.takes_spell else ITEM_NAMES
+            params = ', '.join(self.__sample(names, self.__count(3, 8)))
+            if obj.allow_reset and self.rand.random() < 0.5:
+                reset = '/'.join([str(self.rand.randint(1, 30))] +
+                                 self.__sample(self.reset_args, self.__count(1, 3, 0)))
+                params = 'reset=%s %s' % (reset, params)
+            return params
+        if obj.param is None:
+            if obj.takes_units and self.rand.random() < 0.5: return self.__target()
+            return ''
+
+        # Pick one of the parameter signatures the verb takes.
+        sig = self.__pick(sorted(obj.param))
+        if sig is None: return ''
+        params = []
+        for t in sig:
+            if t is int:
+                params.append(str(self.rand.randint(1, 19)))
+            elif obj.takes_units:
+                params.append(self.__target())
+            elif obj.takes_item and (not obj.takes_spell or self.rand.random() < 0.3):
+                params.append(self.__pick(ITEM_NAMES) if self.rand.random() < 0.8 else \
+                              'item:%d' % self.rand.randint(1000, 50000))
+            elif obj.takes_spell:
+                params.append(self.__pick(SPELL_NAMES))
+            else:
+                params.append(self.__pick(PET_NAMES + SPELL_NAMES))
+        return ' '.join(params)
+
+    # command-object = { condition } parameters
+    # Objects after a ; can't be empty.
+    def __object(self, verb, required=False):
+        conditions = ''
+        if VERB_MAP[verb].secure:
+            n = self.__count(self.settings['conditions'], self.settings['max_conditions'], 0)
+            conditions = ''.join([self.__condition() for i in range(n)])
+        params = self.__params(verb)
+        while required and not (conditions or params):
+            params = self.__params(verb)
+        if conditions and params: return conditions + ' ' + params
+        return conditions or params
+
+    def gen_command(self, verb=None):
+        ''' Generate a single command, with a random verb if none is
+        given. '''
+        if verb is None: verb = self.__pick_verb()
+        obj = VERB_MAP[verb]
+
+        # Only secure commands with parameters make sense with
+        # multiple clauses.
+        n = 1
+        if obj.secure and (obj.param or obj.takes_units):
+            n = self.__count(self.settings['clauses'], self.settings['max_clauses'])
+        objects = [self.__object(verb, n > 1) for i in range(n)]
+        if objects[0]: return verb + ' ' + '; '.join(objects)
+        return verb
+
+    def gen_valid(self):
+        ''' Generate a valid macro, at most max_len long. '''
+        lines = []
+        if self.rand.random() < self.settings['show_rate']:
+            show = '#showtooltip'
+            if self.rand.random() < 0.5: show += ' ' + self.__pick(SPELL_NAMES)
+            lines.append(show)
+        n = self.__count(self.settings['lines'], self.settings['max_lines'])
+        length = sum([len(l) + 1 for l in lines])
+        while len(lines) < n:
+            line = self.gen_command()
+            if length + len(line) + 1 > self.settings['max_len']: break
+            lines.append(line)
+            length += len(line) + 1
+        if len(lines) == 0: lines.append('/stopcasting')
+        return '\n'.join(lines)
+
+    def mutate(self, macro):
+        ''' Make a macro near-valid by applying one random mutation to
+        one of its lines. '''
+        lines = macro.split('\n')
+        i     = self.rand.randrange(len(lines))
+        line  = lines[i]
+        kind  = self.rand.randrange(8)
+        if kind == 0:
+            # Misspelled verb
+            parts = line.split(' ', 1)
+            parts[0] = parts[0] + self.__pick('sxz')
+            line = ' '.join(parts)
+        elif kind == 1 and '[' in line:
+            # Unknown option word
+            line = line.replace('[', '[' + self.__pick(self.options) + 'x,', 1)
+        elif kind == 2 and ']' in line:
+            # Unbalanced brackets
+            line = line.replace(']', '', 1)
+        elif kind == 3:
+            # Unclosed condition
+            parts = line.split(' ', 1)
+            line  = parts[0] + ' [' + self.__pick(self.options) + ':' + (parts[1] if len(parts) > 1 else '')
+        elif kind == 4:
+            # Bad option arguments
+            line = line.replace(']', ',stance:x/]', 1) if ']' in line else line + ' [combat:1]'
+        elif kind == 5:
+            # Stray separators
+            line = line + self.__pick([';;', ',', '[]', ' ;', '/'])
+        elif kind == 6:
+            # Over-long macro
+            line = line + ' ' + 'x' * (self.settings['max_len'] - len(macro) + 1)
+        else:
+            # Missing parameter
+            line = line.split(' ', 1)[0] + ' []'
+        lines[i] = line
+        return '\n'.join(lines)
+
+    def gen_macro(self):
+        ''' Generate a macro, near-valid at the error rate. '''
+        macro = self.gen_valid()
+        if self.rand.random() < self.settings['error_rate']:
+            macro = self.mutate(macro)
+        return macro
+
+    def generate(self, count):
+        ''' Generate count macros. '''
+        for i in xrange(count):
+            yield self.gen_macro()
+
+
+# Write count macros from a generator to out_file, as they are
+# generated.  Returns the number of bytes of macros written.
+def write_corpus(out_file, gen, count, format='json'):
+    total = 0
+    for i, macro in enumerate(gen.generate(count)):
+        if format == 'json':
+            out_file.write(simplejson.dumps({'id': str(i), 'macro': macro}) + '\n')
+        else:
+            out_file.write(macro + '\n\n')
+        total += len(macro)
+    out_file.flush()
+    return total
+
+
+# Print usage and exit.
+def usage():
+    print "Usage: %s count [json|blocks] [out_file|-] [seed] [setting=value ...]" % (sys.argv[0],)
+    print "Settings (defaults):"
+    for name in sorted(DEFAULTS):
+        print "  %s=%s" % (name, DEFAULTS[name])
+    print "  verbs=/cast:30,/use:10,...,*:0.1"
+    sys.exit(1)
+
+
+#### MAIN #####
+if __name__ == "__main__":
+    # Set up the logger
+    logging.basicConfig(level=logging.INFO,
+                        format='%(message)s')
+
+    args = sys.argv[1:]
+    positional = [a for a in args if '=' not in a]
+    settings   = dict([a.split('=', 1) for a in args if '=' in a])
+    if len(positional) < 1 or not positional[0].isdigit(): usage()
+    count    = int(positional[0])
+    format   = positional[1].lower() if len(positional) > 1 else 'json'
+    out_name = positional[2] if len(positional) > 2 else '-'
+    seed     = int(positional[3]) if len(positional) > 3 else None
+    if format not in FORMATS: usage()
+
+    verbs = None
+    if 'verbs' in settings: verbs = parse_verb_mix(settings.pop('verbs'))
+    try:
+        for name in settings:
+            settings[name] = float(settings[name])
+        gen = MacroGenerator(seed, verbs, **settings)
+    except ValueError, inst:
+        logging.error(inst)
+        usage()
+
+    out_file = sys.stdout if out_name == '-' else open(out_name, 'w')
+    total = write_corpus(out_file, gen, count, format)
+    if out_file is not sys.stdout: out_file.close()
+    logging.info("Wrote %s macros, %s bytes." % (count, total))
@@ -14,6 +14,7 @@ from google.appengine.api             import mail
 
 # Get some Django tools
 from django.core.validators           import email_re
+from django.utils                     import simplejson
 
 # Get macro appengine components
 from macro.render.defs                import *
@@ -22,7 +23,7 @@ from macro.render.util                import get_form_error,translate_classmap,t
 from macro.exceptions                 import NoInputError,OtherError
 from macro.util                       import valid
 from macro.data.appengine.savedmacro  import SavedMacroOps, encode_text, decode_text
-from macro.render.page.interpret      import generate_view_page,generate_edit_page
+from macro.render.page.interpret      import generate_view_page,generate_edit_page,generate_live_response
 from macro.render.page.error          import generate_error_page
 
 
@@ -325,11 +326,35 @@ class MacroSave(webapp.RequestHandler):
                                       save_values=input_vals)
           
 
+# Separate handler for live preview while editing.
+class MacroLive(webapp.RequestHandler):
+    '''
+    Handles live re-interpretation of a macro as it is edited.
+    Returns JSON with only the lines that changed.
+    '''
+    def post(self):
+        '''
+        Form input from the edit page: the macro, and the line keys
+        of what the page is showing.
+        '''
+        self.request.encoding = "UTF-8"
+        self.response.headers['Content-Type'] = 'application/json'
+        macro = self.request.get(FORM_MACRO_INPUT)
+        known_keys = [k for k in self.request.get(FORM_LINE_KEYS, default_value="").split(",") if k]
+        try:
+            if not valid(macro):
+                raise NoInputError("No valid macro input.")
+            self.response.out.write(generate_live_response(macro, known_keys))
+        except OtherError, inst:
+            self.response.out.write(simplejson.dumps({'error': str(inst)}))
+
+
 ''' Register handlers for WSCGI. '''
 application = webapp.WSGIApplication(
     [(URL_MACRO_PROCESS, MacroProcess),
      (URL_MACRO_VIEW,    MacroView),
      (URL_SAVE_PROCESS,  MacroSave),
+     (URL_MACRO_LIVE,    MacroLive),
      ],
     debug=True)
 
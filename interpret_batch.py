@@ -0,0 +1,122 @@
+#!/usr/bin/python
+'''
+Batch interpreter for Fitzcairns Macro Interpreter.
+
+Reads macros from a file (or stdin) and writes one JSON result per
+line.  Input is one of:
+
+  json   -- JSON-lines.  Each line is either a macro string, or an
+            object with a "macro" field and an optional "id" field,
+            which is passed through to the result.
+  text   -- One single-line macro per line.
+  blocks -- Multi-line macros separated by blank lines, as in
+            tests/test_macros.txt.
+
+Each result line is an object with the macro (and id, if given),
+along with either the interpretation in the same format as the JSON
+API, or an error.
+'''
+
+import sys
+import logging
+
+from django.utils                    import simplejson
+
+from macro.data.wow                  import SOURCE_TEST, SOURCE_DATASTORE, SOURCE_LOCAL
+from macro.interpret.interpreter     import MacroInterpreter
+from macro.render.api.response       import translate_parsed_macro
+
+
+# Input formats.
+FORMATS = ('json', 'text', 'blocks')
+
+# Data sources that can be named on the command line.  The datastore
+# needs an API proxy, i.e. run this through the remote API.  The local
+# source reads data/spells.csv (and data/items.csv, if present).
+SOURCES = {'test':      SOURCE_TEST,
+           'local':     SOURCE_LOCAL,
+           'datastore': SOURCE_DATASTORE}
+
+
+# Read macros from an input file, yielding (id, macro) tuples.
+def read_macros(in_file, format='json'):
+    if format == 'blocks':
+        macro = []
+        for line in in_file:
+            if not line.isspace():
+                macro.append(line)
+            elif len(macro) > 0:
+                yield (None, ''.join(macro))
+                macro = []
+        if len(macro) > 0: yield (None, ''.join(macro))
+        return
+
+    for i, line in enumerate(in_file):
+        if len(line) == 0 or line.isspace(): continue
+        if format == 'text':
+            yield (None, line.rstrip('\r\n'))
+            continue
+        try:
+            obj = simplejson.loads(line)
+        except ValueError:
+            logging.warning("Skipping line %s, not valid JSON." % (i + 1))
+            continue
+        if isinstance(obj, dict):
+            yield (obj.get('id'), obj.get('macro', ''))
+        else:
+            yield (None, obj)
+
+
+# Interpret macros read from in_file, writing JSON-lines results to
+# out_file.  Returns (macros, errors) counts.
+def interpret_batch(in_file, out_file, format='json', source=SOURCE_TEST):
+    # The interpreter pulls one macro at a time, so ids line up with
+    # results.
+    ids = []
+    def macros():
+        for macro_id, macro in read_macros(in_file, format):
+            ids.append(macro_id)
+            yield macro
+
+    count  = 0
+    errors = 0
+    mi = MacroInterpreter(data_source=source)
+    for macro, int_macro, error in mi.interpret_macros(macros()):
+        result = {'macro': macro}
+        macro_id = ids.pop(0)
+        if macro_id is not None: result['id'] = macro_id
+        if error is not None:
+            result['error'] = str(error)
+            errors += 1
+        else:
+            result['interpret'] = translate_parsed_macro(int_macro)
+            result['good']      = int_macro.macro_good
+            result['changed']   = int_macro.macro_changed
+            result['len']       = int_macro.macro_len
+        out_file.write(simplejson.dumps(result) + '\n')
+        count += 1
+    out_file.flush()
+    return (count, errors)
+
+
+if __name__ == "__main__":
+    # Set up the logger
+    logging.basicConfig(level=logging.INFO,
+                        format='%(message)s')
+
+    args = sys.argv[1:]
+    if len(args) > 0 and args[0] in ('-h', '--help'):
+        print "Usage: %s [json|text|blocks] [in_file|-] [out_file|-] [test|local|datastore]" % (sys.argv[0],)
+        sys.exit(1)
+    format   = args[0].lower() if len(args) > 0 else 'json'
+    in_name  = args[1] if len(args) > 1 else '-'
+    out_name = args[2] if len(args) > 2 else '-'
+    source   = args[3].lower() if len(args) > 3 else 'test'
+    if format not in FORMATS or source not in SOURCES:
+        print "Usage: %s [json|text|blocks] [in_file|-] [out_file|-] [test|local|datastore]" % (sys.argv[0],)
+        sys.exit(1)
+
+    in_file  = sys.stdin  if in_name  == '-' else open(in_name, 'r')
+    out_file = sys.stdout if out_name == '-' else open(out_name, 'w')
+    count, errors = interpret_batch(in_file, out_file, format, SOURCES[source])
+    logging.info("Interpreted %s macros, %s errors." % (count, errors))
@@ -1 +1 @@
-__all__ = ["appengine", "mmochampion", "test", "wow", "wow_obj_base"]
+__all__ = ["appengine", "local", "mmochampion", "test", "wow", "wow_obj_base"]
@@ -0,0 +1,231 @@
+'''
+Write-behind counters, flushed to the datastore in batches.
+
+Increments are buffered in three places on their way to an entity:
+
+  1. In the process, a dict of deltas by (entity key, counter).  This
+     is pushed to memcache every push_interval seconds, in one
+     offset_multi call.
+  2. In memcache, one delta per entity key and counter, plus lists
+     of the keys pushed during each flush_interval ("buckets").
+  3. In the datastore.  Once per flush_interval, whichever process
+     gets the flush lock takes every pending delta out of memcache
+     and hands them to a flush function in batches of flush_batch
+     entities, each applied in one batched get and one multi-entity
+     put.
+
+A flush therefore costs a datastore write per flush_batch macros
+changed, instead of a transaction per counter per macro, and no
+batch nears the datastore's limits on entities and bytes per call.
+Deltas are taken out of memcache by decrementing what was read, so
+increments that land during a flush wait for the next one.  If the
+flush function fails on a batch, that batch's deltas are put back
+and the error is logged; the other batches are still written.
+
+At most one flush interval of counts is lost: those in a process
+that dies before its next push, those in memcache if it is flushed
+or evicts them, or those taken by a process that dies mid-flush.
+If memcache is down, increments go straight to the flush function.
+
+Reads are the last flushed value (or the entity's own, whichever is
+higher, as counts only go up) plus the deltas still pending.
+
+Flushes also run from cron (see flush.py), so counts don't sit in
+memcache when traffic stops.  Tests use a LocalCache (see
+macro/data/local/cache.py) in place of memcache.
+'''
+
+import time
+import logging
+import threading
+
+from google.appengine.api              import memcache
+from google.appengine.api.capabilities import CapabilitySet
+
+
+# Counter key prefixes
+_COUNT_KEY       = "_bcount_%s_%s"
+_DELTA_KEY       = "_bdelta_%s_%s"
+_DIRTY_KEY       = "_bdirty_%s_%s"
+_DIRTY_COUNT_KEY = "_bdirtyn_%s"
+_FLUSHED_KEY     = "_bflushed"
+_FLUSH_LOCK      = "_bflushlock"
+
+# Defaults for how often, in seconds, a process pushes its deltas to
+# memcache, and how often deltas are flushed to the datastore.
+_DEF_PUSH_INTERVAL  = 5
+_DEF_FLUSH_INTERVAL = 60
+
+# Default most entities handed to the flush function at once.  The
+# datastore takes at most 500 per batch call, and saved macros carry
+# their text, so stay well under.
+_DEF_FLUSH_BATCH = 100
+
+# Buckets of dirty keys looked at by a flush, counting back from the
+# current one, when the last flushed bucket isn't known.
+_LOOKBACK = 3
+
+# How long memcache keeps flushed counts, in seconds.
+_COUNT_TTL = 3600
+
+
+class BatchedCounters(object):
+    ''' Counters for a kind of entity.  flush_def takes a dict of
+    {entity key: {counter name: delta}}, applies it, and returns
+    {entity key: {counter name: new value}}. '''
+
+    def __init__(self, flush_def, cache=memcache,
+                 push_interval=_DEF_PUSH_INTERVAL,
+                 flush_interval=_DEF_FLUSH_INTERVAL,
+                 flush_batch=_DEF_FLUSH_BATCH,
+                 clock=time.time):
+        self.flush_def      = flush_def
+        self.cache          = cache
+        self.push_interval  = push_interval
+        self.flush_interval = flush_interval
+        self.flush_batch    = flush_batch
+        self.clock          = clock
+        self.__pending      = {}
+        self.__lock         = threading.Lock()
+        self.__last_push    = clock()
+
+    # Helper to get the dirty bucket for a time.
+    def __bucket(self, now):
+        return int(now / self.flush_interval)
+
+    # Check to see if memcache is up.  The local stand-in always is.
+    def __cache_up(self):
+        if self.cache is not memcache: return True
+        memcache_ops = CapabilitySet('memcache', methods=['offset_multi'])
+        return memcache_ops.will_remain_enabled_for(10 + self.push_interval)
+
+    def incr(self, entity_key, counter_name, incr_amt=1, entity_val=0):
+        ''' Increment a counter.  Returns the count, including
+        increments not yet flushed.  Decrements are ignored. '''
+        if incr_amt > 0:
+            if not self.__cache_up():
+                # Write through.
+                values = self.flush_def({entity_key: {counter_name: incr_amt}})
+                return values.get(entity_key, {}).get(counter_name, entity_val)
+            self.__lock.acquire()
+            try:
+                key = (entity_key, counter_name)
+                self.__pending[key] = self.__pending.get(key, 0) + incr_amt
+            finally:
+                self.__lock.release()
+            if self.clock() - self.__last_push >= self.push_interval:
+                self.push()
+                self.flush()
+        return self.get(entity_key, counter_name, entity_val)
+
+    def get(self, entity_key, counter_name, entity_val=0):
+        ''' Get the value of a counter, given the value saved on the
+        entity. '''
+        count_key = _COUNT_KEY % (counter_name, entity_key)
+        delta_key = _DELTA_KEY % (counter_name, entity_key)
+        values    = self.cache.get_multi([count_key, delta_key])
+        return max(int(values.get(count_key) or 0), entity_val) + \
+               int(values.get(delta_key) or 0) + \
+               self.__pending.get((entity_key, counter_name), 0)
+
+    def push(self):
+        ''' Push this process's deltas to memcache. '''
+        self.__lock.acquire()
+        try:
+            pending, self.__pending = self.__pending, {}
+            self.__last_push = self.clock()
+        finally:
+            self.__lock.release()
+        if not pending: return
+
+        # Add the deltas, then list their keys in this bucket.
+        deltas = dict([(_DELTA_KEY % (name, key), delta)
+                       for (key, name), delta in pending.items()])
+        failed = [k for k, v in self.cache.offset_multi(deltas, initial_value=0).items()
+                  if v is None]
+        if failed:
+            # Keep them for the next push.
+            logging.error('BatchedCounters: unable to push %s deltas.', len(failed))
+            self.__lock.acquire()
+            try:
+                for (key, name), delta in pending.items():
+                    if _DELTA_KEY % (name, key) not in failed: continue
+                    self.__pending[(key, name)] = self.__pending.get((key, name), 0) + delta
+            finally:
+                self.__lock.release()
+        bucket = self.__bucket(self.__last_push)
+        ttl    = self.flush_interval * (_LOOKBACK + 2)
+        self.cache.add(_DIRTY_COUNT_KEY % bucket, 0, time=ttl)
+        num    = self.cache.incr(_DIRTY_COUNT_KEY % bucket)
+        if num is None:
+            logging.error('BatchedCounters: unable to list %s pushed keys.', len(pending))
+            return
+        self.cache.set(_DIRTY_KEY % (bucket, num), pending.keys(), time=ttl)
+
+    # Helper to get the (entity key, counter name) pairs pushed in a
+    # bucket.
+    def __get_dirty(self, bucket):
+        num = int(self.cache.get(_DIRTY_COUNT_KEY % bucket) or 0)
+        if num == 0: return []
+        lists = self.cache.get_multi([_DIRTY_KEY % (bucket, i) for i in xrange(1, num + 1)])
+        return [k for keys in lists.values() for k in keys]
+
+    def flush(self):
+        ''' Flush pending deltas to the datastore, if no process has
+        in the last flush interval.  Returns the number of entities
+        written. '''
+        if not self.cache.add(_FLUSH_LOCK, 1, time=self.flush_interval):
+            return 0
+
+        # Collect the keys pushed since the last flush.  The current
+        # bucket is still filling, so it is looked at again next
+        # time.
+        current = self.__bucket(self.clock())
+        flushed = self.cache.get(_FLUSHED_KEY)
+        if flushed is None: flushed = current - _LOOKBACK - 1
+        dirty = set()
+        for bucket in xrange(max(flushed + 1, current - _LOOKBACK), current + 1):
+            dirty.update(self.__get_dirty(bucket))
+
+        # Take the deltas out of memcache.
+        keys   = dict([(_DELTA_KEY % (name, key), (key, name)) for key, name in dirty])
+        values = self.cache.get_multi(keys.keys())
+        taken  = dict([(k, int(v)) for k, v in values.items() if int(v) > 0])
+        if taken:
+            self.cache.offset_multi(dict([(k, -v) for k, v in taken.items()]))
+        self.cache.set(_FLUSHED_KEY, current - 1)
+        if not taken: return 0
+
+        deltas = {}
+        for k, v in taken.items():
+            key, name = keys[k]
+            deltas.setdefault(key, {})[name] = v
+        entity_keys = deltas.keys()
+        written     = 0
+        for i in xrange(0, len(entity_keys), self.flush_batch):
+            written += self.__flush_batch(dict([(key, deltas[key]) for key in
+                                                entity_keys[i:i + self.flush_batch]]),
+                                          flushed)
+        return written
+
+    # Helper to flush one batch of deltas.  On failure, puts the
+    # batch's deltas back, and has the next flush look at the same
+    # buckets again to find them.
+    def __flush_batch(self, deltas, flushed):
+        try:
+            values = self.flush_def(deltas)
+        except Exception, inst:
+            self.cache.offset_multi(dict([(_DELTA_KEY % (name, key), v)
+                                          for key, counts in deltas.items()
+                                          for name, v in counts.items()]),
+                                    initial_value=0)
+            self.cache.set(_FLUSHED_KEY, flushed)
+            logging.error('BatchedCounters: unable to flush %s entities: %s', len(deltas), inst)
+            return 0
+
+        # Save what was written, for reads.
+        self.cache.set_multi(dict([(_COUNT_KEY % (name, key), v)
+                                   for key, counts in values.items()
+                                   for name, v in counts.items()]),
+                             time=_COUNT_TTL)
+        return len(values)
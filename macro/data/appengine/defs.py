@@ -8,9 +8,14 @@ _ver = os.environ["CURRENT_VERSION_ID"]
 
 ''' Datastore key defs. '''
 # Use the
-DATA_KEY       = _ver + "%s"
-MACRO_PROC_KEY = "_p" + _ver + "%s" # % macro_id
-MACRO_VIEW_KEY = "view_%s" # % macro_id
+DATA_KEY         = _ver + "%s"
+MACRO_PROC_KEY   = "_p" + _ver + "%s"   # % content key
+MACRO_RENDER_KEY = "_r" + _ver + "%s%s" # % (content key, render type)
+MACRO_VIEW_KEY   = "view_%s" # % macro_id
+
+# Version of the spell and item data.  Part of the content key for
+# interpreted macros, so bump this when the data is reloaded.
+DATA_VERSION = "1"
 
 ''' Memcached Times '''
 
@@ -2,6 +2,12 @@
 An inverted tag -> macroid index.
 
 We shard the entries for each tag to reduce locking issues.
+
+Typeahead is answered from the tag dictionary of the in-process tag
+index (see macro/data/local/tagdict.py) when there is one, without an
+RPC.  The index picks up tags saved by other processes when it is
+refreshed, about once a minute; until then, and when there is no
+index, the tag entities, keyed by tag, are scanned by key range.
 '''
 
 import logging
@@ -10,6 +16,8 @@ import random
 from google.appengine.api               import memcache
 from google.appengine.ext               import db
 
+from macro.data.local.tagindex          import get_tag_index
+
 
 # How many prefixes to fetch at one go.
 _NUM_PREFIX_TO_FETCH = 10
@@ -21,22 +29,25 @@ _DELIM = ","
 # traffic will be high, so only keep for 1 minute.
 _MEMCACHED_TAG = 60
 
+# Sorts after any character in a tag key.
+_MAX_CHAR = u'\ufffd'
+
 # Datastore class for the tag
 class MacroTag(db.Model):
-    ''' Entity class storing tags for Macros.  '''
-    # The tag broken down into prefixes for typeahead.
-    prefix_list = db.ListProperty(str)
+    ''' Entity class storing tags for Macros.  The tag is the key
+    name; there are no other properties.  '''
+    pass
 
 
 def save_macro_tags(tags):
     ''' Create tag entities for each tag in the list,
     storing the macro_id as part of the key. '''
 
-    def txn(tag, prefix_list):
+    def txn(tag):
         # Create the tag only if it doesn't exist already.
         saved_tag = MacroTag.get_by_key_name(tag)
         if not saved_tag:
-            saved_tag = MacroTag(key_name = tag, prefix_list = prefix_list)
+            saved_tag = MacroTag(key_name = tag)
             saved_tag.put()
         return saved_tag
     
@@ -46,9 +57,8 @@ def save_macro_tags(tags):
     # name are saved at once.  In this case, need to ignore 
     # failures -- add blanked try/catch and pass on exceptions
     for t in tags:
-        prefix_list = [t[0:i] for i in xrange(1, len(t))] + [t]
         try:
-            db.run_in_transaction(txn, t, prefix_list)
+            db.run_in_transaction(txn, t)
         except:
             pass
 
@@ -56,16 +66,29 @@ def get_macro_tags_for(tag_prefix):
     ''' Given a prefix to search for, return the list of
     tags starting with this prefix. '''
 
-    if tag_prefix:
-        tag_prefix = tag_prefix.lower()
+    if not tag_prefix:
+        return []
+    tag_prefix = tag_prefix.lower()
+
+    # Complete from the tag index, if this process has one.  Lazily
+    # import, as savedmacro imports this module.
+    tag_index = get_tag_index()
+    if tag_index is not None:
+        from macro.data.appengine.savedmacro import refresh_tag_index
+        refresh_tag_index(tag_index)
+        ret_list = tag_index.get_dictionary().complete(tag_prefix,
+                                                       _NUM_PREFIX_TO_FETCH)
+        if ret_list: return ret_list
 
     # Check memcached first.
     ret_list = memcache.get(tag_prefix)
     if not ret_list:
-        # Fetch and save in memcached
-        q = MacroTag.all(keys_only=True).filter("prefix_list =", tag_prefix)
+        # Fetch the tags keyed from the prefix on, and save in
+        # memcached.
+        q = MacroTag.all(keys_only=True)
+        q.filter("__key__ >=", db.Key.from_path('MacroTag', tag_prefix))
+        q.filter("__key__ <",  db.Key.from_path('MacroTag', tag_prefix + _MAX_CHAR))
         ret_list = [r.name() for r in q.fetch(_NUM_PREFIX_TO_FETCH)]
-        ret_list.sort()
         memcache.add(tag_prefix, ret_list,
                      _MEMCACHED_TAG)
     return ret_list
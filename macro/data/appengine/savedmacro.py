@@ -5,14 +5,20 @@ Datastore methods for saving a macro.
 import re
 import logging
 import urllib
+import base64
 import os
+import time
+import threading
 from google.appengine.api               import memcache
 from google.appengine.ext               import db
+from django.utils                       import simplejson
 
 from macro.util                         import encode
 from macro.exceptions                   import InvalidSearchError
-from macro.data.appengine.gated_counter import init_count, get_count, incr_count
+from macro.data.appengine.batched_counter import BatchedCounters
 from macro.data.appengine.macrotag      import save_macro_tags
+from macro.data.local.tagindex          import get_tag_index, parse_tag_query, INDEX_SORTS
+from macro.data.local.termindex         import add_macro_terms
 
 
 # Memcached prefix
@@ -33,6 +39,29 @@ _MEMCACHED_SAVED_MACRO = 43200
 # Search Memcache times
 _MEMCACHED_SEARCH = 60
 _MEMCACHED_CURSOR = 300  # Much lighter, save longer
+_MEMCACHED_CHAIN  = 7200 # Rebuilt by precompute_search.py, hourly
+
+# Sorts for search.  Each needs its index in index.yaml.
+SEARCH_SORTS = ('-views',  'views',
+                '-rating', 'rating',
+                '-title',  'title',
+                '-version', 'version')
+
+# Types of the sort values, for checking page positions.
+_SORT_TYPES = {'views':   (int, long),
+               'rating':  (int, long),
+               'title':   basestring,
+               'version': basestring}
+
+# Pages the chain for a tag search covers, and how many pages of
+# results are fetched at a time to build it.
+_MAX_CHAIN_PAGES   = 200
+_CHAIN_BATCH_PAGES = 20
+
+# Without a chain, how many pages past the last known one a search
+# will walk to find a page.  This keeps deep pagination from DOSing
+# the site.
+_MAX_WALK_PAGES = 10
 
 # Number of search results to give back
 _NUM_RESULTS=10
@@ -40,6 +69,17 @@ _NUM_RESULTS=10
 # Max length of string fields to return for search results
 _MAX_RESULT_ENTRY_LEN = 64
 
+# How often, in seconds, a process brings its tag index up to date
+# with macros saved and counts flushed elsewhere, and the most macros
+# it reads from the datastore each time.
+_TAG_REFRESH_INTERVAL = 60
+_TAG_REFRESH_BATCH    = 200
+
+# Flushed counts are published for tag index refreshes in buckets of
+# this many seconds, kept for _MEMCACHED_COUNT_FEED.
+_COUNT_FEED_BUCKET    = 60
+_MEMCACHED_COUNT_FEED = 600
+
 # Failsafe max query length
 _MAX_QUERY_LENGTH = 32
 
@@ -178,8 +218,11 @@ class SavedMacroOps(object):
         #logging.debug(tags)
         save_macro_tags(tags)
 
-        # Init the memcache counters.
-        init_count(saved_macro.link_id, "views")
+        # Add it to the tag and term indexes, if this process has
+        # them.
+        tag_index = get_tag_index()
+        if tag_index is not None: tag_index.add_macro(new_index, tags)
+        add_macro_terms(new_index, macro)
 
         return saved_macro.link_id
 
@@ -243,10 +286,10 @@ class SavedMacroOps(object):
         returning the rating in float form.  If specified,
         this function can round to the nearest half star.'''
         if rating is None or num_rates is None:
-            num_rates = get_count(self.entity.link_id, 'num_rates',
-                                  entity_val=self.entity.num_rates)
-            rating    = get_count(self.entity.link_id, 'rating',
-                                  entity_val=self.entity.rating)
+            num_rates = _COUNTERS.get(self.entity.link_id, 'num_rates',
+                                      entity_val=self.entity.num_rates)
+            rating    = _COUNTERS.get(self.entity.link_id, 'rating',
+                                      entity_val=self.entity.rating)
         return self.get_rating_score(rating, num_rates, do_round)
 
             
@@ -260,10 +303,10 @@ class SavedMacroOps(object):
             return self.get_rating()
         # Need to update two counters: num_rates and rating.
         else:
-            num_rates = incr_count(self.entity.link_id, 'num_rates',
-                                   update_count, entity_val=self.entity.num_rates)
-            rating    = incr_count(self.entity.link_id, 'rating',
-                                   update_count, incr_amt=rating, entity_val=self.entity.rating)
+            num_rates = _COUNTERS.incr(self.entity.link_id, 'num_rates',
+                                       entity_val=self.entity.num_rates)
+            rating    = _COUNTERS.incr(self.entity.link_id, 'rating',
+                                       incr_amt=rating, entity_val=self.entity.rating)
             return self.get_rating(rating, num_rates)
 
 
@@ -278,8 +321,8 @@ class SavedMacroOps(object):
             init_val = self.entity.sends
         except:
             init_val = 0
-        ret = incr_count(self.entity.link_id, 'sends',
-                         update_count, entity_val=init_val)
+        ret = _COUNTERS.incr(self.entity.link_id, 'sends',
+                             entity_val=init_val)
         return ret
 
 
@@ -293,130 +336,374 @@ class SavedMacroOps(object):
             init_val = self.entity.views
         except:
             init_val = 0
-        ret = incr_count(self.entity.link_id, 'views',
-                         update_count, entity_val=init_val)
+        ret = _COUNTERS.incr(self.entity.link_id, 'views',
+                             entity_val=init_val)
         return ret
 
 
-    # Saerch for a tag
+    # Search for a tag
     @classmethod
-    def search(self, tag, page=1, sort="-views", num=_NUM_RESULTS):
+    def search(self, tag, page=1, sort="-views", num=_NUM_RESULTS, after=None):
         ''' Search macros for a given tag, return num results.
-        Returns ([results], is_next_page), where is_next_page is
-        True if there are more than this page of results, F otherwise.
+        Returns ([results], next_after), where next_after is the
+        position token for the next page, or None if this is the last
+        page.
+
+        Pages are found by keyset: a page starts after the (sort
+        value, key name) of the last macro on the page before it.
+        after is that position as a token, from the next_after of the
+        page before; without it, the position for the page number is
+        looked up in the chain for this tag and sort, as precomputed
+        by build_search_chain or saved as pages are visited.  Either
+        way, a page is one bounded fetch.
 
         Each result in [results] is an object in dict form for use in
         template output.
 
         Class method, can be called without object.
         '''
-        memcached_ret_key = _MCD_PREFIX  + "%s%s%s%s_results"
-        memcached_cur_key = _MCD_PREFIX  + "%s%s%s%s_next"
-        memcached_max_key = _MCD_PREFIX  + "%s_max_results" % tag
-        is_next_page      = False
-        ret_list          = []
+        ret_list   = []
+        next_after = None
 
         #logging.info("Sorting by: " + sort)
 
         # Ensure that our input is of the correct size; else, we're
         # done.
         if len(tag) > _MAX_QUERY_LENGTH:
-            return (ret_list, is_next_page)
+            return (ret_list, next_after)
+        if sort not in SEARCH_SORTS:
+            raise InvalidSearchError("Can't sort by %s." % sort)
+
+        # Find where the page starts.
+        if after:
+            position = decode_position(after, sort)
+        else:
+            position = get_page_position(tag, page, sort, num)
+            if position is _NO_PAGE:
+                return (ret_list, next_after)
+            after = encode_position(position)
 
         # Check memcached for results first, fetch after
-        mcd_val = memcache.get(memcached_ret_key % (tag, page, num, sort))
+        memcached_ret_key = _MCD_PREFIX + "%s%s%s%s_results" % (tag, num, sort, after or '')
+        mcd_val = memcache.get(memcached_ret_key)
         if mcd_val:
-            (ret_list, is_next_page) = mcd_val
-            return (ret_list, is_next_page)
-
-        # Missed in memcached.   Do search
-        q = SavedMacro.all()
-        q.filter("tags =", tag)
-        q.order(sort)
- 
-        # Do we have a cursor saved from a previous search?
-        page_cursor = memcache.get(memcached_cur_key  % (tag, page, num, sort))
-        if page_cursor:
-            q.with_cursor(page_cursor)
-            ret_list = q.fetch(num)
-        # Otherwise, are we getting a page other than 1?
-        elif page > 1:
-            # Is this page out of bounds?  This is in place
-            # to prevent DDOS by deep pagination.
-            max_items = memcache.get(memcached_max_key)
-            #logging.warning("Max items: %s" % max_items)
-            if not max_items or max_items >= (num * (page - 1)):
-                # Need to unfortunately fetch a large set of
-                # results and get the last page worth.
-                # This case should be infrequent.
-                orig_list = q.fetch(num * page)
-                ret_list = orig_list[(num * (page - 1)):]
-                #logging.warning("Saving max: %s" % len(orig_list))
-
-                # Save the max number of results for this query so that
-                # repeated out-of-bounds pagination requesets don't DOS
-                # the site.
-                memcache.add(memcached_max_key, len(orig_list),
-                             _MEMCACHED_CURSOR)
-            #else:
-            #    logging.warning("Max key query averted")
-            
-        # First page
-        else:
-            ret_list = q.fetch(num)
+            return mcd_val
+
+        # Missed in memcached.  Do search, with one more to see if
+        # there is a next page.
+        ret_list = fetch_after(tag, sort, position, num + 1)
+        if len(ret_list) > num:
+            ret_list = ret_list[:num]
+            next_position = get_position(ret_list[-1], sort)
+            next_after    = encode_position(next_position)
+
+            # Save where the next page starts, for paging by number.
+            memcache.add(page_position_key(tag, page + 1, sort, num),
+                         next_position, _MEMCACHED_CURSOR)
 
-        # If the number of results == num, save a cursor and do
-        # pagination.
-        if len(ret_list) == num:
-            new_cursor = q.cursor()
-        
-            # Do a peekahead to see if there are more results.
-            # Unfortunately, can't do this all with one fetch because
-            # of the need to save page cursors.
-            q.with_cursor(new_cursor)
-            if q.fetch(1):
-                is_next_page = True
-                memcache.add(memcached_cur_key  % (tag, (page+1), num, sort),
-                             new_cursor, _MEMCACHED_CURSOR)
-                            
         # Put results into dict form.
-        ret_list = [{'macro':   trunc(o.macro),        \
-                     'title':   o.title or '-', \
-                     'id':      o.link_id, \
-                     'server':  o.server,              \
-                     'tags':    trunc(", ".join(o.tags)), \
-                     'rating':  SavedMacroOps.get_rating_score(o.rating, o.num_rates),   \
-                     'stars':   SavedMacroOps.get_rating_dict(SavedMacroOps.get_rating_score(o.rating, o.num_rates)),   \
-                     'classes': [c.replace(" ", "_") for c in o.classes], \
-                     'name':    o.name or '-', \
-                     'version': o.version,             \
-                     'views':   o.views} for o in ret_list]
+        ret_list = [get_search_result(o) for o in ret_list]
+
+        # Save results
+        memcache.add(memcached_ret_key, (ret_list, next_after),
+                     _MEMCACHED_SEARCH)
+        return (ret_list, next_after)
+
+
+    # Search for several tags at once.
+    @classmethod
+    def search_tags(self, query, page=1, sort="-views", num=_NUM_RESULTS):
+        ''' Search macros for a query of several tags, i.e.
+        "druid + pvp|arenas", from the in-process tag index (see
+        macro/data/local/tagindex.py).  Returns ([results],
+        is_next_page) as search does, or None if the index can't
+        answer: there is no index loaded, the sort isn't by views or
+        rating, or the query is a single tag.  Single tags are left
+        to search, whose datastore results are always current; the
+        index lags other processes by up to a refresh interval.
+
+        Class method, can be called without object.
+        '''
+        tag_index = get_tag_index()
+        if tag_index is None or sort not in INDEX_SORTS: return None
+        if page < 1: page = 1
+        groups = parse_tag_query(query)
+        if not groups: return ([], False)
+        if len(groups) == 1 and len(groups[0]) == 1: return None
+        refresh_tag_index(tag_index)
+
+        # Check memcached for results first, fetch after
+        memcached_ret_key = _MCD_PREFIX + "%s%s%s%s_tag_results" % \
+                            ("+".join(["|".join(g) for g in groups]), page, num, sort)
+        mcd_val = memcache.get(memcached_ret_key)
+        if mcd_val:
+            return mcd_val
+
+        # The page is found in memory, then fetched by key.
+        (indexes, is_next_page) = tag_index.search(groups, sort, page, num)
+        ret_list = SavedMacro.get_by_key_name([_MACRO_KEY % encode(i) for i in indexes])
+        ret_list = [get_search_result(o) for o in ret_list if o is not None]
 
         # Save results
-        memcache.add(memcached_ret_key  % (tag, page, num, sort),
-                     (ret_list, is_next_page), _MEMCACHED_SEARCH)        
+        memcache.add(memcached_ret_key, (ret_list, is_next_page),
+                     _MEMCACHED_SEARCH)
         return (ret_list, is_next_page)
 
 
-# Helper function to update counter fields.
-def update_count(key, incr, field):
-    entity = SavedMacro.get_by_key_name(key)
-    if not entity: raise Exception("Failed fetch for %s" % key)
-    val = 0
-    if field == 'views':
-        entity.views += incr
-        val = entity.views
-    elif field == 'sends':
-        entity.sends += incr
-        val = entity.sends
-    elif field == 'rating':
-        entity.rating += incr
-        val = entity.rating
-    elif field == 'num_rates':
-        entity.num_rates += incr
-        val = entity.num_rates
-    entity.put()
-    return val
+    # Precompute the page chain for a tag search.
+    @classmethod
+    def build_search_chain(self, tag, sort="-views", num=_NUM_RESULTS, max_pages=_MAX_CHAIN_PAGES):
+        ''' Walk the results for a tag in sort order, and cache the
+        position every page starts at, so that any page of the search
+        is one fetch.  Walks at most max_pages pages.  Returns the
+        number of pages.
+
+        Class method, can be called without object.
+        '''
+        if sort not in SEARCH_SORTS:
+            raise InvalidSearchError("Can't sort by %s." % sort)
+        chain    = []
+        position = None
+        complete = False
+        while len(chain) < max_pages:
+            # Fetch a batch of pages at a time, and keep the position
+            # of each page's last macro.
+            batch = fetch_after(tag, sort, position, num * _CHAIN_BATCH_PAGES + 1)
+            chain.extend(get_chain_positions(batch, sort, num))
+            if len(batch) <= num * _CHAIN_BATCH_PAGES:
+                # A full last page has no page after it.
+                if batch and len(batch) % num == 0: chain.pop()
+                complete = True
+                break
+            position = get_position(batch[num * _CHAIN_BATCH_PAGES - 1], sort)
+
+        # Past max_pages, pages are found as they are visited.
+        if len(chain) >= max_pages:
+            del chain[max_pages - 1:]
+            complete = False
+        memcache.set(chain_key(tag, sort, num), (chain, complete),
+                     _MEMCACHED_CHAIN)
+        return len(chain) + 1
+
+
+# Counter fields on SavedMacro.
+_COUNTER_FIELDS = ('views', 'sends', 'rating', 'num_rates')
+
+# Helper function to flush batched counter deltas, as
+# {macro_id: {field: delta}}, in one get and one put.  Returns
+# {macro_id: {field: value}}.
+def update_counts(deltas):
+    macro_ids = deltas.keys()
+    entities  = SavedMacro.get_by_key_name(macro_ids)
+    ret       = {}
+    to_put    = []
+    for macro_id, entity in zip(macro_ids, entities):
+        if not entity:
+            logging.error("Counters: failed fetch for %s" % macro_id)
+            continue
+        ret[macro_id] = {}
+        for field, incr in deltas[macro_id].items():
+            if field not in _COUNTER_FIELDS: continue
+            # Older entities can be missing fields.
+            val = (getattr(entity, field, 0) or 0) + incr
+            setattr(entity, field, val)
+            ret[macro_id][field] = val
+        to_put.append(entity)
+    if to_put:
+        db.put(to_put)
+        # Keep the cached entities current, so reads don't fall back
+        # on stale counts.
+        memcache.set_multi(dict([(cache_key(e.link_id), e) for e in to_put]),
+                           _MEMCACHED_SAVED_MACRO)
+        publish_counts(to_put)
+    return ret
+
+
+# Keys for the feed of flushed counts, by bucket.
+def count_feed_key(bucket):
+    return _MCD_PREFIX + "_count_feed_%s" % bucket
+
+
+# Helper to publish the counts of flushed macros, for every process's
+# tag index to pick up.
+def publish_counts(entities):
+    key  = count_feed_key(int(time.time() / _COUNT_FEED_BUCKET))
+    feed = memcache.get(key) or {}
+    for e in entities: feed[e.index] = (e.views or 0, e.rating or 0)
+    memcache.set(key, feed, _MEMCACHED_COUNT_FEED)
+
+
+# When this process last refreshed its tag index, and the last count
+# feed bucket it read.
+_TAG_REFRESH      = {'time': 0, 'bucket': None}
+_TAG_REFRESH_LOCK = threading.Lock()
+
+def refresh_tag_index(tag_index, force=False):
+    ''' Bring a tag index up to date with macros saved and counts
+    flushed by other processes, if it hasn't been in the last
+    _TAG_REFRESH_INTERVAL seconds.  New macros are read from the
+    datastore past the highest index in the tag index; counts come
+    from the feed publish_counts writes.  Returns the number of
+    macros added. '''
+    now = time.time()
+    if not force and now - _TAG_REFRESH['time'] < _TAG_REFRESH_INTERVAL: return 0
+    # Only one thread refreshes at a time; the others go on with the
+    # index as it is.
+    if not _TAG_REFRESH_LOCK.acquire(False): return 0
+    added = 0
+    try:
+        _TAG_REFRESH['time'] = now
+        try:
+            q = SavedMacro.all()
+            q.filter("index >", tag_index.last_index())
+            q.order("index")
+            for m in q.fetch(_TAG_REFRESH_BATCH):
+                tag_index.add_macro(m.index, m.tags, m.views or 0, m.rating or 0)
+                added += 1
+        except Exception, inst:
+            logging.error("Couldn't refresh the tag index: %s" % inst)
+
+        # Counts flushed since the last refresh.
+        current = int(now / _COUNT_FEED_BUCKET)
+        first   = _TAG_REFRESH['bucket']
+        if first is None: first = current - _MEMCACHED_COUNT_FEED / _COUNT_FEED_BUCKET
+        buckets = range(first, current + 1)
+        feeds   = memcache.get_multi([count_feed_key(b) for b in buckets])
+        for b in buckets:
+            for index, (views, rating) in (feeds.get(count_feed_key(b)) or {}).items():
+                tag_index.set_counts(index, views, rating)
+        # The current bucket can still grow, so it is read again.
+        _TAG_REFRESH['bucket'] = current
+    finally:
+        _TAG_REFRESH_LOCK.release()
+    return added
+
+
+# Write-behind counters for SavedMacro.
+_COUNTERS = BatchedCounters(update_counts)
+
+
+def flush_counters():
+    ''' Flush buffered view, send and rating counts to the
+    datastore.  Returns the number of macros written. '''
+    _COUNTERS.push()
+    return _COUNTERS.flush()
+
+
+# Marks a page that isn't there, or is too deep to find.
+_NO_PAGE = object()
+
+
+# Keys for page positions in memcached.
+def page_position_key(tag, page, sort, num):
+    return _MCD_PREFIX + "%s%s%s%s_next" % (tag, page, num, sort)
+
+def chain_key(tag, sort, num):
+    return _MCD_PREFIX + "%s%s%s_chain" % (tag, num, sort)
+
+
+# Helpers for page positions.  A position is the (sort value, key
+# name) of the last macro before a page.
+def get_position(entity, sort):
+    return (getattr(entity, sort.lstrip('-')), entity.key().name())
+
+def get_chain_positions(entities, sort, num):
+    ''' Positions of the pages after each full page of entities. '''
+    return [get_position(entities[i], sort) for i in range(num - 1, len(entities), num)]
+
+def encode_position(position):
+    ''' Encode a position as a url-safe token.  None stays None. '''
+    if position is None: return None
+    return base64.urlsafe_b64encode(simplejson.dumps(list(position)))
+
+def decode_position(token, sort):
+    ''' Decode a position token for a search in the given sort
+    order.  Raises InvalidSearchError if it isn't one. '''
+    try:
+        value, key_name = simplejson.loads(base64.urlsafe_b64decode(str(token)))
+    except Exception:
+        raise InvalidSearchError("Bad search page.")
+    if not isinstance(key_name, basestring) or \
+           (value is not None and not isinstance(value, _SORT_TYPES[sort.lstrip('-')])):
+        raise InvalidSearchError("Bad search page.")
+    return (value, key_name)
+
+
+# Fetch a page's worth of macros.
+def fetch_after(tag, sort, position, limit):
+    ''' Fetch up to limit macros with a tag, in sort order, after a
+    position, or from the start if it is None.  Macros with the same
+    sort value are in key order, as they are in the index. '''
+    q = SavedMacro.all()
+    q.filter("tags =", tag)
+    q.order(sort)
+    if position is None: return q.fetch(limit)
+
+    # First the rest of the macros with the same sort value, then
+    # the ones after it.
+    value, key_name = position
+    prop = sort.lstrip('-')
+    ties = SavedMacro.all()
+    ties.filter("tags =", tag)
+    ties.filter("%s =" % prop, value)
+    ties.filter("__key__ >", db.Key.from_path(SavedMacro.kind(), key_name))
+    ties.order("__key__")
+    ret_list = ties.fetch(limit)
+    if len(ret_list) < limit:
+        if sort.startswith('-'): q.filter("%s <" % prop, value)
+        else:                    q.filter("%s >" % prop, value)
+        ret_list += q.fetch(limit - len(ret_list))
+    return ret_list
+
+
+# Find where a page of a search starts.
+def get_page_position(tag, page, sort, num):
+    ''' Get the position a page starts after, from the chain for the
+    search or as saved when the page before was visited.  Failing
+    that, walk to it from the nearest page before it that is known.
+    Returns None for the first page, or _NO_PAGE if there is no such
+    page or it is too deep to find. '''
+    if page <= 1: return None
+    chain = memcache.get(chain_key(tag, sort, num))
+    if chain:
+        positions, complete = chain
+        if page - 2 < len(positions): return positions[page - 2]
+        if complete: return _NO_PAGE
+    position = memcache.get(page_position_key(tag, page, sort, num))
+    if position is not None: return position
+
+    # Start from the nearest known page, or the first.
+    start, position = 1, None
+    keys  = dict([(page_position_key(tag, p, sort, num), p) \
+                  for p in range(max(2, page - _MAX_WALK_PAGES), page)])
+    known = memcache.get_multi(keys.keys())
+    for key, p in keys.items():
+        if key in known and p > start: start, position = p, known[key]
+    if page - start > _MAX_WALK_PAGES: return _NO_PAGE
+
+    # One fetch for the pages between, saving where each starts.
+    positions = get_chain_positions(fetch_after(tag, sort, position, (page - start) * num),
+                                    sort, num)
+    if len(positions) < page - start: return _NO_PAGE
+    memcache.add_multi(dict([(page_position_key(tag, start + i + 1, sort, num), p) \
+                             for i, p in enumerate(positions)]),
+                       _MEMCACHED_CURSOR)
+    return positions[-1]
+
+
+# Put a macro into dict form, for a search results template.
+def get_search_result(o):
+    return {'macro':   trunc(o.macro),        \
+            'title':   o.title or '-', \
+            'id':      o.link_id, \
+            'server':  o.server,              \
+            'tags':    trunc(", ".join(o.tags)), \
+            'rating':  SavedMacroOps.get_rating_score(o.rating, o.num_rates),   \
+            'stars':   SavedMacroOps.get_rating_dict(SavedMacroOps.get_rating_score(o.rating, o.num_rates)),   \
+            'classes': [c.replace(" ", "_") for c in o.classes], \
+            'name':    o.name or '-', \
+            'version': o.version,             \
+            'views':   o.views}
 
 
 # Simple string truncation helper.
@@ -120,6 +120,24 @@ class DatastoreSpell(WowObject):
         return True
     
 
+# Batch fetch helper for upstream callers.  Returns a list of objects
+# (or None on miss) in the same order as obj_ids, with a single
+# datastore get.
+def get_datastore_objects(obj_ids, is_item):
+    if len(obj_ids) == 0: return []
+    if is_item:
+        model, key_func, wrapper = WOWItem2, get_item_key, DatastoreItem
+    else:
+        model, key_func, wrapper = WOWSpell2, get_spell_key, DatastoreSpell
+    keys = [db.Key.from_path(model.kind(), key_func(o)) for o in obj_ids if len(o) > 0]
+    objs = iter(db.get(keys))
+    ret  = []
+    for obj_id in obj_ids:
+        obj = objs.next() if len(obj_id) > 0 else None
+        ret.append(wrapper(obj) if obj else None)
+    return ret
+
+
 # Easy fetch helper for upstream callers.
 def get_datastore_object(obj_id, is_item):
     obj = None
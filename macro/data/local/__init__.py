@@ -0,0 +1 @@
+__all__ = ["wow", "wowdb", "tagindex", "tagdict", "termindex", "cache"]
@@ -0,0 +1,99 @@
+'''
+In-process stand-in for the parts of the memcache API used by the
+batched counters (see macro/data/appengine/batched_counter.py), for
+tests and offline tools.  Expiry follows a clock that can be
+replaced, so tests can step time.
+'''
+
+import time
+import threading
+
+
+class LocalCache(object):
+    ''' A dict with memcache semantics: add only adds, incr only
+    increments existing integers (or initial_value), and values
+    expire.  Counters don't go below 0, as in memcache. '''
+
+    def __init__(self, clock=time.time):
+        self.clock  = clock
+        self.__data = {}
+        self.__lock = threading.Lock()
+
+    # Helper to get a live (value, expires) entry, dropping it if it
+    # has expired.
+    def __entry(self, key):
+        entry = self.__data.get(key)
+        if entry is not None and entry[1] and entry[1] <= self.clock():
+            del self.__data[key]
+            return None
+        return entry
+
+    # Helper to get the expiry time for a ttl in seconds.
+    def __expires(self, time):
+        if time: return self.clock() + time
+        return 0
+
+    def get(self, key):
+        self.__lock.acquire()
+        try:
+            entry = self.__entry(key)
+            if entry is None: return None
+            return entry[0]
+        finally:
+            self.__lock.release()
+
+    def get_multi(self, keys):
+        ret = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None: ret[key] = value
+        return ret
+
+    def set(self, key, value, time=0):
+        self.__lock.acquire()
+        try:
+            self.__data[key] = (value, self.__expires(time))
+            return True
+        finally:
+            self.__lock.release()
+
+    def set_multi(self, mapping, time=0):
+        ''' Returns the keys not set, i.e. none. '''
+        for key, value in mapping.items(): self.set(key, value, time)
+        return []
+
+    def add(self, key, value, time=0):
+        self.__lock.acquire()
+        try:
+            if self.__entry(key) is not None: return False
+            self.__data[key] = (value, self.__expires(time))
+            return True
+        finally:
+            self.__lock.release()
+
+    def delete(self, key):
+        self.__lock.acquire()
+        try:
+            self.__data.pop(key, None)
+            return True
+        finally:
+            self.__lock.release()
+
+    def incr(self, key, delta=1, initial_value=None):
+        self.__lock.acquire()
+        try:
+            entry = self.__entry(key)
+            if entry is None:
+                if initial_value is None: return None
+                entry = (initial_value, 0)
+            value = max(0, entry[0] + delta)
+            self.__data[key] = (value, entry[1])
+            return value
+        finally:
+            self.__lock.release()
+
+    def offset_multi(self, mapping, initial_value=None):
+        ''' Returns a dict of the new values, with None for keys not
+        incremented. '''
+        return dict([(key, self.incr(key, delta, initial_value))
+                     for key, delta in mapping.items()])
@@ -0,0 +1,116 @@
+'''
+In-process tag dictionary for typeahead: every tag in sorted order,
+with the number of macros that have it.
+
+The tags starting with a prefix are a contiguous run of the sorted
+list, found with two bisects.  Completions are the most used tags in
+that run.  Runs longer than _SCAN_LIMIT, i.e. for the first letter or
+two typed, would be slow to rank on every keystroke, so their top
+completions are ranked once when the dictionary is built and kept up
+to date as counts change.  Shorter runs are ranked when asked for.
+
+Dictionaries are built from the posting lists of a TagIndex (see
+tagindex.py), whose lengths are the counts, so there is nothing more
+to store or load.
+'''
+
+import sys
+import heapq
+import threading
+from array  import array
+from bisect import bisect_left
+
+
+# Most completions returned for a prefix.
+MAX_COMPLETIONS = 10
+
+# Runs of at most this many tags are ranked on lookup; longer ones
+# are ranked ahead of time.
+_SCAN_LIMIT = 64
+
+# Sorts after any character a tag can have.
+_MAX_CHAR = unichr(sys.maxunicode)
+
+
+# Helper to make a tag unicode.
+def _unicode(tag):
+    if isinstance(tag, str): return tag.decode('utf-8')
+    return tag
+
+
+# Rank key, most used first, ties in tag order.
+def _rank(entry):
+    return (-entry[1], entry[0])
+
+
+class TagDictionary(object):
+    ''' Sorted tags, with macro counts, for prefix lookup.  Safe to
+    share between threads: new tags replace the tag and count arrays
+    together rather than change them. '''
+
+    def __init__(self, counts=()):
+        ''' Build from an iterable of (tag, count). '''
+        counts = sorted([(_unicode(t), c) for t, c in counts])
+        self.entries = ([t for t, c in counts], array('i', [c for t, c in counts]))
+        self.__lock  = threading.Lock()
+
+        # Rank the completions of every prefix with a long run.
+        self.top = {}
+        runs = {}
+        for tag in self.entries[0]:
+            for i in xrange(1, len(tag) + 1):
+                runs[tag[:i]] = runs.get(tag[:i], 0) + 1
+        for prefix, length in runs.iteritems():
+            if length > _SCAN_LIMIT:
+                self.top[prefix] = self.__scan(prefix)
+
+    def __len__(self):
+        return len(self.entries[0])
+
+    # Helper to rank the tags starting with prefix.
+    def __scan(self, prefix):
+        tags, counts = self.entries
+        lo = bisect_left(tags, prefix)
+        hi = bisect_left(tags, prefix + _MAX_CHAR, lo)
+        return heapq.nsmallest(MAX_COMPLETIONS,
+                               [(tags[i], counts[i]) for i in xrange(lo, hi)],
+                               key=_rank)
+
+    def complete(self, prefix, num=MAX_COMPLETIONS):
+        ''' Get up to num tags starting with prefix, most used
+        first. '''
+        prefix = _unicode(prefix).lower()
+        if not prefix: return []
+        top = self.top.get(prefix)
+        if top is None: top = self.__scan(prefix)
+        return [t for t, c in top[:num]]
+
+    def add_tags(self, tags):
+        ''' Count one more macro for each of tags, adding any new
+        ones. '''
+        self.__lock.acquire()
+        try:
+            for tag in tags:
+                tag = _unicode(tag)
+                names, counts = self.entries
+                pos = bisect_left(names, tag)
+                if pos < len(names) and names[pos] == tag:
+                    counts[pos] += 1
+                else:
+                    names  = names[:pos] + [tag] + names[pos:]
+                    counts = counts[:pos] + array('i', [1]) + counts[pos:]
+                    self.entries = (names, counts)
+                self.__rerank(tag, counts[pos])
+        finally:
+            self.__lock.release()
+
+    # Helper to move a tag up the ranked completions of its prefixes
+    # after its count went up.  Other counts are unchanged, so it
+    # either was in the top, or now displaces the last of it.
+    def __rerank(self, tag, count):
+        for i in xrange(1, len(tag) + 1):
+            top = self.top.get(tag[:i])
+            if top is None: continue
+            top = [e for e in top if e[0] != tag] + [(tag, count)]
+            top.sort(key=_rank)
+            self.top[tag[:i]] = top[:MAX_COMPLETIONS]
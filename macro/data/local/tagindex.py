@@ -0,0 +1,292 @@
+'''
+In-process inverted index from tag to saved macros, for multi-tag
+search.
+
+Each tag has a posting list: the sorted SavedMacro.index of every
+macro with that tag, in an integer array.  A query is a list of
+groups of tags; the tags in a group are OR'd and the groups are AND'd,
+so "druid + pvp|arenas + focus" is three groups.  Posting lists are
+merged by galloping: the shorter list is walked, and the longer one
+is searched ahead of the last match in steps of doubling size, so a
+small list costs little against a large one.  Lists of about the same
+length are merged as sets instead, which in C beats galloping in
+Python.  Results are paged in views or rating order, from columns
+kept alongside the postings.
+
+The index is built offline from an export of the SavedMacro entities
+by build_tag_index.py, loaded once per process from TAG_INDEX, and
+kept up to date by SavedMacroOps.save_macro and, for macros saved and
+counts flushed by other processes, by savedmacro.refresh_tag_index.  Typeahead completes
+tags from a TagDictionary (see tagdict.py) built from the same
+postings.
+'''
+
+import os
+import sys
+import heapq
+import cPickle
+import logging
+import threading
+from array  import array
+from bisect import bisect_left
+
+from macro.data.local.tagdict import TagDictionary
+
+
+# Default index file.
+_DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "..", "data")
+TAG_INDEX = os.path.join(_DATA_DIR, "tags.idx")
+
+_MAGIC = "MEOMTAG1"
+
+# Sorts the index can page by, by the column they use.
+INDEX_SORTS = ('-views', 'views', '-rating', 'rating')
+
+# Gallop when one list is at least this many times longer than the
+# other; below that, merge as sets.  Measured on random lists of
+# 100 to 80k macros.
+_INTERSECT_GALLOP_RATIO = 64
+_UNION_GALLOP_RATIO     = 8
+
+# Query syntax.
+AND_SEP = "+"
+OR_SEP  = "|"
+
+
+# Parse a query into groups of tags.
+def parse_tag_query(query):
+    ''' Split a query into a list of groups of tags.  Tags are
+    lowercased, as they are saved. '''
+    groups = []
+    for term in query.lower().split(AND_SEP):
+        group = [t.strip() for t in term.split(OR_SEP) if t.strip()]
+        if group: groups.append(group)
+    return groups
+
+
+# Find the first position in a, from lo on, holding a value >= x.
+# Steps ahead 1, 2, 4... until past x, then bisects the last step.
+def _gallop(a, x, lo):
+    n, hi, step = len(a), lo, 1
+    while hi < n and a[hi] < x:
+        lo    = hi + 1
+        hi   += step
+        step *= 2
+    return bisect_left(a, x, lo, min(hi, n))
+
+
+def intersect(a, b):
+    ''' Intersect two sorted posting lists. '''
+    if len(a) > len(b): a, b = b, a
+    if len(b) < len(a) * _INTERSECT_GALLOP_RATIO:
+        return array('i', sorted(set(a).intersection(b)))
+    out = array('i')
+    j, n = 0, len(b)
+    for x in a:
+        j = _gallop(b, x, j)
+        if j == n: break
+        if b[j] == x:
+            out.append(x)
+            j += 1
+    return out
+
+
+def union(a, b):
+    ''' Merge two sorted posting lists.  Runs from one list that
+    come before the next value of the other are copied whole. '''
+    if len(a) > len(b): a, b = b, a
+    if len(b) < len(a) * _UNION_GALLOP_RATIO:
+        return array('i', sorted(set(a).union(b)))
+    out  = array('i')
+    i, j = 0, 0
+    while i < len(a) and j < len(b):
+        if a[i] < b[j]:
+            k = _gallop(a, b[j], i)
+            out.extend(a[i:k])
+            i = k
+        elif b[j] < a[i]:
+            k = _gallop(b, a[i], j)
+            out.extend(b[j:k])
+            j = k
+        else:
+            out.append(a[i])
+            i += 1
+            j += 1
+    out.extend(a[i:])
+    out.extend(b[j:])
+    return out
+
+
+# Fold a merge over lists, shortest first, so intermediate results
+# stay small.
+def _merge_all(merge, lists):
+    lists = sorted(lists, key=len)
+    if not lists: return array('i')
+    ret = lists[0]
+    for l in lists[1:]:
+        if merge is intersect and not ret: break
+        ret = merge(ret, l)
+    return ret
+
+
+class TagIndex(object):
+    ''' Posting lists by tag, with the views and rating of each macro
+    by index.  Safe to share between threads: updates replace
+    posting lists rather than change them. '''
+
+    def __init__(self, macros=()):
+        ''' Build from an iterable of (index, tags, views, rating). '''
+        self.views    = array('i')
+        self.rating   = array('i')
+        self.__lock   = threading.Lock()
+        self.__dict   = None
+        postings = {}
+        for index, tags, views, rating in macros:
+            self.__set_columns(index, views, rating)
+            for tag in tags: postings.setdefault(tag, []).append(index)
+        self.postings = {}
+        for tag, indexes in postings.items():
+            indexes.sort()
+            self.postings[tag] = array('i', indexes)
+
+    # Helper to set the columns for a macro, growing them to fit.
+    def __set_columns(self, index, views, rating):
+        if index >= len(self.views):
+            grow = array('i', [0]) * (index + 1 - len(self.views))
+            self.views.extend(grow)
+            self.rating.extend(grow)
+        self.views[index]  = views
+        self.rating[index] = rating
+
+    def num_tags(self):
+        return len(self.postings)
+
+    def last_index(self):
+        ''' The highest macro index in the index, or -1 if it is
+        empty. '''
+        return len(self.views) - 1
+
+    def set_counts(self, index, views, rating):
+        ''' Update the views and rating of a macro in the index. '''
+        self.__lock.acquire()
+        try:
+            if index < len(self.views):
+                self.views[index]  = views
+                self.rating[index] = rating
+        finally:
+            self.__lock.release()
+
+    def get_dictionary(self):
+        ''' Get a TagDictionary of the tags in the index, for
+        typeahead, building it on first use.  It is kept up to date by
+        add_macro. '''
+        if self.__dict is None:
+            self.__lock.acquire()
+            try:
+                if self.__dict is None:
+                    self.__dict = TagDictionary([(t, len(p)) for t, p in self.postings.items()])
+            finally:
+                self.__lock.release()
+        return self.__dict
+
+    def add_macro(self, index, tags, views=0, rating=0):
+        ''' Add a newly saved macro. '''
+        self.__lock.acquire()
+        try:
+            self.__set_columns(index, views, rating)
+            added = []
+            for tag in tags:
+                posting = array('i', self.postings.get(tag, ()))
+                pos = bisect_left(posting, index)
+                if pos < len(posting) and posting[pos] == index: continue
+                posting.insert(pos, index)
+                self.postings[tag] = posting
+                added.append(tag)
+            if self.__dict is not None: self.__dict.add_tags(added)
+        finally:
+            self.__lock.release()
+
+    def query(self, groups):
+        ''' Get the sorted indexes of the macros matching groups of
+        tags, as from parse_tag_query. '''
+        empty = array('i')
+        return _merge_all(intersect,
+                          [_merge_all(union, [self.postings.get(t, empty) for t in group])
+                           for group in groups])
+
+    def search(self, groups, sort='-views', page=1, num=10):
+        ''' Get a page of macro indexes matching groups of tags, in
+        sort order, ties in index order.  Returns ([indexes],
+        is_next_page). '''
+        if sort.lstrip('-') == 'views': col = self.views
+        else:                           col = self.rating
+        start = (page - 1) * num
+        if sort.startswith('-'): key = lambda i: (-col[i], i)
+        else:                    key = lambda i: (col[i], i)
+        top = heapq.nsmallest(start + num + 1, self.query(groups), key=key)
+        return (top[start:start + num], len(top) > start + num)
+
+    def save(self, path):
+        ''' Write the index to a file, for load_tag_index. '''
+        out_file = open(path, 'wb')
+        try:
+            cPickle.dump((_MAGIC, sys.byteorder,
+                          dict([(t, p.tostring()) for t, p in self.postings.items()]),
+                          self.views.tostring(),
+                          self.rating.tostring()),
+                         out_file, 2)
+        finally:
+            out_file.close()
+
+
+# Helper to read an integer array written on a machine of the given
+# byte order.
+def _read_array(data, byteorder):
+    a = array('i')
+    a.fromstring(data)
+    if byteorder != sys.byteorder: a.byteswap()
+    return a
+
+
+def load_tag_index(path):
+    ''' Load an index written by TagIndex.save. '''
+    in_file = open(path, 'rb')
+    try:
+        magic, byteorder, postings, views, rating = cPickle.load(in_file)
+    finally:
+        in_file.close()
+    if magic != _MAGIC: raise ValueError("%s is not a tag index." % path)
+    index = TagIndex()
+    index.postings = dict([(t, _read_array(p, byteorder)) for t, p in postings.items()])
+    index.views    = _read_array(views, byteorder)
+    index.rating   = _read_array(rating, byteorder)
+    return index
+
+
+# The indexes for this process, by file, and the lock guarding their
+# loading.  None for files that couldn't be loaded.
+_INDEXES      = {}
+_INDEXES_LOCK = threading.Lock()
+
+def get_index(path):
+    ''' Get the index in a file for this process, loading it on first
+    use.  Returns None if there is no such file. '''
+    if path not in _INDEXES:
+        _INDEXES_LOCK.acquire()
+        try:
+            if path not in _INDEXES:
+                index = None
+                if os.path.exists(path):
+                    try:
+                        index = load_tag_index(path)
+                    except Exception, inst:
+                        logging.error("Couldn't load %s: %s" % (path, inst))
+                _INDEXES[path] = index
+        finally:
+            _INDEXES_LOCK.release()
+    return _INDEXES[path]
+
+def get_tag_index():
+    ''' Get the tag index for this process, or None if there isn't
+    one. '''
+    return get_index(TAG_INDEX)
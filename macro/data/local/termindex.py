@@ -0,0 +1,123 @@
+'''
+In-process index of what saved macros do, for finding macros by the
+spells and items they use rather than by their tags.
+
+Each saved macro is interpreted, and its resolved spells and items,
+verbs, condition options and targets are recorded as terms:
+
+  verb:/cast                -- a command verb
+  spell:118, spell:polymorph -- a spell, by id and by name
+  item:6948, item:hearthstone -- an item, by id and by name
+  slot:13                   -- an inventory slot used by number
+  opt:harm, opt:nodead      -- a condition option, as written
+  target:mouseover          -- a target unit
+
+Terms are kept in a TagIndex (see tagindex.py), so queries are the
+same: "spell:polymorph + opt:harm" for both, "slot:13|slot:14" for
+either.  The index is built in bulk by build_term_index.py, loaded
+once per process from TERM_INDEX, and kept up to date by
+SavedMacroOps.save_macro.
+'''
+
+import os
+import sys
+import logging
+
+from macro.util                     import is_number, encode
+from macro.lex.ids                  import COMMAND_VERB, META_COMMAND_VERB, PARAMETER, NOT, OPTION_WORD, TARGET_OBJ
+from macro.data.local.tagindex      import get_index, parse_tag_query
+
+
+# Default index file.
+_DATA_DIR  = os.path.join(os.path.dirname(__file__), "..", "..", "..", "data")
+TERM_INDEX = os.path.join(_DATA_DIR, "terms.idx")
+
+# Term formats.
+VERB_TERM   = u"verb:%s"
+SPELL_TERM  = u"spell:%s"
+ITEM_TERM   = u"item:%s"
+SLOT_TERM   = u"slot:%s"
+OPTION_TERM = u"opt:%s"
+TARGET_TERM = u"target:%s"
+
+# Saved macro key names, by index, as in savedmacro.py.
+_MACRO_KEY = "m%s"
+
+
+# Helper to make a term.  Token text can be utf-8 encoded.
+def _term(term, value):
+    if isinstance(value, str): value = value.decode('utf-8')
+    return term % value
+
+
+def get_macro_terms(int_macro):
+    ''' Get the set of terms for an InterpretedMacro. '''
+    terms = set()
+    for cmd in int_macro:
+        verb   = None
+        params = []
+        negate = False
+        for t in cmd.cmd_list:
+            if t.token_type == NOT:
+                negate = True
+                continue
+            if t.token_type in (COMMAND_VERB, META_COMMAND_VERB):
+                verb = t
+                terms.add(_term(VERB_TERM, t.data.lower()))
+            elif t.token_type == OPTION_WORD:
+                terms.add(_term(OPTION_TERM, (negate and "no" or "") + t.data.lower()))
+            elif t.token_type == TARGET_OBJ:
+                terms.add(_term(TARGET_TERM, t.data.lower().strip("-")))
+            elif t.token_type == PARAMETER:
+                params.append(t)
+                obj = t.param_data_obj
+                if obj is not None and obj.found():
+                    if obj.is_spell(): term = SPELL_TERM
+                    else:              term = ITEM_TERM
+                    terms.add(_term(term, obj.get_id()))
+                    terms.add(_term(term, obj.get_name().lower()))
+            negate = False
+
+        # A lone number given to a verb that takes one is an inventory
+        # slot.
+        if verb is not None and len(params) == 1 and is_number(params[0].data) and \
+               (int,) in (getattr(verb.attrs, 'param', None) or ()):
+            terms.add(_term(SLOT_TERM, int(params[0].data)))
+    return terms
+
+
+def get_term_index():
+    ''' Get the term index for this process, or None if there isn't
+    one. '''
+    return get_index(TERM_INDEX)
+
+
+def add_macro_terms(index, macro):
+    ''' Interpret a newly saved macro and add its terms to this
+    process's index, if it has one.  Spell and item data comes from
+    the in-process local index, so saving doesn't wait on datastore
+    lookups.  Failures are logged; the macro is just left out. '''
+    term_index = get_term_index()
+    if term_index is None: return
+
+    # Lazily import, as the interpreter is heavy.
+    from macro.data.wow              import SOURCE_LOCAL
+    from macro.interpret.interpreter import MacroInterpreter
+    try:
+        terms = get_macro_terms(MacroInterpreter(data_source=SOURCE_LOCAL).interpret_macro(macro))
+    except:
+        # Not all macro exceptions derive from Exception.
+        logging.error("Couldn't index terms for macro %s: %s" % (index, sys.exc_info()[1]))
+        return
+    term_index.add_macro(index, terms)
+
+
+def find_macros(query, sort='-views', page=1, num=10):
+    ''' Find saved macros by a query of terms, i.e.
+    "spell:polymorph + opt:harm".  Returns ([macro ids],
+    is_next_page), in views or rating order.  Returns None if there
+    is no index. '''
+    term_index = get_term_index()
+    if term_index is None: return None
+    (indexes, is_next_page) = term_index.search(parse_tag_query(query), sort, page, num)
+    return ([_MACRO_KEY % encode(i) for i in indexes], is_next_page)
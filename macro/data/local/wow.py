@@ -0,0 +1,221 @@
+'''
+Read-only, in-process index of spell and item data, loaded from the
+same csvs that are bulkloaded into the datastore (see bulkloader.yaml).
+
+The index is built lazily, once per process, on the first lookup.
+Rows are kept in array-backed columns, with names and ranks shared
+between rows, and a single dict from the normalized key to the row.
+Lookups never leave the process.
+
+If the csvs have been compiled into a database file with
+build_wow_db.py, that file is mapped instead (see wowdb.py).
+'''
+
+import os
+import csv
+import logging
+import threading
+from array import array
+
+from macro.data.wow_obj_base  import WowObject
+
+
+# Default data files.  items.csv is optional; without it, every item
+# lookup misses.
+_DATA_DIR  = os.path.join(os.path.dirname(__file__), "..", "..", "..", "data")
+SPELL_CSV  = os.path.join(_DATA_DIR, "spells.csv")
+ITEM_CSV   = os.path.join(_DATA_DIR, "items.csv")
+WOW_DB     = os.path.join(_DATA_DIR, "wow.db")
+
+# Column layouts, as in bulkloader.yaml.
+SPELL_COLUMNS = ['key', 'id', 'name', 'rank', 'icon', 'powerCost', 'isFunnel',
+                 'powerType', 'castingTime', 'minRange', 'maxRange']
+ITEM_COLUMNS  = ['key', 'name', 'link', 'quality', 'iLevel', 'reqLevel', 'class',
+                 'subclass', 'maxStack', 'equipSlot', 'texture', 'vendorPrice', 'id']
+
+
+# Helper for normalizing keys, same as the datastore.
+def _normalize(name):
+    return name.lower()
+
+
+# Helper to read a csv, skipping a header row if there is one.
+def _read_csv(path, columns):
+    csv_file = open(path, 'rb')
+    try:
+        for row in csv.reader(csv_file):
+            if len(row) < len(columns) or row[0] == columns[0]: continue
+            yield [c.decode('utf-8') for c in row]
+    finally:
+        csv_file.close()
+
+
+# Helper to parse ints from a csv, defaulting on empty.
+def _int(val, default=0):
+    try:
+        return int(val)
+    except ValueError:
+        return default
+
+
+class LocalIndex(object):
+    ''' Spell and item data, column by column.  Rows are looked up
+    by normalized key; later rows win, as they would when bulkloaded.'''
+
+    def __init__(self, spell_csv=SPELL_CSV, item_csv=ITEM_CSV):
+        # Names and ranks repeat across keys (i.e. every rank of a
+        # spell), so share a single copy of each.
+        strings = {}
+        def intern_str(s):
+            return strings.setdefault(s, s)
+
+        # Spells
+        self.spell_keys   = {}
+        self.spell_id     = array('l')
+        self.spell_name   = []
+        self.spell_rank   = []
+        self.spell_funnel = array('b')
+        self.spell_cast   = array('l')
+        self.spell_min    = array('l')
+        self.spell_max    = array('l')
+        id_c, name_c, rank_c, funnel_c, cast_c, min_c, max_c = \
+              [SPELL_COLUMNS.index(c) for c in ('id', 'name', 'rank', 'isFunnel',
+                                                'castingTime', 'minRange', 'maxRange')]
+        if spell_csv and os.path.exists(spell_csv):
+            for row in _read_csv(spell_csv, SPELL_COLUMNS):
+                self.spell_keys[intern_str(_normalize(row[0]))] = len(self.spell_id)
+                self.spell_id.append(_int(row[id_c]))
+                self.spell_name.append(intern_str(row[name_c]))
+                self.spell_rank.append(intern_str(row[rank_c]) if row[rank_c] else None)
+                self.spell_funnel.append(row[funnel_c] == "True")
+                self.spell_cast.append(_int(row[cast_c]))
+                self.spell_min.append(_int(row[min_c]))
+                self.spell_max.append(_int(row[max_c]))
+
+        # Items.  Items can go in several slots, so the slots for
+        # row i are item_slots[item_slot_start[i]:item_slot_start[i+1]].
+        self.item_keys       = {}
+        self.item_id         = array('l')
+        self.item_name       = []
+        self.item_slots      = array('b')
+        self.item_slot_start = array('l', [0])
+        id_c, name_c, slot_c = [ITEM_COLUMNS.index(c) for c in ('id', 'name', 'equipSlot')]
+        if item_csv and os.path.exists(item_csv):
+            for row in _read_csv(item_csv, ITEM_COLUMNS):
+                self.item_keys[intern_str(_normalize(row[0]))] = len(self.item_id)
+                self.item_id.append(_int(row[id_c]))
+                self.item_name.append(intern_str(row[name_c]))
+                self.item_slots.extend([_int(s, -1) for s in row[slot_c].split("-") if s] or [-1])
+                self.item_slot_start.append(len(self.item_slots))
+
+    def num_spells(self):
+        return len(self.spell_id)
+
+    def num_items(self):
+        return len(self.item_id)
+
+    def get_spell(self, name):
+        ''' Get a LocalSpell by name, or None on miss. '''
+        row = self.spell_keys.get(_normalize(name))
+        if row is None: return None
+        return LocalSpell(self.spell_id[row],
+                          self.spell_name[row],
+                          self.spell_rank[row],
+                          self.spell_max[row])
+
+    def get_item(self, name):
+        ''' Get a LocalItem by name or item:id, or None on miss. '''
+        row = self.item_keys.get(_normalize(name))
+        if row is None: return None
+        return LocalItem(self.item_id[row],
+                         self.item_name[row],
+                         list(self.item_slots[self.item_slot_start[row]:self.item_slot_start[row+1]]))
+
+
+# The index for this process, and the lock guarding its creation.
+_INDEX      = None
+_INDEX_LOCK = threading.Lock()
+
+def get_local_index():
+    ''' Get the index for this process, building it on first use. '''
+    global _INDEX
+    if _INDEX is None:
+        _INDEX_LOCK.acquire()
+        try:
+            if _INDEX is None: _INDEX = _load_index()
+        finally:
+            _INDEX_LOCK.release()
+    return _INDEX
+
+
+# Helper to map the database file if there is an up to date one,
+# else build the index from the csvs.
+def _load_index():
+    if os.path.exists(WOW_DB):
+        db_time = os.path.getmtime(WOW_DB)
+        if [p for p in (SPELL_CSV, ITEM_CSV) if os.path.exists(p) and os.path.getmtime(p) > db_time]:
+            logging.warning("%s is older than the csvs, ignoring it." % WOW_DB)
+        else:
+            from macro.data.local.wowdb import MappedIndex
+            return MappedIndex(WOW_DB)
+    return LocalIndex()
+
+
+# Objects handed back to callers copy their row out of the index, as
+# they get pickled into memcache along with interpreted macros.
+class LocalItem(WowObject):
+    ''' Item data from the local index. '''
+    def __init__(self, item_id, name, slots):
+        self.id    = item_id
+        self.name  = name
+        self.slots = slots
+    def found(self):
+        return True
+    def get_name(self):
+        return self.name
+    def get_id(self):
+        return self.id
+    def get_slot(self):
+        ''' Returns the wow slot.  NOTE: can return a set.'''
+        return self.slots
+    def test_item_slotid(self, slot_id=0):
+        ''' Test to see if this item is equippable in this slot.'''
+        return (slot_id in self.slots)
+    def is_item(self):
+        return True
+
+class LocalSpell(WowObject):
+    ''' Spell data from the local index. '''
+    def __init__(self, spell_id, name, rank, max_range):
+        self.id        = spell_id
+        self.name      = name
+        self.rank      = rank
+        self.max_range = max_range
+    def found(self):
+        return True
+    def get_name(self):
+        return self.name
+    def get_id(self):
+        return self.id
+    def self_only(self):
+        ''' Self-buff?  True/False. '''
+        # Same data as the datastore, so the same problem with
+        # maxRange; see DatastoreSpell.
+        return False
+    def get_rank(self):
+        ''' Spells with no ranks return None.
+        NOTE: Returns a string now.'''
+        return self.rank
+    def trips_gcd(self):
+        ''' Whether or not the spell trips the GCD.
+        Most spells do, with only a few known to NOT trip it.'''
+        return True
+    def is_spell(self):
+        return True
+
+
+# Easy fetch helper for upstream callers.
+def get_local_object(obj_id, is_item):
+    if is_item:
+        return get_local_index().get_item(obj_id)
+    return get_local_index().get_spell(obj_id)
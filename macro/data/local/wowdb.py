@@ -0,0 +1,225 @@
+'''
+Prebuilt, immutable binary spell and item database.
+
+build_db() compiles a LocalIndex into a single file, which
+MappedIndex then reads in place through mmap.  Nothing is parsed or
+copied at load time, so every process on a host shares the same page
+cache, and a cold start costs one open().
+
+Layout, all little-endian:
+
+  header        -- _HEADER
+  spell table   -- open-addressed hash table of _BUCKET entries
+  item table    -- same, for items
+  spell records -- fixed-width _SPELL_REC entries
+  item records  -- fixed-width _ITEM_REC entries
+  slots         -- signed bytes, item slots
+  strings       -- utf-8 keys, names and ranks
+
+Each table has a power of two number of buckets, at most half full.
+A bucket holds the crc32 of the key, the key's location in the string
+block, and the record number.  Lookup is a hash and, usually, a
+single probe.
+'''
+
+import os
+import zlib
+import struct
+
+from macro.data.local.wow     import LocalIndex, LocalSpell, LocalItem, _normalize
+
+# mmap isn't available everywhere (i.e. on appengine); fall back to
+# reading the file into memory.
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+
+_MAGIC = "MEOMWDB1"
+
+# magic, num spells, num items, spell table buckets, item table
+# buckets, and the offsets of each section after the tables.
+_HEADER    = struct.Struct("<8sIIIIIIIII")
+_BUCKET    = struct.Struct("<IIHI")    # hash, key off, key len, record
+_SPELL_REC = struct.Struct("<iIIHHBiii")  # id, name off, rank off, name len,
+                                          # rank len, flags, cast, min, max range
+_ITEM_REC  = struct.Struct("<iIIHH")   # id, name off, slot off, name len, num slots
+
+# Record number of an empty bucket.
+_EMPTY = 0xFFFFFFFF
+
+# Spell flags.
+FLAG_FUNNEL = 1
+FLAG_GCD    = 2
+
+
+# Helper to hash a key into a bucket hash.
+def _hash(key):
+    return zlib.crc32(key) & 0xFFFFFFFF
+
+
+# Helper to get the number of buckets for n keys.
+def _num_buckets(n):
+    size = 1
+    while size < n * 2: size <<= 1
+    return size
+
+
+class _StringBlock(object):
+    ''' Accumulates strings for the string block, storing each
+    distinct string once. '''
+    def __init__(self):
+        self.parts  = []
+        self.offs   = {}
+        self.length = 0
+
+    def add(self, s):
+        ''' Returns (offset, length) of the utf-8 bytes of s. '''
+        data = (s or u'').encode('utf-8')
+        if data not in self.offs:
+            self.offs[data] = self.length
+            self.parts.append(data)
+            self.length += len(data)
+        return (self.offs[data], len(data))
+
+
+# Helper to build a hash table over {key: record number}.
+def _build_table(keys, strings):
+    size  = _num_buckets(len(keys))
+    table = [None] * size
+    for key, rec in sorted(keys.items()):
+        key_off, key_len = strings.add(key)
+        h = _hash(key.encode('utf-8'))
+        i = h & (size - 1)
+        while table[i] is not None: i = (i + 1) & (size - 1)
+        table[i] = _BUCKET.pack(h, key_off, key_len, rec)
+    empty = _BUCKET.pack(0, 0, 0, _EMPTY)
+    return (size, ''.join([b or empty for b in table]))
+
+
+def build_db(out_path, index=None):
+    ''' Compile a LocalIndex (by default, one over the data/ csvs)
+    into a database file at out_path. '''
+    if index is None: index = LocalIndex()
+    strings = _StringBlock()
+    spell_buckets, spell_table = _build_table(index.spell_keys, strings)
+    item_buckets,  item_table  = _build_table(index.item_keys, strings)
+
+    # The csvs don't carry GCD data, so every spell trips it, as
+    # with the datastore.
+    spell_recs = []
+    for i in range(index.num_spells()):
+        name_off, name_len = strings.add(index.spell_name[i])
+        rank_off, rank_len = strings.add(index.spell_rank[i])
+        flags = FLAG_GCD | (FLAG_FUNNEL if index.spell_funnel[i] else 0)
+        spell_recs.append(_SPELL_REC.pack(index.spell_id[i], name_off, rank_off,
+                                          name_len, rank_len, flags,
+                                          index.spell_cast[i], index.spell_min[i],
+                                          index.spell_max[i]))
+    item_recs = []
+    for i in range(index.num_items()):
+        name_off, name_len = strings.add(index.item_name[i])
+        slot_off = index.item_slot_start[i]
+        item_recs.append(_ITEM_REC.pack(index.item_id[i], name_off, slot_off, name_len,
+                                        index.item_slot_start[i+1] - slot_off))
+    slots = index.item_slots.tostring()
+
+    # Lay out the sections.
+    spell_table_off = _HEADER.size
+    item_table_off  = spell_table_off + len(spell_table)
+    spell_rec_off   = item_table_off  + len(item_table)
+    item_rec_off    = spell_rec_off   + len(spell_recs) * _SPELL_REC.size
+    slot_off        = item_rec_off    + len(item_recs)  * _ITEM_REC.size
+    str_off         = slot_off        + len(slots)
+    header = _HEADER.pack(_MAGIC, index.num_spells(), index.num_items(),
+                          spell_buckets, item_buckets, item_table_off,
+                          spell_rec_off, item_rec_off, slot_off, str_off)
+
+    # Write to a temp file and rename, so readers never see a
+    # partial file.
+    tmp_path = out_path + ".tmp"
+    out_file = open(tmp_path, 'wb')
+    try:
+        out_file.write(header)
+        out_file.write(spell_table)
+        out_file.write(item_table)
+        out_file.write(''.join(spell_recs))
+        out_file.write(''.join(item_recs))
+        out_file.write(slots)
+        out_file.write(''.join(strings.parts))
+    finally:
+        out_file.close()
+    os.rename(tmp_path, out_path)
+    return str_off + strings.length
+
+
+class MappedIndex(object):
+    ''' Read-only view over a database file, with the same lookups
+    as LocalIndex. '''
+
+    def __init__(self, path):
+        db_file = open(path, 'rb')
+        try:
+            if mmap is not None:
+                self.data = mmap.mmap(db_file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = db_file.read()
+        finally:
+            db_file.close()
+
+        (magic, self.spells, self.items, self.spell_buckets, self.item_buckets,
+         self.item_table_off, self.spell_rec_off, self.item_rec_off,
+         self.slot_off, self.str_off) = _HEADER.unpack_from(self.data, 0)
+        if magic != _MAGIC:
+            raise ValueError("%s is not a wow database file." % path)
+
+    def num_spells(self):
+        return self.spells
+
+    def num_items(self):
+        return self.items
+
+    # Helper to get a string out of the string block.
+    def __str(self, off, length):
+        start = self.str_off + off
+        return self.data[start:start + length].decode('utf-8')
+
+    # Find the record number for a key, or None.
+    def __find(self, table_off, buckets, name):
+        if buckets == 0: return None
+        key  = _normalize(name)
+        if isinstance(key, unicode): key = key.encode('utf-8')
+        h    = _hash(key)
+        mask = buckets - 1
+        i    = h & mask
+        while True:
+            b_hash, key_off, key_len, rec = _BUCKET.unpack_from(self.data, table_off + i * _BUCKET.size)
+            if rec == _EMPTY: return None
+            if b_hash == h and key_len == len(key):
+                start = self.str_off + key_off
+                if self.data[start:start + key_len] == key: return rec
+            i = (i + 1) & mask
+
+    def get_spell(self, name):
+        ''' Get a LocalSpell by name, or None on miss. '''
+        rec = self.__find(_HEADER.size, self.spell_buckets, name)
+        if rec is None: return None
+        (spell_id, name_off, rank_off, name_len, rank_len, flags,
+         cast, min_range, max_range) = _SPELL_REC.unpack_from(self.data,
+                                                              self.spell_rec_off + rec * _SPELL_REC.size)
+        return LocalSpell(spell_id,
+                          self.__str(name_off, name_len),
+                          self.__str(rank_off, rank_len) if rank_len else None,
+                          max_range)
+
+    def get_item(self, name):
+        ''' Get a LocalItem by name or item:id, or None on miss. '''
+        rec = self.__find(self.item_table_off, self.item_buckets, name)
+        if rec is None: return None
+        item_id, name_off, slot_off, name_len, num_slots = \
+                 _ITEM_REC.unpack_from(self.data, self.item_rec_off + rec * _ITEM_REC.size)
+        start = self.slot_off + slot_off
+        return LocalItem(item_id,
+                         self.__str(name_off, name_len),
+                         list(struct.unpack_from("<%sb" % num_slots, self.data, start)))
@@ -7,13 +7,20 @@ from google.appengine.api       import memcache
 from macro.data.appengine.defs  import MEMCACHED_PARAM_INFO, MEMCACHED_PARAM_MISS
 
 from macro.data.test.wow        import get_test_object
-from macro.data.appengine.wow   import get_datastore_object
+from macro.data.appengine.wow   import get_datastore_object, get_datastore_objects
 from macro.data.mmochampion.wow import get_mmochamp_object
+from macro.data.local.wow       import get_local_object
 
 # Available stores for wow data.
 SOURCE_TEST         = 0
 SOURCE_DATASTORE    = 1
 SOURCE_MMOCHAMPION  = 2
+SOURCE_LOCAL        = 3
+
+# Sources that can fetch many objects in one round trip, and so are
+# worth prefetching from.  mmo-champion is fetched a page per object,
+# so prefetching would only add lookups.
+BATCH_SOURCES       = (SOURCE_DATASTORE,)
 
 # Constant for using memcache to prevent repeated lookups
 # on misses.
@@ -31,12 +38,14 @@ def get_wow_object(obj_id, is_id=False, is_item=False,
     obj = None
     cachekey = _gen_cache_key(obj_id, is_item)
 
-    # First check the cache
-    if cache and cachekey in cache and cache[cachekey]:
+    # First check the cache.  Misses are cached as None.
+    if cache and cachekey in cache:
         return cache[cachekey]
 
-    # Next check memcache (non-test only)
-    if src != SOURCE_TEST:
+    # Next check memcache (non-test only).  The local index is
+    # already in-process, so it doesn't need memcache either.
+    use_memcache = src not in (SOURCE_TEST, SOURCE_LOCAL)
+    if use_memcache:
         obj = memcache.get(cachekey)
         if obj is not None:
             if obj == MEMCACHED_NOT_FOUND: return None
@@ -46,6 +55,10 @@ def get_wow_object(obj_id, is_id=False, is_item=False,
     if src == SOURCE_TEST:
         obj = get_test_object(obj_id, is_item)
 
+    # In-process index
+    if src == SOURCE_LOCAL:
+        obj = get_local_object(obj_id, is_item)
+
     # if datastore is specified
     if src == SOURCE_DATASTORE:
         obj = get_datastore_object(obj_id, is_item)
@@ -56,7 +69,7 @@ def get_wow_object(obj_id, is_id=False, is_item=False,
         obj = get_mmochamp_object(obj_id, is_item)
 
     # Even on miss, update memcache to prevent repeat misses
-    if src != SOURCE_TEST:
+    if use_memcache:
         # Update memcached
         if not obj:
             memcache.add(cachekey, MEMCACHED_NOT_FOUND, MEMCACHED_PARAM_MISS)
@@ -74,3 +87,50 @@ def _gen_cache_key(obj_id, is_item):
     cachekey = "%s%s" % (obj_type, obj_id.lower())
     return re.sub("\s+", " ", cachekey)
 
+
+
+def get_wow_objects(obj_ids, language=DEFAULT_LANG, src=SOURCE_DATASTORE,
+                    cache={}, failover=False):
+    ''' Batch interface into fetching wow object data.  Takes a list
+    of (obj_id, is_item) tuples, and fills cache with the same entries
+    get_wow_object would.  For the datastore, this is one memcache call
+    and one datastore call for the lot.  Callers then use
+    get_wow_object as usual. '''
+    # Drop anything already cached or repeated.
+    lookups = {}
+    for obj_id, is_item in obj_ids:
+        cachekey = _gen_cache_key(obj_id, is_item)
+        if cachekey not in cache: lookups[cachekey] = (obj_id, is_item)
+    if not lookups: return
+
+    # Nothing to batch for other sources.
+    if src != SOURCE_DATASTORE:
+        for obj_id, is_item in lookups.values():
+            get_wow_object(obj_id, is_item=is_item, language=language,
+                           src=src, cache=cache, failover=failover)
+        return
+
+    # Check memcache first.
+    for cachekey, obj in memcache.get_multi(lookups.keys()).items():
+        cache[cachekey] = None if obj == MEMCACHED_NOT_FOUND else obj
+        del lookups[cachekey]
+
+    # Fetch the rest, a batch per type.
+    found = {}
+    for is_item in (True, False):
+        keys = [k for k, (o, i) in lookups.items() if i == is_item]
+        objs = get_datastore_objects([lookups[k][0] for k in keys], is_item)
+        for cachekey, obj in zip(keys, objs):
+            # if fallback is allowed and the datastore missed.
+            if not obj and failover:
+                obj = get_mmochamp_object(lookups[cachekey][0], is_item)
+            found[cachekey] = obj
+
+    # Even on miss, update memcache to prevent repeat misses
+    hits   = dict([(k, o) for k, o in found.items() if o])
+    misses = dict([(k, MEMCACHED_NOT_FOUND) for k, o in found.items() if not o])
+    if hits:   memcache.add_multi(hits, MEMCACHED_PARAM_INFO)
+    if misses: memcache.add_multi(misses, MEMCACHED_PARAM_MISS)
+
+    # Update local cache before return
+    cache.update(found)
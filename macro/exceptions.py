@@ -203,6 +203,15 @@ class LexErrorRequiredMatchFailed(LexerError, BaseException):
         desc = get_rule_desc(self.rule)        
         self.render = [TxtToken("Could not find %s in %s." % (desc,
                                                                 self.data))]
+
+
+# Error in lexing--gave up on a command that took too long to lex.
+class LexErrorBudgetExceeded(LexerError, BaseException):
+    '''Raised when lexing a command takes more rule applications or
+    time than the lexer allows.  Only crafted input gets here.
+    '''
+    def set_render_list(self):
+        self.render = [TxtToken("This macro command is too complex to interpret.  Is there a typo in your macro?")]
         
 
 #
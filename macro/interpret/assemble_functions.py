@@ -7,7 +7,7 @@ functions are saved as refs, and called at interpret time.
 import re
 import logging
 from macro.interpret.errors    import *
-from macro.interpret.txt_token import TxtToken
+from macro.interpret.txt_token import TxtToken, get_txt_token, set_render_space_after
 from macro.interpret.slots     import decode_wow_slot, decode_data_slot, get_wow_slots_for_data, check_slot_token
 
 
@@ -27,7 +27,7 @@ def get_assembled_command(token, params=[], mods=[], targets=[]):
 
 def get_commented_command(token, params=[], mods=[], targets=[]):
     ''' Handle commands which use only the verb. '''
-    return [TxtToken("Commented line, will not be evaluated:")] + [token]
+    return [get_txt_token("Commented line, will not be evaluated:")] + [token]
 
 def get_emote_command(token, params=[], mods=[], targets=[]):
     ''' Handle emotes, which can take a target. '''
@@ -43,7 +43,7 @@ def get_verb_msg_command(token, params=[], mods=[], targets=[]):
     ''' Handle commands which use only the verb. '''
     if not params:
         return [token]
-    return [token] + [TxtToken("with status message:")] + params
+    return [token] + [get_txt_token("with status message:")] + params
 
 def get_follow_command(token, params=[], mods=[], targets=[]):
     ''' Handle follow and f commands. '''
@@ -62,52 +62,52 @@ def get_verb_params_command(token, params=[], mods=[], targets=[]):
 
 def get_targeted_chat_command(token, params=[], mods=[], targets=[]):
     ''' Handle chat commands with a target.'''
-    if not params: params = [TxtToken("nothing")]
-    return [token] + params + [TxtToken("to")] + targets
+    if not params: params = [get_txt_token("nothing")]
+    return [token] + params + [get_txt_token("to")] + targets
 
 def get_pet_autocast_command(token, params=[], mods=[], targets=[]):
     ''' Handle pet commands for autocasting that have parameters. '''
-    return [token] + [TxtToken("for")] + params
+    return [token] + [get_txt_token("for")] + params
 
 def get_cancelaura_command(token, params=[], mods=[], targets=[]):
     ''' Handle cancelaura command '''
-    return [token] + params + [TxtToken("from yourself", render_space_after=False)]
+    return [token] + params + [get_txt_token("from yourself", render_space_after=False)]
 
 def get_equip_command(token, params=[], mods=[], targets=[]):
     ''' Handle equip command '''
-    return [token] + params + [TxtToken("in its default slot", render_space_after=False)]
+    return [token] + params + [get_txt_token("in its default slot", render_space_after=False)]
 
 ## TODO: add a parameter assembly function to add quotes to params.
 def get_equipset_command(token, params=[], mods=[], targets=[]):
     ''' Handle equipset command '''
-    params[-1].render_space_after = False
-    return [token] + [TxtToken("'", render_space_after=False)] + params + [TxtToken("'"), TxtToken("via the Equipment Manager", render_space_after=False)]
+    params[-1] = set_render_space_after(params[-1], False)
+    return [token] + [get_txt_token("'", render_space_after=False)] + params + [get_txt_token("'"), get_txt_token("via the Equipment Manager", render_space_after=False)]
 
 def get_show_command(token, params=[], mods=[], targets=[]):
     ''' Command assemble for #show. '''
-    if params: return [token, TxtToken("for")] + params + [TxtToken("for this macro on the action bar", render_space_after=False)]
-    return [token, TxtToken("for the first item or spell in this macro on the action bar", render_space_after=False)]
+    if params: return [token, get_txt_token("for")] + params + [get_txt_token("for this macro on the action bar", render_space_after=False)]
+    return [token, get_txt_token("for the first item or spell in this macro on the action bar", render_space_after=False)]
 
 def get_cast_command(token, params=[], mods=[], targets=[]):
     ''' Command assemble for /cast. '''
     if not params: return [token]
-    return [token] + params + [TxtToken("on")] + targets
+    return [token] + params + [get_txt_token("on")] + targets
 
 def get_castsequence_command(token, params=[], mods=[], targets=[]):
     ''' Command assemble for /castsequence and /castrandom '''
     # Did we get a target? If so, add a join
-    if targets: targets = [TxtToken("on")] + targets 
+    if targets: targets = [get_txt_token("on")] + targets 
 
-    if mods: return [token, TxtToken("of")] + params + targets + [TxtToken("each time the macro is activated,")] + mods
-    return [token, TxtToken("of")] + params + targets + [TxtToken("each time the macro is activated", render_space_after=False)]
+    if mods: return [token, get_txt_token("of")] + params + targets + [get_txt_token("each time the macro is activated,")] + mods
+    return [token, get_txt_token("of")] + params + targets + [get_txt_token("each time the macro is activated", render_space_after=False)]
 
 def get_actionbar_command(token, params=[], mods=[], targets=[]):
     ''' Command assemble for /cast. '''
     for p in params:
         p.render_desc = "bar " + p.data
     if len(params) > 1:
-        return [token, TxtToken("from"), params[0], TxtToken("to"), params[1], TxtToken("if"), params[0], TxtToken("is active, otherwise switch to"), params[0]]
-    return [token, TxtToken("to")] + params
+        return [token, get_txt_token("from"), params[0], get_txt_token("to"), params[1], get_txt_token("if"), params[0], get_txt_token("is active, otherwise switch to"), params[0]]
+    return [token, get_txt_token("to")] + params
 
 # Targeting
 def get_assist_command(token, params=[], mods=[], targets=[]):
@@ -116,7 +116,7 @@ def get_assist_command(token, params=[], mods=[], targets=[]):
     if params: return [token] + params
     # Otherwise, if we found a recognized target, target that
     elif targets: return [token] + targets
-    return [token, TxtToken("your currently targeted unit", render_space_after=False)]
+    return [token, get_txt_token("your currently targeted unit", render_space_after=False)]
 
 def get_focus_command(token, params=[], mods=[], targets=[]):
     ''' Command assemble for focus. '''
@@ -124,7 +124,7 @@ def get_focus_command(token, params=[], mods=[], targets=[]):
     if params: return [token] + params
     # Otherwise, if we found a recognized target, target that
     elif targets: return [token] + targets
-    return [token, TxtToken("your currently targeted unit", render_space_after=False)]
+    return [token, get_txt_token("your currently targeted unit", render_space_after=False)]
 
 # TODO: MODIFY PARAMETER TO HAVE QUOTES
 def get_target_command(token, params=[], mods=[], targets=[]):
@@ -133,14 +133,14 @@ def get_target_command(token, params=[], mods=[], targets=[]):
     if params: return [token] + params
     # Otherwise, if we found a recognized targets, target that
     elif targets: return [token] + targets
-    return [token, TxtToken("nothing")]
+    return [token, get_txt_token("nothing")]
 
 # TODO: MODIFY PARAMETER TO HAVE QUOTES
 def get_targetexact_command(token, params=[], mods=[], targets=[]):
     ''' Command assemble for /tar /or target. '''
     if targets:
-        return [token, TxtToken("visible unit named exactly")] + targets
-    return [token, TxtToken("nothing")]
+        return [token, get_txt_token("visible unit named exactly")] + targets
+    return [token, get_txt_token("nothing")]
 
 def get_target_cycle_command(token, params=[], mods=[], targets=[]):
     ''' Command assemble for targing commands that cycle through targets.'''
@@ -165,7 +165,7 @@ def get_assembled_option(token, neg=None, args=[], target_self=False):
         return [token]
 
 def get_exists_option(token, neg=None, args=[], target_self=False):
-    if neg: return [TxtToken("does"), neg, token]
+    if neg: return [get_txt_token("does"), neg, token]
     # "you exist" vs "you exists"
     if target_self: return [token]
     token.render_desc = "exists"
@@ -173,35 +173,35 @@ def get_exists_option(token, neg=None, args=[], target_self=False):
  
 def get_stance_option(token, neg=None, args=[], target_self=False):
     if args:
-        if neg: return [neg, TxtToken("in"), token] + args
-        return [TxtToken("in"), token] + args
+        if neg: return [neg, get_txt_token("in"), token] + args
+        return [get_txt_token("in"), token] + args
     else:
-        if neg: return [neg, TxtToken("in a"), token]
-        return [TxtToken("in a"), token]
+        if neg: return [neg, get_txt_token("in a"), token]
+        return [get_txt_token("in a"), token]
  
 def get_spec_option(token, neg=None, args=[], target_self=False):
     if args:
-        if neg: return [neg, TxtToken("have"), token] + args + [TxtToken("active")]
-        return [TxtToken("have"), token] + args + [TxtToken("active")]
+        if neg: return [neg, get_txt_token("have"), token] + args + [get_txt_token("active")]
+        return [get_txt_token("have"), token] + args + [get_txt_token("active")]
     else:
-        if neg: return [neg, TxtToken("have a"), token, TxtToken("active")]
-        return [TxtToken("have a"), token, TxtToken("active")]
+        if neg: return [neg, get_txt_token("have a"), token, get_txt_token("active")]
+        return [get_txt_token("have a"), token, get_txt_token("active")]
  
 def get_channeling_option(token, neg=None, args=[], target_self=False):
     if args:
         if neg: return [neg, token] + args
         return [token] + args
     else:
-        if neg: return [neg, token, TxtToken("any spell")]
-        return [token, TxtToken("any spell")]
+        if neg: return [neg, token, get_txt_token("any spell")]
+        return [token, get_txt_token("any spell")]
  
 def get_mod_option(token, neg=None, args=[], target_self=False):
     if args:
-        if neg: return [TxtToken("were"), neg, token, TxtToken("the")] + args
-        return [TxtToken("were"), token, TxtToken("the")] + args
+        if neg: return [get_txt_token("were"), neg, token, get_txt_token("the")] + args
+        return [get_txt_token("were"), token, get_txt_token("the")] + args
     else:
-        if neg: return [TxtToken("were"), neg, token, TxtToken("any modifier key down")]
-        return [token, TxtToken("a modifier key")]
+        if neg: return [get_txt_token("were"), neg, token, get_txt_token("any modifier key down")]
+        return [token, get_txt_token("a modifier key")]
 
 def get_btn_option(token, neg=None, args=[], target_self=False):
     # Augment the arg str--if its a num, it'll be of len 2 or less.
@@ -211,28 +211,28 @@ def get_btn_option(token, neg=None, args=[], target_self=False):
                 a.render_desc = "mouse button %s" % a.data
     if neg:
         token.render_desc = "activate this macro with"
-        return [TxtToken("did"), neg, token] + args
+        return [get_txt_token("did"), neg, token] + args
     return [token] + args
 
 def get_equipped_option(token, neg=None, args=[], target_self=False):
-    if neg: return [TxtToken("have"), neg, token] + args
-    return [TxtToken("have"), token] + args
+    if neg: return [get_txt_token("have"), neg, token] + args
+    return [get_txt_token("have"), token] + args
     
 def get_worn_option(token, neg=None, args=[], target_self=False):
-    if neg: return [TxtToken("are"), neg, token] + args
-    return [TxtToken("are"), token] + args
+    if neg: return [get_txt_token("are"), neg, token] + args
+    return [get_txt_token("are"), token] + args
 
 def get_bar_option(token, neg=None, args=[], target_self=False):
-    if neg: return [TxtToken("do"), neg, token] + args + [TxtToken("active")]
-    return [token] + args + [TxtToken("active")]
+    if neg: return [get_txt_token("do"), neg, token] + args + [get_txt_token("active")]
+    return [token] + args + [get_txt_token("active")]
 
 def get_pet_option(token, neg=None, args=[], target_self=False):
     if args:
-        if neg: return [TxtToken("do"), neg, token] + args + [TxtToken("out")]
-        return [token] + args + [TxtToken("out")]
+        if neg: return [get_txt_token("do"), neg, token] + args + [get_txt_token("out")]
+        return [token] + args + [get_txt_token("out")]
     else:
-        if neg: return [TxtToken("do"), neg, token, TxtToken("out")]
-        return [token, TxtToken("out")]
+        if neg: return [get_txt_token("do"), neg, token, get_txt_token("out")]
+        return [token, get_txt_token("out")]
 
 def get_group_option(token, neg=None, args=[], target_self=False):
     if args:
@@ -259,20 +259,20 @@ def get_assembled_parameter(params=[]):
     Parameter structure is [(toggle, parameter)...] or None.  Returns
     a list of TxtTokens.
     '''
-    if not params: return [TxtToken("nothing")]
+    if not params: return [get_txt_token("nothing")]
     param_list = []
     for toggle, param in params:
         if toggle:
             toggle.render_desc = "is not already active"
             toggle.render_space_after = False
-            param_list.extend([param, TxtToken("(if"), param, toggle, TxtToken(")")])
+            param_list.extend([param, get_txt_token("(if"), param, toggle, get_txt_token(")")])
         else: param_list.append(param)
     return param_list
 
 def get_who_params(params=[]):
     ''' Translate /who parameters. '''
     if params:
-        return [TxtToken('with attributes matching:')] + [p[1] for p in params]
+        return [get_txt_token('with attributes matching:')] + [p[1] for p in params]
     return params
     
 def get_roll_params(params=[]):
@@ -286,7 +286,7 @@ def get_roll_params(params=[]):
             return [TxtToken("between %s and %s" % tuple(bounds))]
     except:
         pass
-    return [TxtToken("between 1 and 100")]
+    return [get_txt_token("between 1 and 100")]
     
 def get_translated_chat_params(params=[]):
     ''' Given chat parameters, translate %t/%T appropiately. '''
@@ -307,7 +307,7 @@ def get_assembled_list_param(params=[], targets=[]):
     None.  Assigns each target to each parameter.  Returns a list of
     TxtTokens.  Returns [] unless accompanied by a target list.
     '''
-    param_list = [TxtToken("[", render_space_after=True)]
+    param_list = [get_txt_token("[", render_space_after=True)]
     idx = 0
     for toggle, param in params:
         p_tokens = []
@@ -316,19 +316,19 @@ def get_assembled_list_param(params=[], targets=[]):
         if toggle:
             toggle.render_desc = "is not already active"
             toggle.render_space_after = False
-            p_tokens = [param, TxtToken("(if"), param, toggle, TxtToken(")")]
+            p_tokens = [param, get_txt_token("(if"), param, toggle, get_txt_token(")")]
         else:
             p_tokens = [param]
         # Handle target token, if we got one and the param isn't empty.
         if targets and not param.attrs.is_empty:
             param.render_space_after = True
-            p_tokens.extend([TxtToken("on")] + targets[idx-1])
+            p_tokens.extend([get_txt_token("on")] + targets[idx-1])
         param_list.extend(p_tokens)
         if idx < len(params):
-            param_list[-1].render_space_after = False
-            param_list.append(TxtToken(","))
-    param_list[-1].render_space_after = True
-    param_list.append(TxtToken("]"))
+            param_list[-1] = set_render_space_after(param_list[-1], False)
+            param_list.append(get_txt_token(","))
+    param_list[-1] = set_render_space_after(param_list[-1], True)
+    param_list.append(get_txt_token("]"))
     return param_list
 
 def get_assembled_parameter_equipslot(params):
@@ -348,18 +348,18 @@ def get_assembled_parameter_equipslot(params):
         # Decode the slot token.
         if decode_wow_slot(slot.data):
             slot.render_desc = decode_wow_slot(slot.data)
-            slot_list = [TxtToken("as your"), slot]
+            slot_list = [get_txt_token("as your"), slot]
         else:
-            slot_list = [TxtToken("in equipment slot"), slot]
+            slot_list = [get_txt_token("in equipment slot"), slot]
                           
         # If we recognize this item, use wowhead to decode it's slot.
         # This can fail because wowhead data is spotty.
-        if item.found() and item.attrs.param_data_obj.is_item():
+        if item.found() and item.param_data_obj.is_item():
             # Make sure the slot we request is appropiate.
             # If not, keep the output as the slot requiested in the
             # macro, but display a warning with what slot the
             # item belongs in.
-            if not item.attrs.param_data_obj.test_item_slotid(int(slot.data)):
+            if not item.param_data_obj.test_item_slotid(int(slot.data)):
                 item.error_desc = item.get_render_desc()
                 decoded = decode_wow_slot(slot.data)
                 if not decoded:
@@ -375,17 +375,17 @@ def get_assembled_parameter_equipslot(params):
                              #[TxtToken(txt="%s" % decode_data_slot(item.slot()))])
                 
         # Create and return the description
-        return [TxtToken("your"), item] + slot_list
+        return [get_txt_token("your"), item] + slot_list
     else:
         slot, bag_id, bag_slot = [p for t,p in params]
         check_slot_token(slot)
         if decode_wow_slot(slot.data):
             slot.render_desc = decode_wow_slot(slot.data)
-            slot_list = [TxtToken("as your"), slot]
+            slot_list = [get_txt_token("as your"), slot]
         else:
-            slot_list = [TxtToken("in equipment slot"), slot]
+            slot_list = [get_txt_token("in equipment slot"), slot]
         bag_id.render_space_after = False
-        return [TxtToken("item from bag"), bag_id, TxtToken(", bag slot"), bag_slot] + slot_list
+        return [get_txt_token("item from bag"), bag_id, get_txt_token(", bag slot"), bag_slot] + slot_list
 
 def get_assembled_parameter_show(params):
     ''' Handle parameters for #show* commands. '''
@@ -394,7 +394,7 @@ def get_assembled_parameter_show(params):
     if len(params) == 2:
         bag_id, bag_slot = [p for t,p in params]
         bag_id.render_space_after = False
-        return [TxtToken("item in bag"), bag_id, TxtToken(", bag slot"), bag_slot]
+        return [get_txt_token("item in bag"), bag_id, get_txt_token(", bag slot"), bag_slot]
     else:
         param = params[0][1]
         if param.data_type is int:
@@ -402,9 +402,9 @@ def get_assembled_parameter_show(params):
             check_slot_token(param)
             if decode_wow_slot(param.data):
                 param.render_desc = decode_wow_slot(param.data)
-                return [TxtToken("item equipped as your"), param]
+                return [get_txt_token("item equipped as your"), param]
             else:
-                return [TxtToken("item in equipment slot"), param]
+                return [get_txt_token("item in equipment slot"), param]
         else:
             return [param]
 
@@ -416,23 +416,23 @@ def get_assembled_parameter_equip(params):
     if len(params) == 2:
         bag_id, bag_slot = [p for t,p in params]
         bag_id.render_space_after = False
-        return [TxtToken("item in bag"), bag_id, TxtToken(", bag slot"), bag_slot]
+        return [get_txt_token("item in bag"), bag_id, get_txt_token(", bag slot"), bag_slot]
     else:
-        return [TxtToken("your"), params[0][1]]
+        return [get_txt_token("your"), params[0][1]]
 
 def get_assembled_parameter_click(params):
     ''' Handle click params '''
     # Couple different otions: (str), (str, int, str), or (str,int).
     # This has already been verified for us.
-    if not params: return [TxtToken("nothing")]
+    if not params: return [get_txt_token("nothing")]
     if len(params) == 1:
-        return [TxtToken("button:"), params[0][1]]
+        return [get_txt_token("button:"), params[0][1]]
     if len(params) == 2:
         bar, num = [p for t,p in params]
-        return [TxtToken("button"), num, TxtToken("on"), bar]
+        return [get_txt_token("button"), num, get_txt_token("on"), bar]
     else:
         bar, num, mouse = [p for t,p in params]
-        return [TxtToken("button"), num, TxtToken("on"), bar, TxtToken("with"), mouse]
+        return [get_txt_token("button"), num, get_txt_token("on"), bar, get_txt_token("with"), mouse]
 
 def get_assembled_parameter_use(params):
     ''' Handle use params '''
@@ -442,22 +442,22 @@ def get_assembled_parameter_use(params):
         bag, slot = [p for t,p in params]
         bag.render_space_after = False
         slot.render_space_after = False
-        return [TxtToken("item in bag number"), bag, TxtToken(", bag slot number"), slot]
+        return [get_txt_token("item in bag number"), bag, get_txt_token(", bag slot number"), slot]
     else:
         item = [p for t,p in params][0]
         if item.data_type is int:
             if decode_wow_slot(item.data):
                 item.render_desc = decode_wow_slot(item.data)
-                return [TxtToken("your equipped"), item]
+                return [get_txt_token("your equipped"), item]
             else:
                 check_slot_token(item)
-                return [TxtToken("item in slot"), item]
-        return [TxtToken("your"), item]
+                return [get_txt_token("item in slot"), item]
+        return [get_txt_token("your"), item]
 
 
 def get_assembled_parameter_targeting(params):
     ''' Doctor up "nearest match" targeting. '''
-    return [TxtToken("visible unit with")] + [params[0][1]] + [TxtToken("anywhere in the unit name")]
+    return [get_txt_token("visible unit with")] + [params[0][1]] + [get_txt_token("anywhere in the unit name")]
 
 
 def get_assembled_parameter_cycle_target(params):
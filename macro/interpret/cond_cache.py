@@ -0,0 +1,168 @@
+'''
+Process-wide memo of interpreted condition phrases.
+
+The same condition blocks, i.e. [@mouseover,harm,nodead], turn up in
+command after command and macro after macro.  Each time, the
+interpreter groups the phrases by target, lexes the default targets
+and joins the phrases into English, and the result depends only on the
+tokens of the condition and a few traits of the verb.  So it is
+memoized on those, least recently used first.
+
+A cached entry is a template of the result: where the condition's own
+tokens go in it, the fixed text around them, and what interpreting the
+phrases changed on the condition's tokens (descriptions, warnings,
+strike-outs).  A hit applies the template to the tokens of the command
+at hand, so token ids and positions are that command's own.
+'''
+
+from macro.lex.cache           import LRUCache
+from macro.lex.token_base      import get_all_slots
+from macro.interpret.txt_token import SharedTxtToken
+
+
+# Default bound on the number of cached conditions.  A template is a
+# few k, so this is a few M at most.
+MAX_CACHED_CONDITIONS = 2000
+
+# The verb attributes interpreting phrases depends on.
+VERB_TRAITS = ('meta', 'def_target', 'takes_ext_target')
+
+# Token slots that say where a token is, rather than what it is.
+_POSITION_SLOTS = ('token_id', 'start', 'end', 'index')
+
+
+# Placeholders for tokens in a template: a token of the condition, by
+# offset, and the command verb.
+class _TokenRef(object):
+    __slots__ = ('offset',)
+    def __init__(self, offset):
+        self.offset = offset
+_VERB_REF = object()
+
+
+# Get the key for a condition.  tokens are the tokens of the
+# condition, from its [ to its ].  Their attrs are shared language
+# definitions, so are compared by identity.
+def get_cond_key(data_source, verb, tokens):
+    return (data_source,
+            tuple([getattr(verb.attrs, a) for a in VERB_TRAITS]),
+            tuple([(t.token_type, t.data, t.attrs, t.render_desc,
+                    t.js, t.strike, t.render_space_after) for t in tokens]))
+
+
+# Helper to get the state of each condition token, to diff against
+# after interpreting.
+def get_cond_state(tokens):
+    return [t.__getstate__() for t in tokens]
+
+
+# Helper to swap tokens for placeholders in a value, i.e. a warning
+# tuple.  Returns (value, True if anything was swapped).
+def _unbind(value, offsets, verb):
+    if isinstance(value, (tuple, list)):
+        swapped = False
+        values  = []
+        for v in value:
+            v, s = _unbind(v, offsets, verb)
+            values.append(v)
+            swapped = swapped or s
+        if not swapped: return (value, False)
+        if isinstance(value, tuple): values = tuple(values)
+        return (values, True)
+    if value is verb: return (_VERB_REF, True)
+    offset = offsets.get(id(value))
+    if offset is not None: return (_TokenRef(offset), True)
+    return (value, False)
+
+
+# Helper to swap placeholders for the tokens at hand.
+def _bind(value, tokens, lo, verb):
+    if isinstance(value, (tuple, list)):
+        values = [_bind(v, tokens, lo, verb) for v in value]
+        if isinstance(value, tuple): return tuple(values)
+        return values
+    if value is _VERB_REF: return verb
+    if isinstance(value, _TokenRef): return tokens[lo + value.offset]
+    return value
+
+
+# Helper to copy a token that is not one of the condition's own, for
+# holding in or handing out of a template.  Shared tokens are
+# read-only, so are used as-is.
+def _copy_literal(token, index=None):
+    if isinstance(token, SharedTxtToken): return token
+    token = token.copy()
+    if index is not None: token.index = index
+    return token
+
+
+def make_template(verb, tokens, before, render_list):
+    '''
+    Make a template from the interpretation of a condition.  tokens
+    are the condition's tokens, before their states from
+    get_cond_state before interpreting, and render_list the
+    interpretation.
+    '''
+    offsets = dict([(id(t), i) for i, t in enumerate(tokens)])
+    index   = tokens[0].index
+
+    # Where the condition's own tokens are in the interpretation, and
+    # copies of anything else.  Added tokens, i.e. default targets,
+    # take the index of the command they are in.
+    out = []
+    for t in render_list:
+        offset = offsets.get(id(t))
+        if offset is not None:
+            out.append((offset, None, False))
+        else:
+            out.append((None, _copy_literal(t), t.index == index))
+
+    # What interpreting changed on the condition's tokens.
+    changes = []
+    for i, t in enumerate(tokens):
+        slots  = get_all_slots(t.__class__)
+        after  = t.__getstate__()
+        change = []
+        for name, old, new in zip(slots, before[i], after):
+            # Anything set anew counts, even to an equal value, as the
+            # old value is not always part of the key.
+            if name in _POSITION_SLOTS or old is new: continue
+            new, swapped = _unbind(new, offsets, verb)
+            change.append((name, new, swapped))
+        if change: changes.append((i, tuple(change)))
+    return (tuple(out), tuple(changes))
+
+
+def apply_template(template, verb, tokens, lo):
+    '''
+    Apply a template to a condition whose tokens start at tokens[lo],
+    and return the interpretation.
+    '''
+    out, changes = template
+    for i, change in changes:
+        t = tokens[lo + i]
+        for name, value, swapped in change:
+            if swapped: value = _bind(value, tokens, lo, verb)
+            setattr(t, name, value)
+
+    index = tokens[lo].index
+    render_list = []
+    for offset, literal, rebind_index in out:
+        if offset is not None:
+            render_list.append(tokens[lo + offset])
+        elif rebind_index:
+            render_list.append(_copy_literal(literal, index))
+        else:
+            render_list.append(_copy_literal(literal))
+    return render_list
+
+
+class CondCache(LRUCache):
+    ''' Bounded LRU of condition key -> template. '''
+
+    def __init__(self, max_conditions=MAX_CACHED_CONDITIONS):
+        LRUCache.__init__(self, max_conditions)
+
+
+# The cache shared by every interpreter in this process.
+COND_CACHE = CondCache()
@@ -8,14 +8,16 @@ natural language output.
 import re
 
 from macro.lex.token           import create_token
-from macro.lex.ids             import TARGET_OBJ, OR
+from macro.lex.ids             import TARGET_OBJ, OR, COMMAND_VERB, META_COMMAND_VERB, PARAMETER, OPTION_WORD, OPTION_ARG
 from macro.logger              import logger
 from macro.exceptions          import *
 from macro.util                import NULL_TOKEN, valid
 from macro.parse.parser        import MacroParser
 from macro.interpret.obj       import InterpretedMacro,InterpretedMacroCommand
-from macro.interpret.txt_token import TxtToken
+from macro.interpret.txt_token import TxtToken, get_txt_token, set_render_space_after
 from macro.interpret.errors    import *
+from macro.interpret.line_cache import LINE_CACHE, get_line_key
+from macro.interpret.cond_cache import COND_CACHE, get_cond_key, get_cond_state, make_template, apply_template
 from macro.data.wow            import *
 
 ''' What external data source to use when interpreting.
@@ -26,12 +28,50 @@ DATA_SOURCE = SOURCE_DATASTORE
 
 # Small helper function for testing.
 def get_test_mi(debug=True, test=True, lookup=False):
-    global DATA_SOURCE
     if not lookup:
-        DATA_SOURCE = SOURCE_TEST
+        return MacroInterpreter(debug, test, data_source=SOURCE_TEST)
     return MacroInterpreter(debug, test)
 
 
+class InterpretContext:
+    '''InterpretContext
+
+    All of the state for interpreting a single macro.  A new context
+    is created for each call to MacroInterpreter.interpret_macro and
+    passed down the interpretation methods, so one MacroInterpreter
+    can interpret many macros at once.
+    '''
+    def __init__(self, macro, parser, param_cache=None):
+        # The InterpretedMacro being built.
+        self.int_macro = InterpretedMacro(macro)
+
+        # The command currently being interpreted.
+        self.new_cmd = None
+
+        # Parser (and so lexer) for this macro only.
+        self.parser = parser
+
+        # GCD flag tracker, cleared per command.
+        self.gcd_map = {}
+
+        # Not recognized tracker, cleared per command.
+        self.unrec_map = {}
+
+        # Track the number of commands in the macro we've recieved.
+        self.num_macro_commands = 0
+
+        # Some commands can only be used once per macro.  Track this.
+        self.single_use_cmd_seen = {}
+
+        # Some verbs have related sets where only one in the set
+        # can be used.  Track this.
+        self.related_use_cmd_seen = {}
+
+        # Init the param cache, unless we were given one to share.
+        if param_cache is None: param_cache = {}
+        self.param_cache = param_cache
+
+
 class MacroInterpreter:
     '''MacroInterpreter
 
@@ -52,57 +92,36 @@ class MacroInterpreter:
     up this command.
     '''
     # Create an interpeter object.
-    def __init__(self, DEBUG=False, TEST=False):
+    def __init__(self, DEBUG=False, TEST=False, data_source=None):
         ''' Constructor '''
         self.DEBUG = DEBUG
         self.TEST  = TEST
-        self.setup()
-
-
-    # Init the interpreter to parse a macro.
-    def setup(self):
-        # Handle to InterpretedMacro objects.
-        self.__int_macro = None
-
-        # GCD flag tracker 
-        self.__gcd_map = {}
+        self.data_source = DATA_SOURCE if data_source is None else data_source
 
-        # Not recognized tracker
-        self.__unrec_map = {}
-
-        # Ref to macro obj.
+        # The last macro interpreted, for __str__ only.
         self.__int_macro = None
 
-        # Track the number of commands in the macro we've recieved.
-        self.__num_macro_commands = 0
-
-        # Some commands can only be used once per macro.  Track this.
-        self.__single_use_cmd_seen = {}
-
-        # Some verbs have related sets where only one in the set
-        # can be used.  Track this.
-        self.__related_use_cmd_seen = {}
-
-        # Init the param cache
-        self.__param_cache         = {}
+        # Memo of interpreted conditions, shared by default.
+        self.cond_cache = COND_CACHE
 
 
     # Entry point for processing a macro.
-    def interpret_macro(self, macro='', parser=None):
+    def interpret_macro(self, macro='', parser=None, param_cache=None):
         '''
         Takes in a macro, splits it into commands, and interprets each
-        command, storing interpretation state in this object.
+        command.  All interpretation state is kept in a new
+        InterpretContext, so this is safe to call from many threads.
+        A param_cache dict can be passed in to share parameter lookups
+        across calls.
         
         Returns:
         Ref to InterpretedMacro object.
         '''
-        # Set up to parse a new macro.
-        self.setup()
-        self.curr_macro            = macro
-        self.__int_macro           = InterpretedMacro(macro)
-        
-        # Get a parser object
-        self.parser = parser or MacroParser(debug=self.DEBUG)
+        # Set up to parse a new macro, with a parser of its own.
+        ctx = InterpretContext(macro,
+                               parser or MacroParser(debug=self.DEBUG),
+                               param_cache)
+        self.__int_macro = ctx.int_macro
 
         # Make sure we have input--this should be done above this level.
         if not valid(macro):
@@ -119,10 +138,15 @@ class MacroInterpreter:
             # Get rid of empty lines--and remember that we "changed" the macro
             # by dropping them.
             if len(macro_line) == 0 or macro_line.isspace():
-                self.__int_macro.macro_changed = True
+                ctx.int_macro.macro_changed = True
                 continue
             valid_macro_lines.append(macro_line)
-            self.__num_macro_commands = len(valid_macro_lines)
+            ctx.num_macro_commands = len(valid_macro_lines)
+
+        # Sources that can batch lookups get all the parameters up
+        # front, in one batch.
+        if self.data_source in BATCH_SOURCES and cmd_len <= MAX_LEN_ALLOWED:
+            self.__prefetch_params(ctx, valid_macro_lines)
 
         # Iterate and interpret macro, splitting on /r and /n
         for i, macro_line in enumerate(valid_macro_lines):
@@ -134,101 +158,221 @@ class MacroInterpreter:
             # Get rid of empty lines--and remember that we "changed" the macro
             # by dropping them.
             if len(macro_line) == 0 or macro_line.isspace():
-                self.__int_macro.macro_changed = True
+                ctx.int_macro.macro_changed = True
                 continue
 
-            # Init for a new macro command.
-            self.__init_new_command(macro_line)
-    
-            # Lex and parse the macro line.
-            # Then inteperet the resulting parse tree.
-            try:
-                parse_tree = self.parser.lex_and_parse_macro(macro_line, i)
-                self.interpret_macro_command(parse_tree)
-
-                # Lexer error
-            except LexerError, instance:
-                start = instance.get_start()
-                end   = instance.get_end()
-                msg   = "%s" % instance
-                
-                # Generate some fake tokens so we can show the error at the
-                # correct location.
-                beg_tok  = create_token(token_type=NULL_TOKEN, data=macro_line[:start],    token_id=0, index=i)
-                prob_tok = create_token(token_type=NULL_TOKEN, data=macro_line[start:end], token_id=1, index=i)
-                end_tok  = create_token(token_type=NULL_TOKEN, data=macro_line[end:],      token_id=2, index=i)
-
-                # Save lexer error at the problem input
-                prob_tok.error = (msg,)
-
-                # Turn on errors/js/highlighting for the error tok.
-                prob_tok.js = True
-                prob_tok.highlight = True
-                
-                # Save the command for display.
-                self.__save_command([beg_tok, prob_tok, end_tok])
-                
-                # Report error on interpretation side.
-                self.__save_interpret([TxtToken(txt=LEXER_ERROR)])
-                
-                # Save the raw command as the "clean" one since we
-                # have no idea what to do with it.
-                self.__save_clean_raw_command(macro_line)
-                
-                # Mark that this macro has issues
-                self.__int_macro.macro_good = False
-                self.__new_cmd.error = True
+            # Lex, parse and interpret the line.
+            self.__interpret_line(ctx, i, macro_line)
+            
+        # Add in the newlines to the macro length so that it is reported
+        # correctly.
+        ctx.int_macro.macro_len += ctx.num_macro_commands - 1
+            
+        # Done, return macro object.
+        return ctx.int_macro
 
-                if self.TEST: raise
-                continue
 
-            # Critical error.  Return. 
-            except OtherError, instance:
-                raise InitError("Error executing lexing engine.  Valid input?")
+    # Entry point for live editing.
+    def interpret_macro_incremental(self, macro='', line_cache=None, parser=None):
+        '''
+        Interprets a macro just as interpret_macro does, but reuses
+        the results for lines interpreted before, so that a macro can
+        be re-interpreted on every edit.  Only lines that changed, or
+        whose context did, are interpreted again.
+
+        A line depends on the rest of the macro only through its
+        position, whether it is the last line (for GCD warnings) and
+        which single-use and related verbs came before it, so cached
+        lines are keyed on those along with the text of the line.
+        line_cache defaults to the process-wide LINE_CACHE.
+
+        Returns (InterpretedMacro, [line key for each command]).  The
+        line keys change whenever a line's interpretation could, so
+        callers can tell which lines to redraw.
+        '''
+        if line_cache is None: line_cache = LINE_CACHE
+        ctx = InterpretContext(macro,
+                               parser or MacroParser(debug=self.DEBUG))
+        self.__int_macro = ctx.int_macro
 
-            # Error parsing or interpreting the macro command
-            except (ParserError, InterpretError), instance:
-                cmd   = instance.cmd
-                token = instance.get_token()
-                msg   = instance
-                if token: token.error = ("%s", instance.get_render_list())
+        # Make sure we have input--this should be done above this level.
+        if not valid(macro):
+            raise InitError("No valid macro input.")
 
-                # Since the command lexed, we can save it out properly for display.
-                self.__save_command(self.parser.get_tokens())
-                
-                # Report error on interpretation side.
-                self.__save_interpret([TxtToken(txt=PARSER_ERROR)])
-                
-                # Save the lexed, cleaned command
-                self.__save_clean_raw_command(self.parser.get_command_str(), macro_line)
-        
-                # Mark that this macro has issues
-                self.__int_macro.macro_good = False
-                self.__new_cmd.error = True
-                if self.TEST: raise
+        # Split up the macro as interpret_macro does.
+        macro_lines = re.compile("\r*\n+").split(macro)
+        cmd_len = len('\n'.join(macro_lines))
+        valid_macro_lines = [l for l in macro_lines if len(l) > 0 and not l.isspace()]
+        if len(valid_macro_lines) < len(macro_lines):
+            ctx.int_macro.macro_changed = True
+        ctx.num_macro_commands = len(valid_macro_lines)
+        if valid_macro_lines and cmd_len > MAX_LEN_ALLOWED:
+            raise MacroLenError(MACRO_LEN_ERROR % (cmd_len, MAX_LEN_ALLOWED))
+
+        # Lines are interpreted into a macro of their own, and then
+        # folded into this one.
+        int_macro = ctx.int_macro
+        line_keys = []
+        single_use, related_use = (), ()
+        for i, macro_line in enumerate(valid_macro_lines):
+            key = (self.data_source, macro_line, i, i + 1 == ctx.num_macro_commands,
+                   single_use, related_use)
+            entry = line_cache.get(key)
+            if entry is None:
+                entry = self.__interpret_line_alone(ctx, i, macro_line, single_use, related_use)
+                line_cache.put(key, entry)
+            (cmd, macro_changed, macro_good, macro_len, single_use, related_use) = entry
+
+            # Fold the line into the macro.
+            int_macro.add_cmd(cmd)
+            int_macro.macro_changed = int_macro.macro_changed or macro_changed
+            int_macro.macro_good    = int_macro.macro_good and macro_good
+            int_macro.macro_len    += macro_len
+            line_keys.append(get_line_key(key))
+
+        # Add in the newlines to the macro length, as interpret_macro
+        # does.
+        int_macro.macro_len += ctx.num_macro_commands - 1
+        return (int_macro, line_keys)
+
+
+    # Helper for interpret_macro_incremental: interpret a single line
+    # with the given single-use and related verbs seen before it.  The
+    # line gets a parameter cache of its own, so that what it looks
+    # up can't depend on other lines.  Returns (InterpretedMacroCommand, macro_changed, macro_good,
+    # macro_len, single_use, related_use), with the verbs seen after
+    # it.
+    def __interpret_line_alone(self, ctx, index, macro_line, single_use, related_use):
+        ctx.int_macro = InterpretedMacro(ctx.int_macro.macro)
+        ctx.single_use_cmd_seen  = dict.fromkeys(single_use, True)
+        ctx.related_use_cmd_seen = dict.fromkeys(related_use, True)
+        ctx.param_cache          = {}
+        if self.data_source in BATCH_SOURCES:
+            self.__prefetch_params(ctx, [macro_line])
+        self.__interpret_line(ctx, index, macro_line)
+        return (ctx.int_macro.last(),
+                ctx.int_macro.macro_changed,
+                ctx.int_macro.macro_good,
+                ctx.int_macro.macro_len,
+                tuple(sorted(ctx.single_use_cmd_seen.keys())),
+                tuple(sorted(ctx.related_use_cmd_seen.keys())))
+
+
+    # Entry point for processing many macros.
+    def interpret_macros(self, macros):
+        '''
+        Takes an iterable of macros and interprets each one in turn.
+        This is a generator: results are yielded as each macro is
+        done, as (macro, InterpretedMacro, error) tuples.  If the macro
+        could not be interpreted at all (i.e. it was empty or too
+        long) the InterpretedMacro is None and error is the exception.
+
+        One parser and one parameter cache are shared across the
+        batch, so each spell or item is looked up once.  The test
+        source answers with the spelling it was asked for, so a shared
+        cache would make one macro's results depend on the macros
+        before it; with it, each macro gets a cache of its own.
+        '''
+        parser      = MacroParser(debug=self.DEBUG)
+        param_cache = {}
+        for macro in macros:
+            if self.data_source == SOURCE_TEST: param_cache = {}
+            try:
+                int_macro = self.interpret_macro(macro, parser, param_cache)
+            except OtherError, instance:
+                yield (macro, None, instance)
                 continue
+            yield (macro, int_macro, None)
+
 
-            # Save the lexed tokens for rendering.
-            self.__save_command(self.parser.get_tokens())
+    # Lex, parse and interpret a single line of a macro, saving the
+    # results in the context as command number index.
+    def __interpret_line(self, ctx, index, macro_line):
+        # Init for a new macro command.
+        self.__init_new_command(ctx, macro_line, index)
+
+        # Lex and parse the macro line.
+        # Then inteperet the resulting parse tree.
+        try:
+            parse_tree = ctx.parser.lex_and_parse_macro(macro_line, index)
+            self.interpret_macro_command(ctx, parse_tree)
+
+            # Lexer error
+        except LexerError, instance:
+            start = instance.get_start()
+            end   = instance.get_end()
+            msg   = "%s" % instance
             
-            # Save cleaned raw command, and whether we cleaned anything.
-            clean_cmd_str = self.parser.get_command_str()
-            self.__save_clean_raw_command(clean_cmd_str, macro_line)
+            # Generate some fake tokens so we can show the error at the
+            # correct location.
+            beg_tok  = create_token(token_type=NULL_TOKEN, data=macro_line[:start],    token_id=0, index=index)
+            prob_tok = create_token(token_type=NULL_TOKEN, data=macro_line[start:end], token_id=1, index=index)
+            end_tok  = create_token(token_type=NULL_TOKEN, data=macro_line[end:],      token_id=2, index=index)
+
+            # Save lexer error at the problem input
+            prob_tok.error = (msg,)
+
+            # Turn on errors/js/highlighting for the error tok.
+            prob_tok.js = True
+            prob_tok.highlight = True
             
-        # Add in the newlines to the macro length so that it is reported
-        # correctly.
-        self.__int_macro.macro_len += self.__num_macro_commands - 1
+            # Save the command for display.
+            self.__save_command(ctx, [beg_tok, prob_tok, end_tok])
             
-        # Done, return macro object.
-        return self.__int_macro
+            # Report error on interpretation side.
+            self.__save_interpret(ctx, [get_txt_token(LEXER_ERROR)])
+            
+            # Save the raw command as the "clean" one since we
+            # have no idea what to do with it.
+            self.__save_clean_raw_command(ctx, macro_line)
+            
+            # Mark that this macro has issues
+            ctx.int_macro.macro_good = False
+            ctx.new_cmd.error = True
+
+            if self.TEST: raise
+            return
+
+        # Critical error.  Return. 
+        except OtherError, instance:
+            raise InitError("Error executing lexing engine.  Valid input?")
+
+        # Error parsing or interpreting the macro command
+        except (ParserError, InterpretError), instance:
+            cmd   = instance.cmd
+            token = instance.get_token()
+            msg   = instance
+            if token: token.error = ("%s", instance.get_render_list())
+
+            # Since the command lexed, we can save it out properly for display.
+            self.__save_command(ctx, ctx.parser.get_tokens())
+            
+            # Report error on interpretation side.
+            self.__save_interpret(ctx, [get_txt_token(PARSER_ERROR)])
+            
+            # Save the lexed, cleaned command
+            self.__save_clean_raw_command(ctx, ctx.parser.get_command_str(), macro_line)
+    
+            # Mark that this macro has issues
+            ctx.int_macro.macro_good = False
+            ctx.new_cmd.error = True
+            if self.TEST: raise
+            return
+
+        # Save the lexed tokens for rendering.
+        self.__save_command(ctx, ctx.parser.get_tokens())
+        
+        # Save cleaned raw command, and whether we cleaned anything.
+        clean_cmd_str = ctx.parser.get_command_str()
+        self.__save_clean_raw_command(ctx, clean_cmd_str, macro_line)
 
 
     # Entry point for interpreting a command.  This takes a parse tree
     # for a single command and interprets it.
-    def interpret_macro_command(self, command_obj):
+    def interpret_macro_command(self, ctx, command_obj):
         '''
         Takes the parse tree for a single command and interprets it,
-        saving the results internally.
+        saving the results in the context.
         
         Functions down the chain can throw exceptions.
         '''
@@ -238,21 +382,21 @@ class MacroInterpreter:
         # If this is a single-use verb (i.e. targetenemy), have we already
         # seen it previously in a macro?
         if verb.attrs.only_usable_once:
-            if verb.data in self.__single_use_cmd_seen:
+            if verb.data in ctx.single_use_cmd_seen:
                 # Whoops, yup.
                 raise InterpetErrorSingleUseCommandViolated(verb)
-            self.__single_use_cmd_seen[verb.data] = True
+            ctx.single_use_cmd_seen[verb.data] = True
 
         # If this is part of a group where only one can be used.
         # check.
         if verb.attrs.related:
             for v in verb.attrs.related:
-                if v in self.__related_use_cmd_seen:
+                if v in ctx.related_use_cmd_seen:
                     # Whoops, yup. Mark this command as useless.
                     verb.error = (WARN_RELATED_COMMAND, [verb], [TxtToken(v)])
-                    self.parser.mark_tokens_useless(verb.token_id)
+                    ctx.parser.mark_tokens_useless(verb.token_id)
                     return
-            self.__related_use_cmd_seen[verb.data] = True
+            ctx.related_use_cmd_seen[verb.data] = True
 
         # Need to go through each of the objects and interpret each one,
         # applying the verb and modifier to each set of parameters.
@@ -261,7 +405,7 @@ class MacroInterpreter:
 
             # Eval the object, all objects after the first one get "else"
             # prepended to conditions.
-            evals_to_true = self.__interpret_cmd_object(obj, verb, (i > 0))
+            evals_to_true = self.__interpret_cmd_object(ctx, obj, verb, (i > 0))
             if self.DEBUG: logger.debug("evals: %s, i: %s, prev_evals: %s" \
                                         % (evals_to_true, i, prev_evals_to_true))
 
@@ -276,7 +420,7 @@ class MacroInterpreter:
                     next_else_token, next_conds, next_mod, next_param = \
                                      objects[i + 1]
                     # Mark the tokens as useless from the else on.
-                    self.parser.mark_tokens_useless(next_else_token.token_id)
+                    ctx.parser.mark_tokens_useless(next_else_token.token_id)
 
                     # Go through the token queue for this command and
                     # add a warning for all useless characters.  Right
@@ -285,7 +429,7 @@ class MacroInterpreter:
                     # cleaner way to rewrite the below.
                     useless_groups = []
                     accum = []
-                    for t in self.parser.get_tokens():
+                    for t in ctx.parser.get_tokens():
                         if t.strike: accum.append(t)
                         elif len(accum) > 0:
                             useless_groups.append(accum)
@@ -311,36 +455,63 @@ class MacroInterpreter:
     #
     # Internal Methods
     #
-    
-    def __init_new_command(self, macro, interpret=None):
+
+    # Lex every line and look up all the spells and items that could
+    # be needed, filling the parameter cache.  This over-collects a
+    # little, i.e. items for verbs that take either, and lines that
+    # later fail to parse; anything missed is looked up as usual.
+    def __prefetch_params(self, ctx, macro_lines):
+        lookups = []
+        for i, macro_line in enumerate(macro_lines):
+            try:
+                ctx.parser.lex_macro(macro_line, i)
+            except (LexerError, OtherError):
+                continue
+            verb = None
+            word = None
+            for t in ctx.parser.get_tokens():
+                if t.is_type(COMMAND_VERB) or t.is_type(META_COMMAND_VERB):
+                    verb = t
+                elif t.is_type(OPTION_WORD):
+                    word = t
+                elif t.is_type(PARAMETER) and t.data_type is str and verb and verb.attrs and \
+                         verb.attrs.secure and not verb.attrs.takes_units:
+                    if verb.attrs.takes_item:  lookups.append((t.data, True))
+                    if verb.attrs.takes_spell: lookups.append((t.data, False))
+                elif t.is_type(OPTION_ARG) and word and word.attrs and word.attrs.can_take_spell:
+                    lookups.append((t.data, False))
+        get_wow_objects(lookups, src=self.data_source, cache=ctx.param_cache)
+
+    def __init_new_command(self, ctx, macro, index=None):
         ''' Add a record for a new command. '''
 
         # Clear interpretation maps
-        self.__gcd_map     = {}
-        self.__unrec_map = {}
+        ctx.gcd_map     = {}
+        ctx.unrec_map = {}
 
         # Insert a new command structure
-        self.__new_cmd = InterpretedMacroCommand(cmd=macro,
-                                                 index=len(self.__int_macro))
-        self.__int_macro.add_cmd(self.__new_cmd)
+        if index is None: index = len(ctx.int_macro)
+        ctx.new_cmd = InterpretedMacroCommand(cmd=macro,
+                                                 index=index)
+        ctx.int_macro.add_cmd(ctx.new_cmd)
 
-    def __save_interpret(self, do_list, if_list=[]):
+    def __save_interpret(self, ctx, do_list, if_list=[]):
         ''' Save an interpretation for this macro in (if,do) tuples,
         where if and do are lists of tokens for rendering.'''
-        self.__new_cmd.interpret.append((if_list, do_list))
+        ctx.new_cmd.interpret.append((if_list, do_list))
 
-    def __save_command(self, tok_list):
+    def __save_command(self, ctx, tok_list):
         ''' Save a macro command as a tuple of tokens to be rendered. '''
-        self.__new_cmd.cmd_list = tok_list
+        ctx.new_cmd.cmd_list = tok_list
 
-    def __save_clean_raw_command(self, cmd_str, orig_raw_cmd=None):
+    def __save_clean_raw_command(self, ctx, cmd_str, orig_raw_cmd=None):
         ''' Save a macro command string.  Also save whether a macro
         command changed or not.  Add to the macro len, considering
         only the cleaned version and a newline character.'''
-        self.__new_cmd.cmd_str = cmd_str
+        ctx.new_cmd.cmd_str = cmd_str
         if orig_raw_cmd and cmd_str != orig_raw_cmd:
-            self.__int_macro.macro_changed = True
-        self.__int_macro.macro_len += (len(cmd_str) + 1)
+            ctx.int_macro.macro_changed = True
+        ctx.int_macro.macro_len += (len(cmd_str) + 1)
 
     # For testing only
     def __str__(self):
@@ -359,7 +530,7 @@ class MacroInterpreter:
     #
 
     # Handle a command object.
-    def __interpret_cmd_object(self, obj, verb, add_else=False):
+    def __interpret_cmd_object(self, ctx, obj, verb, add_else=False):
         '''
         Consumes a command object from the parse tree.    Adds output to
         internal state.    Returns True if there were no conditions
@@ -370,13 +541,13 @@ class MacroInterpreter:
 
         # If we have no conditions, just interpret the verb.
         if conditions is None:
-            render_list = self.__interpret_verb(verb, mod, param, target=None)
+            render_list = self.__interpret_verb(ctx, verb, mod, param, target=None)
             if add_else:
                 else_token.render_desc = "Otherwise:"
                 else_token.render_space_after = False
-                self.__save_interpret(render_list, [else_token])
+                self.__save_interpret(ctx, render_list, [else_token])
             else:
-                self.__save_interpret(render_list)
+                self.__save_interpret(ctx, render_list)
             return True
         
         # Each condition really drives what gets passed to the command
@@ -396,7 +567,7 @@ class MacroInterpreter:
             # interpret_condition returns the endif token if the condition
             # was empty so that we can assign an error to it if nec.
             endif_token = \
-                self.__interpret_condition(cond, verb, mod, param, condition_map, add_else)
+                self.__interpret_condition(ctx, cond, verb, mod, param, condition_map, add_else)
             if endif_token is not None:
                 # We have an empty condition.  If there are any other
                 # conditions, they should not be here.
@@ -405,14 +576,14 @@ class MacroInterpreter:
                     # and ending including the last endif
                     start = self.__unpack_condition(conditions[i + 1])[1]
                     end     = self.__unpack_condition(conditions[-1])[3]
-                    self.parser.mark_tokens_useless(start.token_id, end.token_id+1)
+                    ctx.parser.mark_tokens_useless(start.token_id, end.token_id+1)
                     endif_token.warn = (WARN_UNUSED_CONDITIONS, [verb])
                 return True
         return False
     
         
     # Handle a conditional
-    def __interpret_condition(self, cond, verb, mod, param, condition_map, add_else=False):
+    def __interpret_condition(self, ctx, cond, verb, mod, param, condition_map, add_else=False):
         '''
         Consume a condition, adding output from its interprtaion to
         internal state.    Returns None if the condition had phrases,
@@ -423,12 +594,12 @@ class MacroInterpreter:
         if self.DEBUG: logger.debug("TARGET: %s COND: %s" % (target, cond))
 
         # Get the command verb output for this condition.
-        verb_render_list = self.__interpret_verb(verb, mod, param, target)
+        verb_render_list = self.__interpret_verb(ctx, verb, mod, param, target)
 
         # If there's no condition to evaluate, save the verb
         # interpretation and return.
         if not if_token:
-            self.__save_interpret(verb_render_list)
+            self.__save_interpret(ctx, verb_render_list)
             return None
 
         # Evaluate the phrases in the condition and save.
@@ -440,18 +611,19 @@ class MacroInterpreter:
             if phrases is None:
                 if add_else:
                     if_token.render_desc = "Otherwise:"
-                    self.__save_interpret(verb_render_list,
+                    self.__save_interpret(ctx, verb_render_list,
                                           [if_token])
                 else:
-                    self.__save_interpret(verb_render_list)
+                    self.__save_interpret(ctx, verb_render_list)
             else:
                 endif_token.render_desc = "then:"
                 endif_token.render_space_after = False
                 if self.DEBUG: logger.debug("About to interpret phrases.")
-                phrase_render_list = self.__interpret_phrases(verb, phrases, target) + [endif_token]
+                phrase_render_list = self.__interpret_cond_phrases(ctx, verb, phrases, target,
+                                                                   if_token, endif_token) + [endif_token]
                 if add_else:
                     if_token.render_desc = "if"
-                    if_render_list = [TxtToken(txt="Else,"), if_token] + phrase_render_list
+                    if_render_list = [get_txt_token("Else,"), if_token] + phrase_render_list
                 else:
                     if_token.render_desc = "If"
                     if_render_list = [if_token] + phrase_render_list
@@ -465,7 +637,7 @@ class MacroInterpreter:
             if condition_key in condition_map:
                 # Oops.  Repeat condition.  Cut out extra tokens and
                 # add error.
-                self.parser.mark_tokens_useless(start=if_token.token_id,
+                ctx.parser.mark_tokens_useless(start=if_token.token_id,
                                                 end=endif_token.token_id+1)
                 endif_token.warn = (WARN_REPEATED_CONDITION,)
                 return
@@ -473,7 +645,7 @@ class MacroInterpreter:
 
         # Only save if there were phrases to save.
         if phrases is not None:
-            self.__save_interpret(verb_render_list, if_render_list)
+            self.__save_interpret(ctx, verb_render_list, if_render_list)
             return None
         # Otherwise, return the endif for error assignment.
         else:
@@ -481,7 +653,7 @@ class MacroInterpreter:
 
 
     # Command verb
-    def __interpret_verb(self, verb, mod, param, target):
+    def __interpret_verb(self, ctx, verb, mod, param, target):
         '''
         Interpret a command verb, including its modifier, target,
         and parameter.    Returns a string interpretation.
@@ -500,16 +672,16 @@ class MacroInterpreter:
                 if p.data_type is int: continue # Only look up str
                 p_obj = None
                 if verb.attrs.takes_item:
-                    p_obj = get_wow_object(p.data, is_item=True, src=DATA_SOURCE, cache=self.__param_cache)
+                    p_obj = get_wow_object(p.data, is_item=True, src=self.data_source, cache=ctx.param_cache)
                 if not p_obj and verb.attrs.takes_spell:
-                    p_obj = get_wow_object(p.data, src=DATA_SOURCE, cache=self.__param_cache)
+                    p_obj = get_wow_object(p.data, src=self.data_source, cache=ctx.param_cache)
                 if p_obj:
-                    p.attrs.param_data_obj = p_obj
+                    p.param_data_obj = p_obj
                     p.render_desc = p_obj.get_name()
                     p.wowhead = True
                     
             # Add any GCD warnings and interpret
-            self.__add_gcd_warnings(verb, param)
+            self.__add_gcd_warnings(ctx, verb, param)
             param_render_list = verb.attrs.param_function(param)
         elif not verb.attrs.secure and param:
             # Interpret parameters for insecure verbs
@@ -522,7 +694,7 @@ class MacroInterpreter:
                 # The parser takes care of illegal verb
                 # forms for us, so this is in the case of a trailing
                 # ";".
-                req_param = [(None, TxtToken("nothing"))]
+                req_param = [(None, get_txt_token("nothing"))]
             param_render_list = verb.attrs.param_function(req_param)
 
 
@@ -546,19 +718,19 @@ class MacroInterpreter:
                     # the param as a target.
                     if verb.attrs.interp_target:
                         target_render_list = \
-                          self.__interpret_param_as_target(verb, param)
+                          self.__interpret_param_as_target(ctx, verb, param)
                     else:
                         # Take the first parameter verbatim
                         target_render_list = [param[0][1]]
                 # Otherwise get the default target
                 else:
                     target_render_list = \
-                        self.__interpret_target(self.parser.get_default_target(verb.attrs.def_target),
+                        self.__interpret_target(ctx, ctx.parser.get_default_target(verb.attrs.def_target),
                                                 verb, js=False)
             elif target:
                 # Otherwise, the unit in the parameters is ignored.
                 # Render and add a warning if there's a param.
-                target_render_list = self.__interpret_target(target, verb, js=False)
+                target_render_list = self.__interpret_target(ctx, target, verb, js=False)
                 if param:
                     target[0].warn = (WARN_NOT_KEY_UNIT,
                                       verb.attrs.param_function(param),
@@ -568,17 +740,17 @@ class MacroInterpreter:
         # If we're incorporating the target into the verb string,
         # don't include highlights
         elif verb.attrs.alt_desc and target:
-            target_render_list = self.__interpret_target(target, verb, js=False)
+            target_render_list = self.__interpret_target(ctx, target, verb, js=False)
         # If this is a list verb that requires an external target, assign a
         # target per parameter and re-render the target list in the
         # parameter function
         elif param and verb.attrs.takes_ext_target and verb.attrs.takes_list:
             targets = []
             for t,p in param:
-                if p.attrs.self_only or (p.found() and p.attrs.param_data_obj.self_only()):
-                    targets.append([TxtToken(txt="yourself")])
+                if p.attrs.self_only or (p.found() and p.param_data_obj.self_only()):
+                    targets.append([get_txt_token("yourself")])
                 else:
-                    targets.append(self.__interpret_target(target, verb))
+                    targets.append(self.__interpret_target(ctx, target, verb))
             param_render_list = verb.attrs.param_function(param, targets)
         # Otherwise, just render the target as-is.
         elif verb.attrs.req_target:
@@ -587,10 +759,10 @@ class MacroInterpreter:
             # Note that we're sure this is not a list param here.
             if param:
                 t,p = param[0]
-                if p.attrs.self_only or (p.found() and p.attrs.param_data_obj.self_only()):
-                    target_render_list = [TxtToken(txt="yourself")]
+                if p.attrs.self_only or (p.found() and p.param_data_obj.self_only()):
+                    target_render_list = [get_txt_token("yourself")]
             if not target_render_list:
-                target_render_list = self.__interpret_target(target, verb)
+                target_render_list = self.__interpret_target(ctx, target, verb)
 
 
         if self.DEBUG: logger.debug("target_render_list: %s" % target_render_list)
@@ -617,7 +789,7 @@ class MacroInterpreter:
                         mod_arg.render_desc = "this macro is activated with the %s down" % mod_arg.data
                         mod_render_list.append([mod_arg])                    
                     else:
-                        mod_render_list.append([TxtToken("if"), mod_arg])
+                        mod_render_list.append([get_txt_token("if"), mod_arg])
                 else:
                     # Oops, invalid argument.  Interpret error!
                     raise InterpetErrorInvalidResetOption(mod_arg)
@@ -637,8 +809,33 @@ class MacroInterpreter:
         return final_render_list
 
 
+    # Phrases, memoized.
+    def __interpret_cond_phrases(self, ctx, verb, phrases, target, if_token, endif_token):
+        '''
+        Interpret the phrases of a condition, as __interpret_phrases
+        does, reusing the interpretation of an identical condition
+        from the condition cache if there is one.  Not cached in debug
+        mode, so that logging still happens.
+        '''
+        if self.DEBUG or self.cond_cache is None:
+            return self.__interpret_phrases(ctx, verb, phrases, target)
+
+        # The condition's tokens, from [ to ].
+        tokens = ctx.parser.get_tokens()
+        lo, hi = if_token.token_id, endif_token.token_id + 1
+        key = get_cond_key(self.data_source, verb, tokens[lo:hi])
+        template = self.cond_cache.get(key)
+        if template is not None:
+            return apply_template(template, verb, tokens, lo)
+
+        before = get_cond_state(tokens[lo:hi])
+        render_list = self.__interpret_phrases(ctx, verb, phrases, target)
+        self.cond_cache.put(key, make_template(verb, tokens[lo:hi], before, render_list))
+        return render_list
+
+
     # Phrases
-    def __interpret_phrases(self, verb, phrases, target):
+    def __interpret_phrases(self, ctx, verb, phrases, target):
         '''
         Helper to handle phrase output for conditionals
         Returns a list of renderable tokens.
@@ -692,15 +889,15 @@ class MacroInterpreter:
             tgt_join = []
             if not word.attrs.ext_target:
                 # Option refers to self only, get default target of "you"
-                tgt = tuple(self.__interpret_target())
-                if word.attrs.req_join: tgt_join = [TxtToken(txt="are")]
+                tgt = tuple(self.__interpret_target(ctx))
+                if word.attrs.req_join: tgt_join = [get_txt_token("are")]
             else:
                 refers_only_to_self = False
                 # Tgt needs to be a tuple in order to use a map.
                 if self.DEBUG: logger.debug(" --> getting default target.")
                 if self.DEBUG: logger.debug(" --> tar: %s verb: %s word: %s" % (target, verb, word))
-                tgt = tuple(self.__interpret_target(target, verb, word))
-                if word.attrs.req_join: tgt_join = self.__get_target_join(target, verb)
+                tgt = tuple(self.__interpret_target(ctx, target, verb, word))
+                if word.attrs.req_join: tgt_join = self.__get_target_join(ctx, target, verb)
                 if self.DEBUG: logger.debug(" ----> tgt_join: [%s]" % (tgt_join))
             
             # Make sure we have a list init'd for this target, and
@@ -720,10 +917,10 @@ class MacroInterpreter:
                     if arg.data in agg_args:
                         # Turn off rendering for both the arg
                         # and the or behind it, if there was one.
-                        self.parser.mark_tokens_useless(start=arg.token_id-1,
+                        ctx.parser.mark_tokens_useless(start=arg.token_id-1,
                                                         end=arg.token_id,
                                                         tok_type=OR)
-                        self.parser.mark_tokens_useless(start=arg.token_id,
+                        ctx.parser.mark_tokens_useless(start=arg.token_id,
                                                         end=arg.token_id+1)
                         arg.warn   = (WARN_UNUSED_REPEATED_ARGS, [arg])
                     else:
@@ -733,7 +930,7 @@ class MacroInterpreter:
                             arg.warn = (arg.attrs.warn,)
                         # If the word takes params, look them up.
                         if word.attrs.can_take_spell:
-                            arg.attrs.param_data_obj = get_wow_object(arg.data, src=DATA_SOURCE, cache=self.__param_cache)
+                            arg.param_data_obj = get_wow_object(arg.data, src=self.data_source, cache=ctx.param_cache)
                         # Is this a valid option arg?
                         if not arg.attrs.is_option_arg:
                             raise InterpetErrorInvalidConditionArg(word,arg)
@@ -760,7 +957,7 @@ class MacroInterpreter:
                 last_tok.warn = (WARN_REPEATED_PHRASE,)
 
                 # Note we start at the AND token prior to the word.
-                self.parser.mark_tokens_useless(start=first_tok.token_id-1,
+                ctx.parser.mark_tokens_useless(start=first_tok.token_id-1,
                                                 end=last_tok.token_id+1)
                 continue
             phrase_map[phrase_key] = True
@@ -811,12 +1008,12 @@ class MacroInterpreter:
             phrase_list += tgt_list + to_add
             # Add a interpret conjunction across targets
             if (idx + 1) < len(tgt_to_phrase):
-                phrase_list.append(TxtToken("and"))
+                phrase_list.append(get_txt_token("and"))
         return phrase_list
 
     
     # Helper to get the join string for a target.
-    def __get_target_join(self, target, verb):
+    def __get_target_join(self, ctx, target, verb):
         '''
         Get a target join string to the condition examining it.    Returns
         the empty string for any error, or if no join string needed.
@@ -825,22 +1022,22 @@ class MacroInterpreter:
         # If we don't have a target, get the default from the parser.
         if target is None:
             if verb is not None and verb.attrs.def_target:
-                target = self.parser.get_default_target(verb.attrs.def_target)
+                target = ctx.parser.get_default_target(verb.attrs.def_target)
             elif verb is not None and verb.attrs.takes_ext_target:
-                target = self.parser.get_default_target("target")
+                target = ctx.parser.get_default_target("target")
             else:
-                target = self.parser.get_default_target("player")
+                target = ctx.parser.get_default_target("player")
         # (target, gets, [target_tokens])
         tar_tok, eq_tok, tgt_args = target
         # If its a target, return the join.
         if tgt_args[-1].token_type == "TARGET_OBJ":
             if tgt_args[-1].attrs.use_are:
-                return [TxtToken(txt="are")]
-        return [TxtToken(txt="is")]
+                return [get_txt_token("are")]
+        return [get_txt_token("is")]
 
         
     # Helper to assemble a target string.
-    def __interpret_target(self, target=None, verb=None, word=None, js=True, was_param=False):
+    def __interpret_target(self, ctx, target=None, verb=None, word=None, js=True, was_param=False):
         '''
         Intepret a target.  Returns a list of renderables.
         '''
@@ -849,12 +1046,12 @@ class MacroInterpreter:
         # If we don't have a target, get the default from the parser.
         if not target:
             if verb and verb.attrs.def_target:
-                target = self.parser.get_default_target(verb.attrs.def_target)
+                target = ctx.parser.get_default_target(verb.attrs.def_target)
             elif word and word.attrs.def_target:
                 if self.DEBUG: logger.debug("  -> Getting default for: %s" % word.attrs.def_target)
-                target = self.parser.get_default_target(word.attrs.def_target)
+                target = ctx.parser.get_default_target(word.attrs.def_target)
             else:
-                target = self.parser.get_default_target("player")
+                target = ctx.parser.get_default_target("player")
             # For the default target, turn off highlighting.
             js = False
 
@@ -873,10 +1070,10 @@ class MacroInterpreter:
                 # Modify target for readibility.
                 if len(render_list) == 0:
                     if tgt_arg.attrs.inc_the:
-                        render_list.extend([TxtToken("the"), tgt_arg])
+                        render_list.extend([get_txt_token("the"), tgt_arg])
                     # Do we need to prepend "your"?
                     elif tgt_arg.attrs.use_your:
-                        render_list.extend([TxtToken("your"), tgt_arg])
+                        render_list.extend([get_txt_token("your"), tgt_arg])
                     # If 'player' and part of a chain, then you -> your
                     elif tgt_arg.data == 'player' and len(tgt_args) > 1:
                         tgt_arg.render_desc  = "your"
@@ -888,8 +1085,8 @@ class MacroInterpreter:
                     # If nec, make possessive of the last token, get
                     # rid of space.
                     if not last.is_type(TARGET_OBJ) or last.attrs.use_ap_s:
-                        last.render_space_after = False
-                        render_list.extend([TxtToken("'s"), tgt_arg])
+                        render_list[-1] = set_render_space_after(last, False)
+                        render_list.extend([get_txt_token("'s"), tgt_arg])
                     else:
                         render_list.append(tgt_arg)                        
             else:
@@ -900,7 +1097,7 @@ class MacroInterpreter:
     
     
     # Helper to assemble a target string from a parameter list.
-    def __interpret_param_as_target(self, verb, param):
+    def __interpret_param_as_target(self, ctx, verb, param):
         '''
         Intepret a parameter object as a target.  Returns
         target_render_list.
@@ -915,13 +1112,13 @@ class MacroInterpreter:
     
         # Convert [(toggle, parameter)...] to (target, gets, [target tokens])
         try:
-            new_target = self.parser.get_target_from_param(param)
-            return self.__interpret_target(new_target, was_param=True)
+            new_target = ctx.parser.get_target_from_param(param)
+            return self.__interpret_target(ctx, new_target, was_param=True)
         except:
             pass
 
         # Otherwise, return rendered param string.
-        return self.parser.use_param_as_target(verb, param)
+        return ctx.parser.use_param_as_target(verb, param)
 
     
     # Helper
@@ -972,7 +1169,7 @@ class MacroInterpreter:
 
 
     # Helper for GCD warnings
-    def __add_gcd_warnings(self, verb, param):
+    def __add_gcd_warnings(self, ctx, verb, param):
         '''
         Helper to add warnings for potential GCD problems
         from parameters.    Returns nothing.
@@ -980,7 +1177,7 @@ class MacroInterpreter:
         if verb is None or param is None: return
 
         # Does the verb itself cost GCD by default?
-        if verb.attrs.gcd and (self.__new_cmd.index + 1) < self.__num_macro_commands:
+        if verb.attrs.gcd and (ctx.new_cmd.index + 1) < ctx.num_macro_commands:
             verb.warn = (WARN_VERB_GCD, [verb])
 
         # Otherwise, go through params and add warnings for GCD.
@@ -990,37 +1187,37 @@ class MacroInterpreter:
             # If this command expects a spell ONLY
             if verb.attrs.takes_spell and not verb.attrs.takes_item:
                 # Did we recognize this spell?
-                if not p.attrs.param_data_obj and not p.attrs.is_empty and p not in self.__unrec_map:
+                if not p.param_data_obj and not p.attrs.is_empty and p not in ctx.unrec_map:
                     p.warn = (WARN_UNKNOWN_SPELL,)
-                    self.__unrec_map[p] = True
+                    ctx.unrec_map[p] = True
                 # Did we find an item instead of a spell?
                 elif p.attrs.is_item_id_param or \
-                     (p.attrs.param_data_obj and p.attrs.param_data_obj.is_item() and p not in self.__unrec_map):
+                     (p.param_data_obj and p.param_data_obj.is_item() and p not in ctx.unrec_map):
                     p.warn = (WARN_ITEM_INSTEAD_OF_SPELL, [verb], [p])
                 else:
                     # Does this command trip the GCD?
                     # Only really relevant if this isnt the last command.
-                    if p.attrs.param_data_obj and p.attrs.param_data_obj.trips_gcd() and \
-                           (self.__new_cmd.index + 1) < self.__num_macro_commands and \
-                           p not in self.__gcd_map:
+                    if p.param_data_obj and p.param_data_obj.trips_gcd() and \
+                           (ctx.new_cmd.index + 1) < ctx.num_macro_commands and \
+                           p not in ctx.gcd_map:
                         p.warn = (WARN_SPELL_GCD, [p])
-                        self.__gcd_map[p] = True
+                        ctx.gcd_map[p] = True
 
             # . . .or uses an item ONLY . . .
             elif verb.attrs.takes_item and not verb.attrs.takes_spell \
                      and not p.data_type is int:
                 # Did we recognize an item
-                if not p.attrs.param_data_obj and p not in self.__unrec_map:
+                if not p.param_data_obj and p not in ctx.unrec_map:
                     p.warn = (WARN_UNKNOWN_ITEM,)
-                    self.__unrec_map[p] = True
+                    ctx.unrec_map[p] = True
                 # Is this as spell?
-                elif p.attrs.param_data_obj and p.attrs.param_data_obj.is_spell():
+                elif p.param_data_obj and p.param_data_obj.is_spell():
                     p.warn = (WARN_SPELL_INSTEAD_OF_ITEM, [verb], [p])
                 # If found, GCD warning (if this isnt the last command)
-                elif p.attrs.param_data_obj and p.attrs.param_data_obj.trips_gcd() and p not in self.__gcd_map and \
-                     (self.__new_cmd.index + 1) < self.__num_macro_commands:
+                elif p.param_data_obj and p.param_data_obj.trips_gcd() and p not in ctx.gcd_map and \
+                     (ctx.new_cmd.index + 1) < ctx.num_macro_commands:
                     p.warn = (WARN_ITEM_GCD, [verb], [p])
-                    self.__gcd_map[p] = True
+                    ctx.gcd_map[p] = True
 
 
     # Simple helper to unpack a conditional
@@ -1048,14 +1245,14 @@ class MacroInterpreter:
         for i,e in enumerate(token_list):
             if i > 0:
                 if last_delim and i + 1 == len(token_list) and len(token_list) > 2:
-                    ret_list.append(TxtToken(txt=last_delim))
+                    ret_list.append(get_txt_token(last_delim))
                 else:
-                    ret_list.append(TxtToken(txt=delim))
+                    ret_list.append(get_txt_token(delim))
             if not space_before and i + 1 < len(token_list):
                 if flatten:
-                    e[-1].render_space_after = False
+                    e[-1] = set_render_space_after(e[-1], False)
                 else:
-                    e.render_space_after = False
+                    e = set_render_space_after(e, False)
             if flatten:
                 ret_list.extend(e)                
             else:
@@ -0,0 +1,38 @@
+'''
+Process-wide cache of interpreted macro lines, for live editing.
+
+While a macro is being edited, most of its lines stay the same from
+one keystroke to the next.  A line interprets the same way as long as
+its text, its position and what came before it in the macro are the
+same, so the results are cached on those (see
+MacroInterpreter.interpret_macro_incremental), least recently used
+first.
+
+Cached commands are shared by every macro that hits them, and must
+not be changed.
+'''
+
+import hashlib
+
+from macro.lex.cache import LRUCache
+
+
+# Default bound on the number of cached lines.  An interpreted line
+# with its tokens is around 10-20k, so this is at most 10M or so.
+MAX_CACHED_LINES = 500
+
+
+# Get a short, stable key for a cache key, to hand out to clients.
+def get_line_key(key):
+    return hashlib.sha1(repr(key)).hexdigest()[:16]
+
+
+class LineCache(LRUCache):
+    ''' Bounded LRU of line context -> interpreted line. '''
+
+    def __init__(self, max_lines=MAX_CACHED_LINES):
+        LRUCache.__init__(self, max_lines)
+
+
+# The cache shared by every interpreter in this process.
+LINE_CACHE = LineCache()
@@ -4,7 +4,7 @@ Objects for txt-only tokens.
 
 from macro.lex.token_base import MacroTokenBase
 from macro.util           import NULL_POSITION, NULL_TOKEN_ID
-       
+
 
 class TxtToken(MacroTokenBase):
     ''' Simple token for rendering.  Shares parent object
@@ -12,6 +12,7 @@ class TxtToken(MacroTokenBase):
 
     TxtToken allows the creation of light-weight objects
     for rendering non-macro interpretation text.'''
+    __slots__ = ()
 
     def __init__(self, txt,
                  js=False,
@@ -37,3 +38,48 @@ class TxtToken(MacroTokenBase):
                               wowhead=wowhead,
                               strike=strike,
                               render_space_after=render_space_after)
+
+
+class SharedTxtToken(TxtToken):
+    ''' A TxtToken shared by every interpretation that uses the same
+    text, i.e. connectives like "are" or "nothing".  Shared tokens are
+    read-only; use set_render_space_after() rather than setting
+    render_space_after on a token that might be shared. '''
+    __slots__ = ('frozen',)
+
+    def __init__(self, txt, render_space_after=True):
+        TxtToken.__init__(self, txt, render_space_after=render_space_after)
+        self.frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, 'frozen', False):
+            raise AttributeError("Shared token '%s' is read-only." % self.data)
+        object.__setattr__(self, name, value)
+
+    # Unpickle to the shared token, so that interpretations coming
+    # back out of memcache share them too.
+    def __reduce__(self):
+        return (get_txt_token, (self.data, self.render_space_after))
+
+
+# Pool of shared tokens, by (text, render_space_after).
+_SHARED_TOKENS = {}
+
+
+def get_txt_token(txt, render_space_after=True):
+    ''' Get the shared, read-only TxtToken for fixed text. '''
+    key = (txt, render_space_after)
+    token = _SHARED_TOKENS.get(key)
+    if token is None:
+        token = _SHARED_TOKENS.setdefault(key, SharedTxtToken(txt, render_space_after))
+    return token
+
+
+def set_render_space_after(token, render_space_after):
+    ''' Set render_space_after on a token, returning the token to use
+    in its place.  Shared tokens are swapped for their shared
+    counterpart rather than changed. '''
+    if isinstance(token, SharedTxtToken):
+        return get_txt_token(token.data, render_space_after)
+    token.render_space_after = render_space_after
+    return token
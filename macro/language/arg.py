@@ -3,7 +3,7 @@
 Option arguments.
 '''
 
-from macro.language.base import LanguagePart
+from macro.language.base import LanguagePart, get_slots
 
 # Class describing Argument attributes.
 class Arg(LanguagePart):
@@ -11,11 +11,6 @@ class Arg(LanguagePart):
     In addition to fields described in LanguagePart,
     we have the following attributes:
 
-    param_data_obj: (Optional)
-    Reference to a parameter-specific object describing this
-    parameter, i.e. an Item or Spell object.
-    Default None
-    
     is_key: (Optional)
     Whether or not this argument is a keypress.
     Default False.
@@ -40,12 +35,12 @@ class Arg(LanguagePart):
         'is_key'        : False,
         'is_reset_arg'  : False,
         'is_option_arg' : True,
-        'param_data_obj': None,
         'warn'          : None,
         'new_target'    : None,
         }
+    __slots__ = get_slots(attr_defaults)
 
-    # TODO: If we have a param_data_obj, use that name for the desc.
+    # TODO: If the token has a param_data_obj, use that name for the desc.
 
 
 
@@ -13,20 +13,39 @@ def default_assemble_function(*args):
     return []
     
 
+# Attributes every language part has, with their defaults.
+BASE_ATTR_DEFAULTS = {
+    'desc'              : '',
+    'alt_desc'          : '',
+    'error_msg'         : '',
+    'assemble_function' : default_assemble_function,
+    }
+
+
+# Helper to build the __slots__ for a language part subclass from
+# its attr_defaults.  Base attributes already have slots.
+def get_slots(attr_defaults):
+    return tuple([name for name in attr_defaults \
+                  if name not in BASE_ATTR_DEFAULTS])
+
+
 # Base class for a language primitive
-class LanguagePart():
+class LanguagePart(object):
     ''' Base class for all macro language parts.  Each macro part is a
     collection of attriubutes describing the function of the macro
     unit.
 
+    Language parts are read-only records.  Every attribute is resolved
+    against the class defaults when the object is created, and stored
+    in a slot.  Since they are shared by every token with the same
+    data, nothing may be set on them afterwards--per-token state
+    belongs on the token.
+
     assemble_function: (Optional)
     Reference to a function for assembling the description
     of this function.
     Default: stub defined above.
 
-    token: (Optional)
-    Reference to the token this LanguagePart describes.
-
     desc: (Optional)
     Base of the english description for this macro part.
     If not defined, uses the token data.
@@ -40,42 +59,52 @@ class LanguagePart():
     Default None
 
     '''
-    # Static attrs hash for overriding by subclasses.
+    __slots__ = tuple(BASE_ATTR_DEFAULTS)
+
+    # Static attrs hash for overriding by subclasses.  Subclasses
+    # must also set __slots__ = get_slots(attr_defaults).
     attr_defaults = {}
-    
-    # Constructor saves the shared attributes.
+
+    # Constructor resolves and saves all attributes.  Arguments that
+    # are not attributes of this language part are ignored.
     def __init__(self, **kargs):
-        self.__kargs    = kargs
-
-        # Add default values for base-required attributes.
-        self.attr_defaults['token']             = None
-        self.attr_defaults['desc']              = ''
-        self.attr_defaults['alt_desc']          = ''
-        self.attr_defaults['error_msg']         = ''
-        if 'assemble_function' not in self.attr_defaults:
-            self.attr_defaults['assemble_function'] = default_assemble_function
-
-
-    # Overridding __getattr__ allows for lazy init of class objects.
-    # This is important since we create a lot of objects at execution
-    # time.  An object-specific list of attributes is saved at object
-    # create time.  A static class-specific list of default attribute
-    # vals is used to init with defaults where no object-specific
-    # attribute value is given.
-    def __getattr__(self, name):
-        if name in self.attr_defaults:
-            if name in self.__kargs:
-                val = self.__kargs[name]
-            else:
-                val = self.attr_defaults[name]
-            self.__dict__[name] = val
-            return val
-        raise AttributeError("%s doesn't contain attribute %s." % \
+        for name, default in self.__get_defaults().items():
+            val = kargs.get(name, default)
+            # Lists would be shared and mutable--store as tuples.
+            if type(val) is list: val = tuple(val)
+            object.__setattr__(self, name, val)
+
+
+    # All attribute defaults for this class, base attributes included.
+    # Computed once per class.
+    @classmethod
+    def __get_defaults(cls):
+        if '_all_defaults' not in cls.__dict__:
+            defaults = dict(BASE_ATTR_DEFAULTS)
+            defaults.update(cls.attr_defaults)
+            cls._all_defaults = defaults
+        return cls._all_defaults
+
+
+    # Language parts are read-only once created.
+    def __setattr__(self, name, val):
+        raise AttributeError("%s is read-only, can't set %s." % \
                              (self.__class__, name))
 
 
+    # Pickling support (i.e. for memcache).  State is restored
+    # straight into the slots, as __setattr__ is blocked.
+    def __getstate__(self):
+        return dict([(name, getattr(self, name)) \
+                     for name in self.__get_defaults()])
+    def __setstate__(self, state):
+        for name, val in state.items():
+            object.__setattr__(self, name, val)
+
+
     # Debug--output language part attributes
     def __str__(self):
-        return str(self.__kargs)
+        return str(dict([(name, getattr(self, name)) \
+                         for name in self.__get_defaults()]))
 
         
@@ -2,7 +2,7 @@
 
 Options.
 '''
-from macro.language.base import LanguagePart
+from macro.language.base import LanguagePart, get_slots
 from macro.interpret.assemble_functions import *
 
 # Class describing Options
@@ -65,6 +65,7 @@ class Option(LanguagePart):
         'assemble_function' : get_assembled_option,
         'no_args'           : True,
         }
+    __slots__ = get_slots(attr_defaults)
     
 
 ''' Map of available options '''
@@ -2,7 +2,7 @@
 
 Parameters
 '''
-from macro.language.base import LanguagePart
+from macro.language.base import LanguagePart, get_slots
 
 # Switch Appenging parameter lookups on and off.
 DB_PARAM_LOOKUPS = False
@@ -17,11 +17,6 @@ class Parameter(LanguagePart):
     Parameter is an empty one.
     Default False
 
-    param_data_obj: (Optional)
-    Reference to a parameter-specific object describing this
-    parameter, i.e. an Item or Spell object.
-    Default None
-
     self_only: (Optional)
     Whether or not this parameter refers to the player only.
     Default False
@@ -32,12 +27,12 @@ class Parameter(LanguagePart):
     '''
     attr_defaults = {
         'is_empty'         : False,
-        'param_data_obj'   : None,
         'is_item_id_param' : False,
         'self_only'        : False,
         }
+    __slots__ = get_slots(attr_defaults)
 
-    # TODO: If we have a param_data_obj, use that name for the desc.
+    # TODO: If the token has a param_data_obj, use that name for the desc.
 
 
         
@@ -2,7 +2,7 @@
 
 Targets.
 '''
-from macro.language.base import LanguagePart
+from macro.language.base import LanguagePart, get_slots
 
 # Class describing target units
 class TargetUnit(LanguagePart):
@@ -62,6 +62,7 @@ class TargetUnit(LanguagePart):
         'use_your'    : False,
         'use_ap_s'    : True,
         }
+    __slots__ = get_slots(attr_defaults)
 
 
 ''' Map of special target units. '''
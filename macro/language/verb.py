@@ -2,7 +2,7 @@
 
 Verbs.
 '''
-from macro.language.base                import LanguagePart
+from macro.language.base                import LanguagePart, get_slots
 from macro.interpret.assemble_functions import *
 
 # Class describing Verbs
@@ -202,6 +202,7 @@ class Verb(LanguagePart):
         'assemble_function': get_assembled_command,
         'param_function'   : get_assembled_parameter,
         }
+    __slots__ = get_slots(attr_defaults)
 
 
 ''' Map of command verbs.
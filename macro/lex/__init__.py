@@ -1 +1 @@
-__all__ = ["language", "lexer", "rules"]
+__all__ = ["cache", "language", "lexer", "rules"]
@@ -0,0 +1,129 @@
+'''
+Process-wide cache of lexed macro commands.
+
+The same command lines show up in a great many macros, and lexing is
+most of the cost of parsing a command.  The cache maps a cleaned
+command line to the tokens it lexes to, least recently used first,
+and is bounded by the total number of tokens held.
+
+Tokens are marked up in place all through parsing, interpretation and
+rendering, so the cache keeps its own pristine copies and hands out
+fresh copies on every hit.
+'''
+
+import threading
+from collections import OrderedDict
+
+
+# Default bound on the number of cached tokens.  With slotted tokens
+# (see token_base.py) a cached token takes 300-500 bytes: about 275
+# measured by the growth of a process filling a cache with 300k
+# tokens, where short strings are shared, and about 500 summing the
+# sizes of each token's own values.  A typical line is 7-10 tokens,
+# so this is roughly 4000-5000 lines in 12-20M, about the memory the
+# old bound of 10000 dict-based tokens (1.7k each) took.
+MAX_CACHED_TOKENS = 40000
+
+
+# Helper to copy a token.  Fresh tokens only hold immutable values,
+# so a shallow copy is enough.
+def _copy_token(token, index=None):
+    new_token = token.copy()
+    if index is not None: new_token.index = index
+    return new_token
+
+
+class LRUCache(object):
+    ''' Bounded LRU of key -> value, least recently used first.  The
+    bound is on the total size of the values, as given by size_of;
+    by default each value counts 1, so it is on the number of
+    entries.  Safe to share between threads.  The other process-wide
+    caches (see macro/interpret/line_cache.py and cond_cache.py) are
+    built on this. '''
+
+    def __init__(self, max_size, size_of=None):
+        self.max_size  = max_size
+        self.size_of   = size_of or (lambda value: 1)
+        self.__entries = OrderedDict()
+        self.__lock    = threading.Lock()
+        self.__size    = 0
+
+        # Counters for monitoring.
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+    def get(self, key):
+        ''' Get the value for a key, or None on a miss. '''
+        self.__lock.acquire()
+        try:
+            entry = self.__entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.__entries[key] = entry
+            self.hits += 1
+            return entry[0]
+        finally:
+            self.__lock.release()
+
+    def put(self, key, value):
+        ''' Cache the value for a key, replacing any there.  Values
+        too big for the cache are not kept. '''
+        size = self.size_of(value)
+        if size > self.max_size: return
+        self.__lock.acquire()
+        try:
+            old = self.__entries.pop(key, None)
+            if old is not None: self.__size -= old[1]
+            self.__entries[key] = (value, size)
+            self.__size += size
+            while self.__size > self.max_size:
+                old_key, old = self.__entries.popitem(last=False)
+                self.__size -= old[1]
+                self.evictions += 1
+        finally:
+            self.__lock.release()
+
+    def clear(self):
+        ''' Empty the cache.  Counters are kept. '''
+        self.__lock.acquire()
+        try:
+            self.__entries.clear()
+            self.__size = 0
+        finally:
+            self.__lock.release()
+
+    def get_stats(self):
+        ''' Counters and sizes, as a dict. '''
+        return {'hits':      self.hits,
+                'misses':    self.misses,
+                'evictions': self.evictions,
+                'entries':   len(self.__entries),
+                'size':      self.__size,
+                'max_size':  self.max_size}
+
+
+class LexCache(LRUCache):
+    ''' Bounded LRU of command line -> token list, bounded by the
+    number of tokens held. '''
+
+    def __init__(self, max_tokens=MAX_CACHED_TOKENS):
+        LRUCache.__init__(self, max_tokens, len)
+
+    def get(self, command, index=0):
+        ''' Get fresh tokens for a command, with their index set, or
+        None on a miss. '''
+        tokens = LRUCache.get(self, command)
+        if tokens is None: return None
+        return [_copy_token(t, index) for t in tokens]
+
+    def put(self, command, tokens):
+        ''' Cache the tokens for a command.  Takes copies, so the
+        caller is free to go on using the tokens. '''
+        if len(tokens) == 0 or len(tokens) > self.max_size: return
+        LRUCache.put(self, command, tuple([_copy_token(t) for t in tokens]))
+
+
+# The cache shared by every tokenizer in this process.
+LEX_CACHE = LexCache()
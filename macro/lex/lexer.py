@@ -10,9 +10,60 @@ from macro.lex.ids        import *
 from macro.lex            import rules
 from macro.logger         import logger
 from macro.lex.token      import create_token
+from macro.lex.cache      import LEX_CACHE
 from macro.util           import clean_macro
 
 
+# Lexing engines.  The compiled engine walks a rule table compiled
+# once at import time, matching in place against the command.  The
+# recursive engine is the original implementation; it produces the
+# same tokens, and logs each rule application in debug mode.
+ENGINE_COMPILED  = "compiled"
+ENGINE_RECURSIVE = "recursive"
+DEFAULT_ENGINE   = ENGINE_COMPILED
+
+# Budget for lexing a single command.  Every rule application is a
+# step, and the lexer gives up with a LexErrorBudgetExceeded once it
+# takes more steps than this.  Real commands take a few hundred steps;
+# see fuzz_lexer.py.  There is deliberately no time limit: whether a
+# command lexes must depend only on the command, as lexed commands are
+# cached by content.
+MAX_LEX_STEPS    = 5000
+
+
+# Per-command lexing state.  Everything the rule engines touch while
+# lexing a command lives here and is passed down the descent, so
+# lexing never writes to shared state.
+class LexContext:
+    def __init__(self, command, command_index=0, save_pos_and_id=True,
+                 max_steps=None):
+        # The (cleaned) input being lexed.
+        self.command         = command
+
+        # Index of the command within the macro.
+        self.command_index   = command_index
+
+        # Whether to give tokens positions and ids.  Default targets
+        # are lexed without them.
+        self.save_pos_and_id = save_pos_and_id
+
+        # Tokens lexed so far.
+        self.queue           = []
+
+        # Rule applications so far, and the budget for them.  None
+        # means no limit.
+        self.steps           = 0
+        self.max_steps       = max_steps
+
+    # Count a rule application against the budget, raising
+    # LexErrorBudgetExceeded if it's used up.
+    def step(self, rule, lo, hi, data=None):
+        self.steps += 1
+        if self.max_steps is not None and self.steps > self.max_steps:
+            if data is None: data = self.command[lo:hi]
+            raise LexErrorBudgetExceeded(data, lo, hi, rule)
+
+
 # The tokenizer class
 class MacroCommandTokenizer:
     """MacroCommandTokenizer
@@ -39,12 +90,27 @@ class MacroCommandTokenizer:
     """
 
     # Constructor
-    def __init__(self, macro_command=None, debug=False):
+    def __init__(self, macro_command=None, debug=False, engine=None, use_cache=True,
+                 max_steps=MAX_LEX_STEPS):
         """ __init__()
         """
         self.DEBUG = debug
+        if engine is None: engine = DEFAULT_ENGINE
+        if engine not in (ENGINE_COMPILED, ENGINE_RECURSIVE):
+            raise ConfigError("Unknown lexing engine: %s" % engine)
+        self.engine = engine
         self.ready = False
 
+        # Whether to use the process-wide cache of lexed commands.
+        # Never used in debug mode, so that rule logging still happens.
+        self.use_cache = use_cache and not debug
+
+        # Budget for lexing each command; None for no limit.
+        self.max_steps = max_steps
+
+        # Steps taken lexing the last command.
+        self.steps = 0
+
         # The macro command currently being parsed.
         self.current_command = None
 
@@ -61,6 +127,9 @@ class MacroCommandTokenizer:
         # Character counter--there is a limit to how long macros can be!
         self.macro_char_counter = 0
 
+        # Index of the command within the macro.
+        self.command_index = 0
+
         # Save a reference to the root rule
         self.parse_root = rules.LEX_RULE_ROOT
         if macro_command is not None: self.reset(macro_command)
@@ -112,13 +181,18 @@ class MacroCommandTokenizer:
     # A special interface into the lexer to get a default
     # target token.
     def get_default_target(self, target):
-        ret_list = []
         if not target: target = ''
-        self.__apply_rule_set(ret_list,
-                              rules.get_target_parse_rule(),
-                              "target=" + target,
-                              save_pos_and_id=False)
-        return ret_list
+        ctx = LexContext("target=" + target, self.command_index,
+                         save_pos_and_id=False)
+        if self.__use_compiled(ctx.command):
+            self.__apply_compiled_rule_set(ctx,
+                                           rules.COMPILED_TARGET_PARSE_RULE,
+                                           0, len(ctx.command), 0)
+        else:
+            self.__apply_rule_set(ctx,
+                                  rules.get_target_parse_rule(),
+                                  ctx.command)
+        return ctx.queue
 
 
     #
@@ -189,28 +263,52 @@ class MacroCommandTokenizer:
         # First normalize all spaces in the macro
         self.current_command = clean_macro(self.current_command, debug=self.DEBUG)
 
-        # Clear the global parse state.
-        self.current_token_queue = []
-        rules.clear_rule_match()
+        # Have we lexed this command before?
+        if self.use_cache:
+            tokens = LEX_CACHE.get(self.current_command, self.command_index)
+            if tokens is not None:
+                self.current_token_queue = tokens
+                return
+
+        # Fresh state for this command.
+        ctx = LexContext(self.current_command, self.command_index,
+                         max_steps=self.max_steps)
+        self.current_token_queue = ctx.queue
+        self.steps = 0
         
         # Kick off the recursion.
-        (rem, idx) = self.__apply_rule_set(self.current_token_queue,
-                                           self.parse_root,
-                                           self.current_command)
+        try:
+            if self.__use_compiled(ctx.command):
+                (lo, hi, delta) = self.__apply_compiled_rule_set(ctx,
+                                                                 rules.COMPILED_LEX_RULE_ROOT,
+                                                                 0,
+                                                                 len(ctx.command),
+                                                                 0)
+                (rem, idx) = (ctx.command[lo:hi], lo + delta)
+            else:
+                (rem, idx) = self.__apply_rule_set(ctx,
+                                                   self.parse_root,
+                                                   ctx.command)
+        finally:
+            self.steps = ctx.steps
 
         # If we didn't consume all the input, we have a parse error.
         if (rem != ''):
             raise LexErrorNoMatchingRules(rem, idx, idx+str(rem),
                                           self.parse_root)
 
-        # Make sure we don't add a space after the last token.
-        self.current_token_queue[-1].space_after=False
+        # Make sure we don't add a space after the last token.  A
+        # blank command has none.
+        if self.current_token_queue:
+            self.current_token_queue[-1].space_after=False
+        if self.use_cache:
+            LEX_CACHE.put(self.current_command, self.current_token_queue)
         
 
     # Simple tokenizer that applies a parse rule set.  Recursive
     # private method that does a depth-first descent of the parse
     # rules on the input.
-    def __apply_rule_set(self, queue, parse_rule, input, curr_index=0, space='', save_pos_and_id=True):
+    def __apply_rule_set(self, ctx, parse_rule, input, curr_index=0, space=''):
         # Decompose rule
         (name, token_type, desc, flags, re_obj, subrules) = rules.decompose_rule(parse_rule)
         
@@ -224,6 +322,7 @@ class MacroCommandTokenizer:
             return (input, curr_index)
 
         # First, apply the rule.  If we miss, return.
+        ctx.step(parse_rule, curr_index, curr_index + len(input), input)
         curr_match, rem_input, match_start, match_end = \
                     rules.apply_rule(parse_rule, input, curr_index)
         if curr_match is None:
@@ -245,12 +344,11 @@ class MacroCommandTokenizer:
                 for rule_obj in subrules:
                     # Update the remainder of the match and the index with each application.
                     if self.DEBUG: logger.debug("%sRECURSING on curr_match: |%s| index: %s rule: %s" % (space, curr_match, curr_index, rule_obj))
-                    (curr_match, curr_index) = self.__apply_rule_set(queue,
+                    (curr_match, curr_index) = self.__apply_rule_set(ctx,
                                                                      rule_obj,
                                                                      curr_match,
                                                                      curr_index,
-                                                                     space + "  ",
-                                                                     save_pos_and_id)
+                                                                     space + "  ")
                     
                 # Input left over/not parsed?
                 if len(curr_match) > 0 and not curr_match.isspace():
@@ -272,29 +370,109 @@ class MacroCommandTokenizer:
         # token.  Save.
         else:
             if self.DEBUG: logger.debug("%sAdding [%s] to stack as %s" % (space, curr_match, name))
-            if save_pos_and_id:
-                queue.append(create_token(token_type,
-                                          len(queue),
-                                          curr_match,
-                                          match_start,
-                                          match_end,
-                                          rules.space_after(flags),
-                                          rules.add_space_after(flags),
-                                          self.command_index))
+            if ctx.save_pos_and_id:
+                ctx.queue.append(create_token(token_type,
+                                              len(ctx.queue),
+                                              curr_match,
+                                              match_start,
+                                              match_end,
+                                              rules.space_after(flags),
+                                              rules.add_space_after(flags),
+                                              ctx.command_index))
             else:
                 if self.DEBUG: logger.debug("DROPPING POSITIONS")
-                queue.append(create_token(token_type,
-                                          NULL_TOKEN_ID,
-                                          curr_match,
-                                          NULL_POSITION,
-                                          NULL_POSITION,
-                                          rules.space_after(flags),
-                                          rules.add_space_after(flags),
-                                          self.command_index))
+                ctx.queue.append(create_token(token_type,
+                                              NULL_TOKEN_ID,
+                                              curr_match,
+                                              NULL_POSITION,
+                                              NULL_POSITION,
+                                              rules.space_after(flags),
+                                              rules.add_space_after(flags),
+                                              ctx.command_index))
         return (rem_input, match_end)
 
 
-# Create a global tokenizer that can be used in multiple places.
-GLOBAL_MACRO_TOKENIZER = MacroCommandTokenizer()
+    # Whether to use the compiled engine for this input.  The compiled
+    # rules assume single-line input (see rules.compile_rule), so
+    # anything with an embedded newline goes through the recursive
+    # engine.
+    def __use_compiled(self, input):
+        return self.engine == ENGINE_COMPILED and '\n' not in input
+
 
+    # Compiled version of __apply_rule_set.  Instead of slicing the
+    # input, each rule is matched in place against the window
+    # ctx.command[lo:hi].  The index the recursive engine would report for
+    # the window is lo + delta; returns the (lo, hi, delta) window of
+    # unmatched input.  Kept deliberately in step with
+    # __apply_rule_set--any change there must be mirrored here.
+    def __apply_compiled_rule_set(self, ctx, compiled_rule, lo, hi, delta):
+        command = ctx.command
+        (parse_rule, token_type, re_obj, rem_group, repeat, required,
+         takes_empty, space_after, add_space_after, subrules) = compiled_rule
 
+        # If there's nothing to do here, return.
+        if lo == hi and not takes_empty:
+            return (lo, hi, delta)
+
+        # First, apply the rule.  If we miss, return.
+        ctx.step(parse_rule, lo, hi)
+        result = re_obj.match(command, lo, hi)
+        if result is None:
+            if required:
+                raise LexErrorRequiredMatchFailed(command[lo:hi], lo + delta,
+                                                  hi + delta, parse_rule)
+            return (lo, hi, delta)
+
+        (m_lo, m_hi) = result.span(1)
+        match_start  = m_lo + delta
+        match_end    = m_hi + delta
+        if rem_group: (r_lo, r_hi) = result.span(rem_group)
+        else:         (r_lo, r_hi) = (m_hi, hi)
+        match        = command[m_lo:m_hi]
+        curr_match   = match.strip()
+
+        # Recurse on the stripped match, which starts at match_start.
+        if subrules:
+            c_lo    = m_lo + len(match) - len(match.lstrip())
+            c_hi    = c_lo + len(curr_match)
+            c_delta = match_start - c_lo
+            done = False
+            while not done:
+                prev_curr_match = curr_match
+                for rule_obj in subrules:
+                    (c_lo, c_hi, c_delta) = self.__apply_compiled_rule_set(ctx,
+                                                                           rule_obj,
+                                                                           c_lo,
+                                                                           c_hi,
+                                                                           c_delta)
+                curr_match = command[c_lo:c_hi]
+
+                # Input left over/not parsed?
+                if len(curr_match) > 0 and not curr_match.isspace():
+                    if not repeat or prev_curr_match == curr_match:
+                        raise LexErrorNoMatchingRules(curr_match, c_lo + c_delta,
+                                                      c_hi + c_delta, parse_rule)
+                else:
+                    done = True
+
+        # No subrules, so this is a token.  Save.
+        elif ctx.save_pos_and_id:
+            ctx.queue.append(create_token(token_type,
+                                          len(ctx.queue),
+                                          curr_match,
+                                          match_start,
+                                          match_end,
+                                          space_after,
+                                          add_space_after,
+                                          ctx.command_index))
+        else:
+            ctx.queue.append(create_token(token_type,
+                                          NULL_TOKEN_ID,
+                                          curr_match,
+                                          NULL_POSITION,
+                                          NULL_POSITION,
+                                          space_after,
+                                          add_space_after,
+                                          ctx.command_index))
+        return (r_lo, r_hi, match_end - r_lo)
@@ -14,17 +14,6 @@ from macro.lex.ids    import *
 # Internal Functions
 #
 
-# Rule count functions--internal to this class only.
-def _is_rule_matched(name):
-    global _rule_count
-    if name not in _rule_count:
-        _rule_count[name] = False
-    return _rule_count[name]
-
-def _rule_is_matched(name):
-    global _rule_count
-    _rule_count[name] = True
-
 # Representation for comparison in testing.
 def _test(rule):
     (name, token_type, desc, flags, re_obj, subrules) = rule
@@ -45,14 +34,15 @@ def decompose_rule(rule):
 
 # Apply the regexp, returning (match, remainder, start, end)
 # If we require a match for this rule, throw an exception.
+#
+# Note that match_only_once is not enforced here.  The check that used
+# to do this tested the result of a setter and so never fired, and the
+# rule set relies on those rules matching more than once per command.
+# Applying a rule keeps no state, so many commands can lex at once.
 def apply_rule(rule, input, start_index=0):
     # Decompose the rule
     (name, token_type, desc, flags, re_obj, subrules) = rule
 
-    # Do we even need to try the match?
-    if _rule_is_matched(name) and match_only_once(flags):
-        return (None, input, 0, 0)
-    
     if re_obj is None:
         from macro.exceptions import ConfigError
         raise ConfigError("Malformed lexing rule: " + str(rule))
@@ -67,9 +57,6 @@ def apply_rule(rule, input, start_index=0):
                                               start_index+len(input),
                                               rule)
         return (None, input, 0, 0)
-    else:
-        # Save that we matched this rule
-        _rule_is_matched(name)
 
     # Fetch the match and remaining command, return
     return (result.group(1).strip(),
@@ -78,15 +65,6 @@ def apply_rule(rule, input, start_index=0):
             start_index + result.end(1))
 
 
-# Rule count data structure and external function to clear the rule
-# count.  Rule counts need to be cleared before each macro command is
-# parsed.
-_rule_count = {}
-def clear_rule_match():
-    global _rule_count
-    _rule_count = {}
-
-
 # Generate a regular expression for 
 def gen_regexp_from_map(map, filter=lambda p: True, boundries=True, neg=False, end=False):
     if neg:
@@ -140,6 +118,44 @@ def rule_takes_empty(rule):
     return decompose_rule(rule)[3][5]
 
 
+# Compile a rule and all of its subrules for the compiled lexing
+# engine.  Compiled rules are flat tuples:
+# (rule, token_type, re_obj, rem_group, repeat, required, takes_empty,
+#  space_after, add_space_after, (compiled subrules))
+#
+# The regexps are recompiled without the leading ^ so they can be
+# matched in place against the whole command with pos/endpos instead
+# of against sliced copies.  A trailing (.*)$ remainder group always
+# matches single-line input without changing group 1, so it is dropped
+# and the remainder is taken to run to the end of the window
+# (rem_group is 0).  Subrules are shared between rules, so compiled
+# rules are memoized on the identity of the source rule.
+def compile_rule(rule, memo=None):
+    if memo is None: memo = {}
+    if id(rule) in memo: return memo[id(rule)]
+    (name, token_type, desc, flags, re_obj, subrules) = rule
+    if re_obj is None or not re_obj.pattern.startswith('^'):
+        from macro.exceptions import ConfigError
+        raise ConfigError("Malformed lexing rule: " + str(rule))
+    pattern   = re_obj.pattern[1:]
+    rem_group = 2
+    if pattern.endswith('(.*)$'):
+        pattern   = pattern[:-len('(.*)$')]
+        rem_group = 0
+    compiled = (rule,
+                token_type,
+                re.compile(pattern, re_obj.flags),
+                rem_group,
+                match_repeat(flags),
+                match_required(flags),
+                can_take_empty(flags),
+                space_after(flags),
+                add_space_after(flags),
+                tuple([compile_rule(r, memo) for r in subrules]) if subrules else ())
+    memo[id(rule)] = compiled
+    return compiled
+
+
 
 #
 # Parse Rules
@@ -340,11 +356,14 @@ _TERMINAL_OPTION_ARG              = ("_TERMINAL_OPTION_ARG",
                                      get_regexp_obj("^\s*([A-Za-z0-9 -&\(\)\']+)(.*)$"),
                                      None)
 
+# The argument can't start with a space, or the leading \s* and the
+# argument split runs of spaces every which way before failing on a
+# missing /, which is quadratic.
 _TERMINAL_MOD_OPTION_ARG          = ("_TERMINAL_MOD_OPTION_ARG",
                                      OPTION_ARG,
                                      "a modifier argument",
                                      get_flags(),
-                                     get_regexp_obj("^\s*([A-Za-z0-9 -&]+)(\/.*)$"),
+                                     get_regexp_obj("^\s*([A-Za-z0-9!-&][A-Za-z0-9 -&]*)(\/.*)$"),
                                      None)
 
 _TERMINAL_MOD_OPTION_ARG_LAST     = ("_TERMINAL_MOD_OPTION_ARG_LAST",
@@ -529,7 +548,7 @@ _RULE_OPTION_W_ARGS               = ("_RULE_OPTION_W_ARGS",
                                      None,
                                      "a conditional option statement with arguments",
                                      get_flags(match_repeat=True),
-                                     get_regexp_obj("^\s*((?:no)?\s*"+ _KNOWN_OPTION_WORD_REGEXP +"\s*:.+)()$"),
+                                     get_regexp_obj("^\s*((?:no\s*)?"+ _KNOWN_OPTION_WORD_REGEXP +"\s*:.+)()$"),
                                      (_TERMINAL_NOT,
                                       _TERMINAL_OPTION_WORD,
                                       _TERMINAL_IS,
@@ -542,7 +561,7 @@ _RULE_OPTION_NO_ARGS              = ("_RULE_OPTION_NO_ARGS",
                                      None,
                                      "a conditional option statement with no arguments",
                                      get_flags(match_only_once=True),
-                                     get_regexp_obj("^\s*((?:no)?\s*"+ _KNOWN_OPTION_WORD_REGEXP +")()$"),
+                                     get_regexp_obj("^\s*((?:no\s*)?"+ _KNOWN_OPTION_WORD_REGEXP +")()$"),
                                      (_TERMINAL_NOT,
                                       _TERMINAL_OPTION_WORD,))
 
@@ -627,7 +646,7 @@ _RULE_SECURE_MULTI_PARAM_EMPTY   = ("_RULE_SECURE_MULTI_PARAM_EMPTY",
                                      None,
                                      "a command parameter followed by a comma and an empty parameter",
                                      get_flags(match_repeat=False),
-                                     get_regexp_obj("^\s*([^,]+\s*,\s*)()$"),
+                                     get_regexp_obj("^\s*([^,\s][^,]*,\s*)()$"),
                                      (_TERMINAL_TOGGLE,
                                       _TERMINAL_SECURE_MULTI_PARAMETER,
                                       _TERMINAL_AND,
@@ -638,7 +657,7 @@ _RULE_SECURE_MULTI_PARAM_PARAM   = ("_RULE_SECURE_MULTI_PARAM_PARAM",
                                      None,
                                      "a command parameter followed by a comma and another non-empty parameter",
                                      get_flags(match_repeat=False),
-                                     get_regexp_obj("^\s*([^,]+\s*,)(.*\S.*)$"),
+                                     get_regexp_obj("^\s*([^,\s][^,]*,)(.*\S.*)$"),
                                      (_TERMINAL_TOGGLE,
                                       _TERMINAL_SECURE_MULTI_PARAMETER,
                                       _TERMINAL_AND))
@@ -770,3 +789,7 @@ LEX_RULE_ROOT                     = ("ROOT",
                                       _RULE_INSECURE_COMMAND,
                                       _TERMINAL_PARAMETER,))
 
+''' Compiled rule table for the compiled lexing engine. '''
+_COMPILED_RULES             = {}
+COMPILED_LEX_RULE_ROOT      = compile_rule(LEX_RULE_ROOT, _COMPILED_RULES)
+COMPILED_TARGET_PARSE_RULE  = compile_rule(_RULE_TARGET_MODIFIER, _COMPILED_RULES)
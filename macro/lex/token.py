@@ -15,6 +15,17 @@ from macro.lex.warnings         import WARN_TOGGLE, WARN_UNKNOWN_VERB
 from macro.lex.ids              import *
 from macro.lex.token_base       import MacroTokenBase
 
+
+# Language attributes for tokens not found in the maps.  Language
+# attributes are read-only, so these are shared by all such tokens.
+_UNKNOWN_PARAM  = Parameter()
+_UNKNOWN_OPTION = Option()
+_UNKNOWN_ARG    = Arg()
+_UNKNOWN_UNIT   = TargetUnit()
+_PERC_UNIT      = TargetUnit(perc_target=True)
+_UNKNOWN_VERB   = Verb()
+
+
 # Token factory API--create a macro token
 def create_token(token_type=COMMAND_VERB, token_id=NULL_TOKEN_ID, data=None,
                  start=NULL_POSITION, end=NULL_POSITION, space_after=False,
@@ -31,12 +42,12 @@ def create_token(token_type=COMMAND_VERB, token_id=NULL_TOKEN_ID, data=None,
         if _lookup_token_attrs(new_token, PARAM_MAP):
             return new_token
         else:
-            new_token.attrs = Parameter(token=new_token)
+            new_token.attrs = _UNKNOWN_PARAM
 
     elif token_type == OPTION_WORD:
         new_token.data = new_token.data.lower()
         if not _lookup_token_attrs(new_token, OPTION_MAP):
-            new_token.attrs = Option(token=new_token)
+            new_token.attrs = _UNKNOWN_OPTION
 
     elif token_type == OPTION_ARG:
         if _lookup_token_attrs(new_token, ARG_MAP):
@@ -47,11 +58,8 @@ def create_token(token_type=COMMAND_VERB, token_id=NULL_TOKEN_ID, data=None,
         elif _lookup_token_attrs(new_token, ARG_MAP,
                                data=new_token.data.upper()):
             new_token.data = new_token.data.upper()
-        elif new_token.data_type is int:
-            new_token.attrs = Arg(token=new_token,
-                                  is_numeric=True)
         else:
-            new_token.attrs = Arg(token=new_token)            
+            new_token.attrs = _UNKNOWN_ARG
 
     elif token_type == TARGET_OBJ:
         # If this is part of a chain (i.e. Unit-target),
@@ -68,19 +76,18 @@ def create_token(token_type=COMMAND_VERB, token_id=NULL_TOKEN_ID, data=None,
             new_token.data = new_token.data.lower()
         # Is this a %t?
         elif new_token.data == "%t" or new_token.data == "%T":
-            new_token.attrs = TargetUnit(token=new_token,
-                                         perc_target=True)
+            new_token.attrs = _PERC_UNIT
         # Named unit.
         else:
             new_token.render_desc = lookup
-            new_token.attrs = TargetUnit(token=new_token)
+            new_token.attrs = _UNKNOWN_UNIT
 
 
     elif token_type == COMMAND_VERB or token_type == META_COMMAND_VERB:
         new_token.data = new_token.data.lower()
         # Is this an unknown verb?  If so, file a warning.
         if not _lookup_token_attrs(new_token, VERB_MAP):
-            new_token.attrs = Verb(token=new_token)
+            new_token.attrs = _UNKNOWN_VERB
             new_token.warn  = (WARN_UNKNOWN_VERB,)
 
     elif token_type == COMMENTED_LINE:
@@ -93,9 +100,7 @@ def create_token(token_type=COMMAND_VERB, token_id=NULL_TOKEN_ID, data=None,
 def _lookup_token_attrs(token, attr_map, data=None):
     if not data: data = token.data
     if data in attr_map:
-        attrs = attr_map[data]
-        attrs.token = token
-        token.attrs = attrs
+        token.attrs = attr_map[data]
         return True
     return False
 
@@ -112,6 +117,7 @@ class MacroToken(MacroTokenBase):
     The language description data structures contribute attributes to
     each token.  See language.py for detals.
     """
+    __slots__ = ('attrs', 'add_space_after', 'param_data_obj')
     space_norm_re = re.compile('(\s{2,})')
 
     def __init__(self, token_type, token_id=NULL_TOKEN_ID, data=None,
@@ -135,6 +141,10 @@ class MacroToken(MacroTokenBase):
         # a space added after to function
         self.add_space_after = add_space_after
         self.data_type       = None
+        # Reference to the wow data object (i.e. an Item or Spell)
+        # describing this token's data, if it was looked up.  Kept on
+        # the token as the language attributes are shared.
+        self.param_data_obj  = None
         # Boolean marker whether not this token was constructed
         # due to the presence of another token.
         self.added           = False
@@ -193,19 +203,19 @@ class MacroToken(MacroTokenBase):
     # Is there external wow data for this token?
     def found(self):
         try:
-            return self.attrs.param_data_obj.found()
+            return self.param_data_obj.found()
         except:
             return False
 
     # A few shortcuts
     def slot(self):
         try:
-            return self.attrs.param_data_obj.get_slot()
+            return self.param_data_obj.get_slot()
         except:
             return None
     def name(self):
         try:
-            self.attrs.param_data_obj.get_name()
+            self.param_data_obj.get_name()
         except:
             pass
         return self.data
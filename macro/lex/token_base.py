@@ -4,8 +4,51 @@ Macro base class.
 
 from macro.lex.ids              import PARAMETER, INTERPRETER_TEXT
 
+# Helper to get every slot of a token class, base classes first.
+# Memoized by class.
+_ALL_SLOTS = {}
+def get_all_slots(cls):
+    slots = _ALL_SLOTS.get(cls)
+    if slots is None:
+        slots = []
+        for c in reversed(cls.__mro__):
+            slots.extend(c.__dict__.get('__slots__', ()))
+        slots = _ALL_SLOTS[cls] = tuple(slots)
+    return slots
+
+
+# Helper to get the (getstate, setstate, copy) functions for a token
+# class.  Tokens are copied on every lex cache hit, and a loop of
+# getattr/setattr calls over the slots is many times slower than the
+# instance dict copy slots replaced, so these are built as
+# straight-line code over the slots, as namedtuple does.  Memoized by
+# class.
+_STATE_FUNCS = {}
+_STATE_FUNCS_SRC = """
+def getstate(t):
+    return (%(get)s,)
+def setstate(t, state):
+    (%(set)s,) = state
+def copy(t):
+    n = new(cls)
+    (%(set_n)s,) = (%(get)s,)
+    return n
+"""
+def get_state_funcs(cls):
+    funcs = _STATE_FUNCS.get(cls)
+    if funcs is None:
+        slots = get_all_slots(cls)
+        src   = _STATE_FUNCS_SRC % {'get':   ', '.join(['t.%s' % name for name in slots]),
+                                    'set':   ', '.join(['t.%s' % name for name in slots]),
+                                    'set_n': ', '.join(['n.%s' % name for name in slots])}
+        namespace = {'new': object.__new__, 'cls': cls}
+        exec src in namespace
+        funcs = _STATE_FUNCS[cls] = (namespace['getstate'], namespace['setstate'], namespace['copy'])
+    return funcs
+
+
 # Base class.  Only defines a render_init function.
-class MacroTokenBase:
+class MacroTokenBase(object):
     """MacroTokenBase
 
     Contains rendering and untility members shared across
@@ -18,7 +61,29 @@ class MacroTokenBase:
       js           -- Enable javascript highlighting
       strike       -- Strike out tokens the interpreter marks as useless
       render_space_after -- self-explanatory!
+
+    There are a great many tokens per macro, so they have slots
+    rather than a dict.  Subclasses must declare slots for anything
+    they add.
     """
+    __slots__ = ('token_type', 'token_id', 'data', 'start', 'end',
+                 'space_after', 'data_type',
+                 'error', 'warn', 'render_desc', 'error_desc', 'js',
+                 'highlight', 'wowhead', 'strike', 'render_space_after',
+                 'index', 'added')
+
+    # Tokens are pickled into memcache along with interpreted macros.
+    # Slotted objects need their state spelled out; a tuple of values
+    # in slot order is also smaller than a dict.
+    def __getstate__(self):
+        return get_state_funcs(self.__class__)[0](self)
+    def __setstate__(self, state):
+        get_state_funcs(self.__class__)[1](self, state)
+
+    def copy(self):
+        ''' Get a shallow copy of this token. '''
+        return get_state_funcs(self.__class__)[2](self)
+
     def init_render_base(self,
                          render_desc=None,
                          js=False,
@@ -11,7 +11,7 @@ from sys import exit
 from macro.exceptions       import *
 from macro.logger           import logger
 from macro.util             import clean_macro
-from macro.lex.lexer        import GLOBAL_MACRO_TOKENIZER, MacroCommandTokenizer
+from macro.lex.lexer        import MacroCommandTokenizer
 from macro.lex.token        import MacroToken
 from macro.lex.ids          import *
 
@@ -42,10 +42,10 @@ class MacroParser:
         ''' Constructor '''
         self.DEBUG = debug
         
-        # Save the lexer object
+        # Save the lexer object.  Each parser gets its own tokenizer
+        # unless one is passed in, so parsers never share lex state.
         if lexer_obj is None:
-            self.__tokenizer = GLOBAL_MACRO_TOKENIZER
-            self.__tokenizer.DEBUG = debug
+            self.__tokenizer = MacroCommandTokenizer(debug=debug)
         elif isinstance(lexer_obj, MacroCommandTokenizer): 
             self.__tokenizer = lexer_obj
         else:
@@ -57,7 +57,7 @@ class MacroParser:
         # Parse the macro if we got one.
         if macro is not None: self.lex_and_parse_macro(macro)
 
-    # Lex the macro with the global lexer instance.
+    # Lex the macro with this parser's lexer instance.
     # This is just a shortcut method.
     def lex_macro(self, macro_input_line, index):
         self.macro_line = clean_macro(macro_input_line)
@@ -0,0 +1,113 @@
+'''
+Validate-only pass over a macro.
+
+Lexes and parses each command, and reports where the errors and
+warnings are, without interpreting it.  Nothing here looks up spell or
+item data, or touches the datastore or memcache, so this is much
+cheaper than a full interpretation.  Useful where all that is needed
+is "is this macro valid, and if not, where is it wrong?", i.e. the
+addon and editors.
+'''
+
+import re
+
+from macro.exceptions        import *
+from macro.util              import NULL_POSITION
+from macro.parse.parser      import MacroParser
+from macro.interpret.errors  import MAX_LEN_ALLOWED, MACRO_LEN_ERROR
+
+# Span types.
+SPAN_ERROR = 'error'
+SPAN_WARN  = 'warn'
+
+
+# Helper to make a span.  Lines are numbered from 0, as the lines of
+# the macro text, and start/end are offsets into that line.
+def _span(span_type, line, start, end, msg):
+    return {'type':  span_type,
+            'line':  line,
+            'start': start,
+            'end':   end,
+            'msg':   msg}
+
+
+# Helper to get the text of a token warning/error tuple, as
+# render_err_msg does, but unescaped.
+def get_msg_txt(msg_tuple):
+    msg = msg_tuple[0]
+    if len(msg_tuple) > 1:
+        return msg % tuple([' '.join([t.get_error_desc() for t in e_list])
+                            for e_list in msg_tuple[1:]])
+    return msg
+
+
+# Helper to get the span for a parser error: the token it is about,
+# else the verb, else the whole line.
+def _parser_error_span(instance, line, macro_line):
+    msg = instance.get_debug_str().strip()
+    for token in (instance.get_token(), instance.cmd):
+        if token is not None and token.start != NULL_POSITION:
+            return _span(SPAN_ERROR, line, token.start, token.end, msg)
+    return _span(SPAN_ERROR, line, 0, len(macro_line), msg)
+
+
+# Validate a macro.
+def validate_macro(macro, parser=None):
+    '''
+    Lex and parse each command in a macro, without interpreting it.
+    A parser can be passed in to reuse across calls.
+
+    Returns a dict:
+
+    macro_good -- True if the macro has no errors
+    macro_len  -- Length of the macro
+    spans      -- List of error and warning spans, in order, each a
+                  dict of type ('error' or 'warn'), line, start, end
+                  and msg
+
+    Raises InitError if there is no macro.
+    '''
+    if not macro or macro.isspace():
+        raise InitError("No valid macro input.")
+    if parser is None: parser = MacroParser()
+
+    # Split into lines as the interpreter does, but keep the line
+    # numbers of the text.
+    macro_lines = re.compile("\r*\n").split(macro)
+    macro_len   = len('\n'.join([l for l in macro_lines if l and not l.isspace()]))
+    spans       = []
+
+    # Too long?  Mark from the first character over the limit.
+    if macro_len > MAX_LEN_ALLOWED:
+        offset = 0
+        for line, macro_line in enumerate(macro_lines):
+            if len(macro_line) == 0 or macro_line.isspace(): continue
+            if offset + len(macro_line) > MAX_LEN_ALLOWED:
+                spans.append(_span(SPAN_ERROR, line, max(0, MAX_LEN_ALLOWED - offset), len(macro_line),
+                                   MACRO_LEN_ERROR % (macro_len, MAX_LEN_ALLOWED)))
+                break
+            offset += len(macro_line) + 1
+        return {'macro_good': False, 'macro_len': macro_len, 'spans': spans}
+
+    index = 0
+    for line, macro_line in enumerate(macro_lines):
+        if len(macro_line) == 0 or macro_line.isspace(): continue
+        try:
+            parser.lex_and_parse_macro(macro_line, index)
+        except LexerError, instance:
+            spans.append(_span(SPAN_ERROR, line, instance.get_start(), instance.get_end(),
+                               ("%s" % instance).strip()))
+            index += 1
+            continue
+        except ParserError, instance:
+            spans.append(_parser_error_span(instance, line, macro_line))
+
+        # Anything the parser flagged on the tokens.
+        for t in parser.get_tokens():
+            if t.warn:  spans.append(_span(SPAN_WARN,  line, t.start, t.end, get_msg_txt(t.warn)))
+            if t.error: spans.append(_span(SPAN_ERROR, line, t.start, t.end, get_msg_txt(t.error)))
+        index += 1
+
+    return {'macro_good': len([s for s in spans if s['type'] == SPAN_ERROR]) == 0,
+            'macro_len':  macro_len,
+            'spans':      spans}
@@ -5,11 +5,12 @@ Create a response for a remote query from the addon interface.
 from google.appengine.api             import memcache
 from django.utils                     import simplejson
 
-from macro.render.util                import get_macro_obj_from_id, get_view_dict_from_macro_id, render_template
+from macro.render.util                import get_macro_obj_from_id, get_view_dict_from_macro_id, render_template, get_macro_content_key
 from macro.render.defs                import *
-from macro.data.appengine.defs        import MEMCACHED_API 
+from macro.data.appengine.defs        import MEMCACHED_API, MACRO_RENDER_KEY, MEMCACHED_MACRO_PROC
 from macro.render.errors              import render_err_msg
 from macro.util                       import valid
+from macro.parse.validate             import validate_macro
 
 # Genereate the edit macro page.
 def generate_api_response(path, macro_id, r_type='xml'):
@@ -32,8 +33,14 @@ def generate_api_response(path, macro_id, r_type='xml'):
     # Call helper to interpret the macro behind the id.
     macro_obj = get_macro_obj_from_id(macro_id, response_dict['macro_input'])
 
-    # Add macro, with or without errors.
-    response_dict['interpret'] = _translate_parsed_macro(macro_obj),
+    # Add macro, with or without errors.  The translation is the same
+    # for xml and JSON, so it is cached by content for both.
+    interpret_key = MACRO_RENDER_KEY % (get_macro_content_key(macro_obj.macro), "api")
+    interpret = memcache.get(interpret_key)
+    if interpret is None:
+        interpret = translate_parsed_macro(macro_obj)
+        memcache.add(interpret_key, interpret, MEMCACHED_MACRO_PROC)
+    response_dict['interpret'] = interpret,
 
     # Render to response type requested.
     if r_type == 'xml':
@@ -50,10 +57,27 @@ def generate_api_response(path, macro_id, r_type='xml'):
     return response
 
 
-# Internal method to translate an InterpretedMacro into a format for
-# rendering into xml or JSON.
-def _translate_parsed_macro(macro_obj):
-    ''' Internal method to translate an InterpretedMacro into a format
+# Generate a validate-only response.
+def generate_validate_response(path, macro, r_type='xml'):
+    '''
+    Generate an XML/JSON list of the error and warning spans in a
+    macro, lexing and parsing it but not interpreting it.  Nothing is
+    looked up, and neither the datastore nor memcache is used.
+
+    Raises InitError if there is no macro.
+    '''
+    response_dict = validate_macro(macro)
+    if r_type == 'xml':
+        return render_template('xml_validate.template',
+                               response_dict,
+                               path)
+    return simplejson.dumps(response_dict)
+
+
+# Translate an InterpretedMacro into a format for rendering into xml
+# or JSON.  Also used by the batch interpreter.
+def translate_parsed_macro(macro_obj):
+    ''' Method to translate an InterpretedMacro into a format
     for rendering into xml or JSON.
 
     Returns a list of lists:
@@ -98,10 +122,10 @@ def _translate_parsed_macro(macro_obj):
 
         # Wowhead
         if t.wowhead and t.found():
-            if t.attrs.param_data_obj.is_spell():
-                tok.append(URL_WOWHEAD_SPELL % (t.attrs.param_data_obj.get_id()))
+            if t.param_data_obj.is_spell():
+                tok.append(URL_WOWHEAD_SPELL % (t.param_data_obj.get_id()))
             else:
-                tok.append(URL_WOWHEAD_ITEM  % (t.attrs.param_data_obj.get_id()))
+                tok.append(URL_WOWHEAD_ITEM  % (t.param_data_obj.get_id()))
         else:
             tok.append('')
 
@@ -0,0 +1,80 @@
+'''
+Conditional GET for responses about saved macros.
+
+Saved macros are never edited, so a tooltip or API response for one
+only changes when the app, the spell and item data or the rendering
+does.  Each gets a strong ETag from those and the macro id.  A
+request whose If-None-Match has the ETag gets a 304, without the
+macro being fetched or interpreted.
+
+View pages get neither: they show the live views and rating, and
+every view has to reach the handler to be counted.
+'''
+
+import os
+import time
+import hashlib
+from email.utils                      import formatdate
+
+from macro.render.defs                import RENDER_VERSION
+from macro.data.appengine.defs        import DATA_VERSION
+
+
+# The app version.  On deploy, the minor version is the deploy time
+# shifted up 28 bits; that is when anything served by this version
+# was last modified.  Otherwise, use the time this process started.
+_VERSION_ID = os.environ.get("CURRENT_VERSION_ID", "")
+
+def _get_deploy_time(version_id):
+    try:
+        return int(version_id.split(".")[1]) >> 28
+    except (IndexError, ValueError):
+        return int(time.time())
+
+LAST_MODIFIED = formatdate(_get_deploy_time(_VERSION_ID), usegmt=True)
+
+
+# Get the ETag for a response about a saved macro.
+def get_macro_etag(macro_id, kind):
+    ''' Strong ETag for a response of the given kind, i.e. 'tt',
+    'xml' or 'json', for a saved macro. '''
+    if isinstance(macro_id, unicode): macro_id = macro_id.encode("utf-8")
+    key = "\n".join([kind, macro_id, _VERSION_ID, DATA_VERSION, RENDER_VERSION])
+    return '"%s"' % hashlib.sha1(key).hexdigest()
+
+
+# Check an If-None-Match header against an ETag.
+def etag_matches(if_none_match, etag, exists=False):
+    ''' True if the If-None-Match header value lists the ETag, or is
+    "*" and the resource is known to exist.  As the RFC requires for
+    If-None-Match, weak tags in the header match too. '''
+    if not if_none_match: return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"): tag = tag[2:]
+        if tag == etag or (tag == "*" and exists): return True
+    return False
+
+
+# Check a request for an ETag.
+def is_not_modified(request, etag, exists=False):
+    ''' True if the client already has the response with this
+    ETag.  Pass exists if the macro is known to exist, for "*" to
+    match; checks made before fetching it can't know. '''
+    return etag_matches(request.headers.get("If-None-Match"), etag, exists)
+
+
+# Set the caching headers on a full response.
+def set_cache_headers(response, etag, max_age):
+    ''' Set ETag, Last-Modified and Cache-Control on a response. '''
+    response.headers["ETag"]          = etag
+    response.headers["Last-Modified"] = LAST_MODIFIED
+    response.headers["Cache-Control"] = "public, max-age=%d" % max_age
+
+
+# Answer with a 304.
+def send_not_modified(response, etag, max_age):
+    ''' Make a response a 304, with no body.  The caching headers are
+    sent again, as they would be on the full response. '''
+    response.set_status(304)
+    set_cache_headers(response, etag, max_age)
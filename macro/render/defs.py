@@ -49,6 +49,18 @@ MINOR_VERSION = 0
 PATCH_VERSION = 6
 
 
+''' Version of the rendered html.  Part of the ETags for saved
+macro tooltips and API responses, so bump this when the templates or the rendering
+change. '''
+RENDER_VERSION = "1"
+
+
+''' HTTP cache lifetimes, in seconds, for tooltips and API
+responses.  View pages aren't cached. '''
+HTTP_MAX_AGE_TT   = 3600
+HTTP_MAX_AGE_API  = 3600
+
+
 ''' Static URL '''
 STATIC_URL = """http://static.macroexplain.com"""
 
@@ -58,6 +70,8 @@ URL_MACRO_SEARCH  = '/s/.*'
 URL_MACRO_VIEW    = '/m.*'
 URL_MACRO_XML     = '/xml/m.*'
 URL_MACRO_JSON    = '/json/m.*'
+URL_VALIDATE_XML  = '/xml/v.*'
+URL_VALIDATE_JSON = '/json/v.*'
 URL_MACRO_PROCESS = '/'
 URL_SAVE_PROCESS  = '/save'
 URL_SAVE_ERROR    = '/error'
@@ -68,6 +82,8 @@ URL_SEARCH        = '/search'
 URL_TYPEAHEAD     = '/_ta'
 URL_RATE          = '/_rate'
 URL_MACRO_TT      = '/_tt'
+URL_MACRO_LIVE    = '/_live'
+URL_FLUSH         = '/_flush'
 
 
 ''' CGI Vars '''
@@ -94,6 +110,7 @@ FORM_MACRO_ID     = 'id'
 ''' Save form Vars '''
 FORM_MACRO_INPUT  = 'i'
 FORM_MACRO_ESC    = 'esc'
+FORM_LINE_KEYS    = 'k'
 FORM_QUERY_ESC    = 'qesc'
 FORM_SAVE_TITLE   = 't'
 FORM_SAVE_NAME    = 'n'
@@ -27,6 +27,8 @@ TOKEN_CS_OFF            = "token_hl_off"
 # More efficient to encode these here than read them in from files.
 TOKEN_BASE_STYLE        = """<style type='text/css'><!-- .""" + TOKEN_CS_OFF + """-%s-%s { }--></style>"""
 TOKEN_JS_STYLE          = """<style type='text/css'><!-- .""" + TOKEN_CS_ON + """-%s-%s { color: #212527; background-color:#6e777a; } .""" + TOKEN_CS_OFF + """-%s-%s { } --></style>"""
+TOKEN_JS_SELECTOR       = """.""" + TOKEN_CS_ON + """-%s-%s"""
+TOKEN_JS_STYLESHEET     = """<style type='text/css'><!-- %s { color: #212527; background-color:#6e777a; } --></style>"""
 TOKEN_WOWHEAD_SPELL     = """<a class="wowhead" href="http://www.wowhead.com/?spell=%s">%s</a>"""
 TOKEN_WOWHEAD_ITEM      = """<a class="wowhead" href="http://www.wowhead.com/?item=%s">%s</a>"""
 TOKEN_PARAM_TT          = """<font class='tt_p'>%s</font>"""
@@ -49,15 +51,15 @@ def generate_cmd_txt(cmd_token_list):
 
 
 # Generate html from the actual command string.
-def generate_cmd_html(cmd_token_list, show_err=True, tt=False):
+def generate_cmd_html(cmd_token_list, show_err=True, tt=False, styles=None):
     ''' Given list of cmd tokens, render and return html.'''
     if tt:
         return TT_CMD_HTML % render_token_list(cmd_token_list, is_cmd=True, show_err=show_err, tt=True)        
-    return CMD_HTML % render_token_list(cmd_token_list, is_cmd=True, show_err=show_err)
+    return CMD_HTML % render_token_list(cmd_token_list, is_cmd=True, show_err=show_err, styles=styles)
 
 
 # Generate html from an interpretation object
-def generate_interpret_html(interp_tuple_list, show_err=True, cmd_error=False, tt=False):
+def generate_interpret_html(interp_tuple_list, show_err=True, cmd_error=False, tt=False, styles=None):
     ''' Given a list of ([if token list], [then token list]) tuples,
     render and return html.'''
     ret = []
@@ -72,24 +74,34 @@ def generate_interpret_html(interp_tuple_list, show_err=True, cmd_error=False, t
         else:
             if if_list:
                 ret.append(INTERPRETED_CMD_HTML % \
-                           tuple([render_token_list(if_list, show_err=show_err, tt=tt),
-                                 render_token_list(do_list, show_err=show_err, tt=tt)]))
+                           tuple([render_token_list(if_list, show_err=show_err, tt=tt, styles=styles),
+                                 render_token_list(do_list, show_err=show_err, tt=tt, styles=styles)]))
             else:
-                ret.append(render_token_list(do_list, show_err=show_err, tt=tt))
+                ret.append(render_token_list(do_list, show_err=show_err, tt=tt, styles=styles))
     html = INTERPRETATION_SEP.join(ret)
     if cmd_error:
         return INTERPRETED_BAD_HTML % INTERPRETATION_SEP.join(ret)
     return html
 
 
+# Generate the stylesheet for the JS tokens collected while rendering.
+def generate_token_styles(styles):
+    ''' Given the set of (index, token id) pairs collected while
+    rendering with a styles set, return a single stylesheet for the
+    highlighting of all of them, or the empty string if there are
+    none.'''
+    if not styles: return ''
+    return TOKEN_JS_STYLESHEET % ','.join([TOKEN_JS_SELECTOR % s for s in sorted(styles)])
+
+
 # Given a list of tokens, render them into HTML.
-def render_token_list(token_list, is_cmd=False, show_err=True, tt=False):
+def render_token_list(token_list, is_cmd=False, show_err=True, tt=False, styles=None):
     '''Given a list of tokens, render them into HTML.
     The is_raw_cmd parameter indicates whether the cmd or
     the interpretation is being rendered.'''
     rendered_list = []
     for t in token_list:
-        rendered_list.append(render_token_html(t, is_cmd, show_err, tt))
+        rendered_list.append(render_token_html(t, is_cmd, show_err, tt, styles))
         if (is_cmd and (t.space_after or t.add_space_after)) or \
                t.render_space_after:
             rendered_list.append(' ')
@@ -97,7 +109,7 @@ def render_token_list(token_list, is_cmd=False, show_err=True, tt=False):
 
 
 # Markup a token into HTML
-def render_token_html(t, is_cmd=False, show_err=True, tt=False):
+def render_token_html(t, is_cmd=False, show_err=True, tt=False, styles=None):
     '''
     Given a token, generate HTML output (including javascript)
     for insertion in place of the token.
@@ -106,6 +118,10 @@ def render_token_html(t, is_cmd=False, show_err=True, tt=False):
       t      - Token
       is_cmd - Whether or not to render as cmd or interpretation.
       tt     - Render as tt text with minimal markup
+      styles - Set to collect the (index, token id) of JS tokens in,
+               for one stylesheet per macro (see
+               generate_token_styles).  If None, each JS token gets
+               a stylesheet of its own.
 
     Returns:
       String of token html.
@@ -128,16 +144,19 @@ def render_token_html(t, is_cmd=False, show_err=True, tt=False):
 
     # First markup the text with t.wowhead links if requested
     if t.wowhead and t.found():
-        if t.attrs.param_data_obj.is_spell():
-            tok_str = TOKEN_WOWHEAD_SPELL % (t.attrs.param_data_obj.get_id(),
+        if t.param_data_obj.is_spell():
+            tok_str = TOKEN_WOWHEAD_SPELL % (t.param_data_obj.get_id(),
                                              tok_str)
         else:
-            tok_str = TOKEN_WOWHEAD_ITEM  % (t.attrs.param_data_obj.get_id(),
+            tok_str = TOKEN_WOWHEAD_ITEM  % (t.param_data_obj.get_id(),
                                              tok_str)
     # Next add the style and span.
     if t.js:
-        html.append(TOKEN_JS_STYLE % (t.index, t.token_id,
-                                        t.index, t.token_id))
+        if styles is None:
+            html.append(TOKEN_JS_STYLE % (t.index, t.token_id,
+                                            t.index, t.token_id))
+        else:
+            styles.add((t.index, t.token_id))
         if t.strike:
             html.append(TOKEN_JS_SPAN_STRIKE % (t.index, t.token_id,
                                                     tok_str))
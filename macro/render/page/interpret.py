@@ -4,10 +4,12 @@ Rendering for view and interpret pages.
 
 import urllib
 from google.appengine.api import memcache
+from django.utils         import simplejson
 
 # My modules
 from macro.render.defs                import *
-from macro.render.util                import escape, translate_classmap, render_template, get_macro_obj_from_id, render_macro, get_view_dict_from_macro_id
+from macro.render.util                import escape, translate_classmap, render_template, get_macro_obj, get_macro_obj_from_id, render_macro, render_macro_line, get_view_dict_from_macro_id
+from macro.render.interpretation      import generate_token_styles
 from macro.util                       import valid, NULL_POSITION
 from macro.exceptions                 import NoInputError
 from macro.data.appengine.savedmacro  import SavedMacroOps
@@ -104,9 +106,9 @@ def generate_edit_page(path, macro=None, save_values={}, macro_id=None):
         macro_obj = get_macro_obj_from_id(macro_id)
         macro     = macro_obj.macro
     elif valid(macro):
-        # Import big modules locally to avoid unneccesary work.
-        from macro.interpret.interpreter import MacroInterpreter
-        macro_obj = MacroInterpreter().interpret_macro(macro)
+        # Pasted macros are cached by content too, so popular ones
+        # are only interpreted once.
+        macro_obj = get_macro_obj(macro)
 
      # If we got a good macro, display its interpretation
     if valid(macro):
@@ -179,6 +181,40 @@ def generate_edit_page(path, macro=None, save_values={}, macro_id=None):
                            path)
 
 
+# Generate a live preview update for the edit page.
+def generate_live_response(macro, known_keys=[]):
+    '''
+    Re-interpret a macro as it is edited, and return JSON with only
+    the lines that changed.  known_keys are the line keys of what the
+    page is currently showing, from the last response; lines whose key
+    is unchanged are left out.  The response is:
+
+    keys          -- Line key for each command
+    lines         -- [index, command html, interpretation html] for
+                     each changed line
+    style         -- Stylesheet for the highlighting of the changed
+                     lines, to add to the page
+    macro_good, macro_changed, macro_len -- As for the macro
+
+    Lines are interpreted with the process-wide line cache, and
+    nothing is cached in memcache.  Propogates exceptions up.
+    '''
+    from macro.interpret.interpreter import MacroInterpreter
+    macro_obj, line_keys = MacroInterpreter().interpret_macro_incremental(macro)
+    lines  = []
+    styles = set()
+    for i, cmd in enumerate(macro_obj):
+        if i < len(known_keys) and known_keys[i] == line_keys[i]: continue
+        rendered = render_macro_line(cmd, styles=styles)
+        lines.append([i, rendered['line'], rendered['interpret']])
+    return simplejson.dumps({'keys':          line_keys,
+                             'lines':         lines,
+                             'style':         generate_token_styles(styles),
+                             'macro_good':    macro_obj.macro_good,
+                             'macro_changed': macro_obj.macro_changed,
+                             'macro_len':     macro_obj.macro_len})
+
+
 #
 # Internal Functions
 #
@@ -6,11 +6,13 @@ Collection of shared tools for appengine page rendering.
 from macro.render.defs                import *
 from macro.render.util                import render_template
 from macro.data.appengine.savedmacro  import SavedMacroOps
+from macro.data.local.tagindex        import AND_SEP, OR_SEP
 
 # Generate a search results page.
-def generate_search_page(path, terms, page, sort, page_size=DEF_SEARCH_RESULTS):
+def generate_search_page(path, terms, page, sort, page_size=DEF_SEARCH_RESULTS, after=None):
     '''
-    Generate a search results page.
+    Generate a search results page.  after is the position token
+    from the page before's next link, if there is one.
     '''
     error = None
 
@@ -22,18 +24,29 @@ def generate_search_page(path, terms, page, sort, page_size=DEF_SEARCH_RESULTS):
         page = int(page)
         prev_page = page - 1
         
-    # Do the search
+    # Do the search.  The tag index answers queries of several tags
+    # from memory; single tags are searched in the datastore.
     # TODO: Add column sort
     results = []
+    next_after = None
     is_next_page = False
-    if (len(terms) < SINGLE_TAG_MAX_LENGTH):
-        (results, is_next_page) = SavedMacroOps.search(terms, page=page, num=page_size, sort=sort)
+    is_multi = (AND_SEP in terms) or (OR_SEP in terms)
+    max_length = SINGLE_TAG_MAX_LENGTH
+    if is_multi: max_length = ALL_TAGS_MAX_LENGTH
+    if (len(terms) < max_length):
+        found = SavedMacroOps.search_tags(terms, page=page, num=page_size, sort=sort)
+        if found is not None:
+            (results, is_next_page) = found
+        elif is_multi:
+            error = "Searching for several tags at once only works by views or rating.  Try one tag?"
+        else:
+            (results, next_after) = SavedMacroOps.search(terms, page=page, num=page_size, sort=sort, after=after)
+            is_next_page = next_after is not None
     else:
         error = "Query term too long."
-        terms = terms[:SINGLE_TAG_MAX_LENGTH] + "..."
+        terms = terms[:max_length] + "..."
 
-    # If the number of results is less than that of page_size,
-    # then there is no next page.
+    # Is there a next page?
     next_page = None
     if is_next_page: next_page = page + 1
 
@@ -58,11 +71,13 @@ def generate_search_page(path, terms, page, sort, page_size=DEF_SEARCH_RESULTS):
                                                          'results'    : results,
                                                          'sort'       : sort,
                                                           'page_var'   : FORM_SEARCH_PAGE,
+                                                         'cursor_var' : FORM_SEARCH_CURSOR,
                                                          
                                                          # Only give a prev page if we're over page 1.
                                                          'prev_page'  : prev_page,
                                                          'page'       : page,
                                                          'next_page'  : next_page,
+                                                         'next_after' : next_after,
                                                          },
                                                         path)},
                            path)
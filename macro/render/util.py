@@ -2,9 +2,11 @@
 Utilities used in front-end rendering
 '''
 import os
+import re
 import urllib
 import time
 import logging
+import hashlib
 from operator                         import itemgetter
 from google.appengine.api             import memcache
 from google.appengine.ext.webapp      import template
@@ -12,10 +14,11 @@ from google.appengine.ext.webapp      import template
 # My modules
 from macro.render.defs                import *
 from macro.exceptions                 import NoInputError
-from macro.data.appengine.defs        import MEMCACHED_VIEWS, MACRO_PROC_KEY, MACRO_VIEW_KEY, MEMCACHED_THROTTLE_SECONDS,MEMCACHED_MACRO_PROC
+from macro.data.appengine.defs        import MEMCACHED_VIEWS, MACRO_PROC_KEY, MACRO_RENDER_KEY, MACRO_VIEW_KEY, MEMCACHED_THROTTLE_SECONDS,MEMCACHED_MACRO_PROC, DATA_VERSION
 from macro.render.interpretation      import TOKEN_CS_ON, TOKEN_CS_OFF
 from macro.data.appengine.savedmacro  import SavedMacroOps
-from macro.render.interpretation      import generate_cmd_html, generate_interpret_html
+from macro.render.interpretation      import generate_cmd_html, generate_interpret_html, generate_token_styles
+from macro.render.writer              import split_macro_template, write_macro_html
 
 
 html_escape_table = {
@@ -101,51 +104,123 @@ def render_template(template_obj, template_vars={}, path=''):
     return template_obj.render(template_vars)
 
 
-# Get a processed macro from the macro id.
-def get_macro_obj_from_id(macro_id, macro=None):
-    '''Get a processed macro from the macro id.  Raises an exception
-    on error.  Assumes valid input.  Incrments the view counter
-    for this macro.'''
+# Lines are split the same way by the interpreter.
+_MACRO_LINE_RE = re.compile("\r*\n+")
+
+# Get the content key for a macro.
+def get_macro_content_key(macro):
+    ''' Key for caching anything derived from the text of a macro.
+    Macros that interpret identically (i.e. differ only in line
+    endings) share a key.  The data version is part of the key; the
+    app version is added by the memcache key defs. '''
+    text = "\n".join(_MACRO_LINE_RE.split(macro))
+    if isinstance(text, unicode): text = text.encode("utf-8")
+    return "%s%s" % (hashlib.sha1(text).hexdigest(), DATA_VERSION)
+
+
+# Get a processed macro from the macro text.
+def get_macro_obj(macro):
+    '''Get a processed macro for the macro text, from memcache if
+    this macro has been interpreted before.  Raises an exception on
+    error.'''
+    key = MACRO_PROC_KEY % get_macro_content_key(macro)
 
     # First check memcache for a processed macro object:
-    macro_obj = memcache.get(MACRO_PROC_KEY % macro_id)
+    macro_obj = memcache.get(key)
     if not macro_obj:
-        # Nothing from memcache, load from data store.
-        if not macro:
-            saved_macro_entity = SavedMacroOps.get_macro_entity(macro_id)
-            # If saved_macro_entity is still none, we failed
-            # in the datastore.
-            if saved_macro_entity is None:
-                raise NoInputError("Macro id '%s' not found." % macro_id)
-            macro = saved_macro_entity.macro
-
         # Process the macro, lazily importing.
         from macro.interpret.interpreter import MacroInterpreter
         macro_obj = MacroInterpreter().interpret_macro(macro)
 
         # Save macro in memcached.
-        memcache.add(MACRO_PROC_KEY % macro_id,
-                     macro_obj,
-                     MEMCACHED_MACRO_PROC)
+        memcache.add(key, macro_obj, MEMCACHED_MACRO_PROC)
+    else:
+        # May have been cached from text that only differs in line
+        # endings; hand back this text.
+        macro_obj.macro = macro
     return macro_obj
 
 
+# Get a processed macro from the macro id.
+def get_macro_obj_from_id(macro_id, macro=None):
+    '''Get a processed macro from the macro id.  Raises an exception
+    on error.  Assumes valid input.'''
+    if not macro:
+        saved_macro_entity = SavedMacroOps.get_macro_entity(macro_id)
+        # If saved_macro_entity is still none, we failed
+        # in the datastore.
+        if saved_macro_entity is None:
+            raise NoInputError("Macro id '%s' not found." % macro_id)
+        macro = saved_macro_entity.macro
+    return get_macro_obj(macro)
+
+
 # Render a processed macro's interpretation into a template.
 def render_macro(macro_obj, path, errors=True, tt=False, template='processed_macro.template'):
-    ''' Helper to render macro interpretation into a template. '''
+    ''' Helper to render macro interpretation into a template.
+    The output is cached under the macro's content key. '''
+    key = MACRO_RENDER_KEY % (get_macro_content_key(macro_obj.macro),
+                              "%d%d%s" % (errors, tt, template))
+    rendered = memcache.get(key)
+    if rendered is None:
+        rendered = render_macro_html(macro_obj, path, errors, tt, template)
+        memcache.add(key, rendered, MEMCACHED_MACRO_PROC)
+    return rendered
+
+
+# Macro templates split up for write_macro_html, by (template, path).
+# None for templates that can't be.
+_SPLIT_TEMPLATES = {}
+
+
+# Render without the cache.
+def render_macro_html(macro_obj, path, errors=True, tt=False, template='processed_macro.template'):
+    ''' Render macro interpretation into a template, uncached.  The
+    html is written directly, into the static parts of the template;
+    see macro.render.writer. '''
+    key = (template, path)
+    if key not in _SPLIT_TEMPLATES:
+        _SPLIT_TEMPLATES[key] = split_macro_template(
+            lambda macro, style: render_template(template,
+                                                 {'macro'       : macro,
+                                                  'macro_style' : style},
+                                                 path))
+    chunks = _SPLIT_TEMPLATES[key]
+    if chunks is None:
+        return render_macro_template_html(macro_obj, path, errors, tt, template)
+    return write_macro_html(chunks, macro_obj, errors, tt)
+
+
+# Render through the template itself.
+def render_macro_template_html(macro_obj, path, errors=True, tt=False, template='processed_macro.template'):
+    ''' Render macro interpretation into a template with Django,
+    uncached.  Gives the same html as render_macro_html, only
+    slower. '''
     macro_output_list = []
+    styles = set()
 
     # Render the macro lines
     for cmd in macro_obj:
-        macro_output_list.append({'line':      generate_cmd_html(cmd.cmd_list, tt=tt, show_err=errors),
-                                  'interpret': generate_interpret_html(cmd.interpret, tt=tt, show_err=errors, cmd_error=cmd.error)})
+        macro_output_list.append(render_macro_line(cmd, errors, tt, styles))
         
-    # Return rendered output
+    # Return rendered output, with the highlighting for the whole
+    # macro in one stylesheet.
     return render_template(template,
-                           {'macro'    : macro_output_list},
+                           {'macro'       : macro_output_list,
+                            'macro_style' : generate_token_styles(styles)},
                            path)
          
 
+# Render a single command of a processed macro.
+def render_macro_line(cmd, errors=True, tt=False, styles=None):
+    ''' Render one InterpretedMacroCommand, as a dict of the command
+    html ('line') and the interpretation html ('interpret').  If a
+    styles set is passed, the highlighting for the line is collected
+    in it rather than rendered inline; see generate_token_styles. '''
+    return {'line':      generate_cmd_html(cmd.cmd_list, tt=tt, show_err=errors, styles=styles),
+            'interpret': generate_interpret_html(cmd.interpret, tt=tt, show_err=errors, cmd_error=cmd.error, styles=styles)}
+
+
 # Fetch a saved macro's populated view template hash
 def get_view_dict_from_macro_id(macro_id, saved_macro=None):
     # View pages are extremely heavy, and the majority of their
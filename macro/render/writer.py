@@ -0,0 +1,202 @@
+'''
+Direct html writer for interpreted macros.
+
+Writes the same html as render_token_list and the macro templates
+(processed_macro.template, tooltip.template), but in one pass into a
+single list of strings, with no template rendering per macro.
+
+The static parts of a macro template are taken from the template
+itself: it is rendered once per process with placeholder lines, and
+split at the placeholders.  So the output is the template's, byte for
+byte, for as long as the template loops over the macro's lines in the
+usual way; templates that don't are left to Django.
+'''
+
+import re
+
+from macro.render.errors          import generate_token_warning, generate_token_error
+from macro.render.encoding        import html_escape_table, insert_breaks, TT_TOKEN_LIMIT, TOKEN_LIMIT
+from macro.render.interpretation  import *
+
+
+# Escaping, by table.  Most tokens have nothing to escape.
+_ESCAPE_RE = re.compile(u"[%s]" % re.escape(''.join(html_escape_table.keys())))
+
+def _escape(s):
+    if _ESCAPE_RE.search(s) is None: return s
+    return _ESCAPE_RE.sub(lambda m: html_escape_table[m.group()], s)
+
+
+# Breaking long words.  Most tokens have none, and only need their
+# whitespace collapsed, as insert_breaks does.
+def _insert_breaks(s, lim):
+    if len(s) <= lim: return ' '.join(s.split())
+    return insert_breaks(s, lim)
+
+
+# The html around the token lists, split at each %s.
+_CMD_HTML             = CMD_HTML.split('%s')
+_INTERPRETED_CMD_SEP  = INTERPRETED_CMD_HTML.split('%s')[1]
+_TT_INTERPRETED_SEP   = TT_INTERPRETED_CMD_HTML.split('%s')[1]
+_INTERPRETED_BAD_HTML = INTERPRETED_BAD_HTML.split('%s')
+
+
+# Write the html for a token.  Does what render_token_html does,
+# collecting the highlighting in styles.
+def _write_token(out, t, is_cmd, show_err, tt, styles):
+    tok_str = t.data
+    if not is_cmd: tok_str = t.get_render_desc()
+    tok_str = _escape(tok_str)
+
+    # Tooltips get minimal markup.
+    if tt:
+        tok_str = _insert_breaks(tok_str, TT_TOKEN_LIMIT)
+        if t.is_param(): out.append(TOKEN_PARAM_TT % (tok_str))
+        else:            out.append(tok_str)
+        return
+    tok_str = _insert_breaks(tok_str, TOKEN_LIMIT)
+
+    # Wowhead links.
+    if t.wowhead and t.found():
+        if t.param_data_obj.is_spell():
+            tok_str = TOKEN_WOWHEAD_SPELL % (t.param_data_obj.get_id(), tok_str)
+        else:
+            tok_str = TOKEN_WOWHEAD_ITEM  % (t.param_data_obj.get_id(), tok_str)
+
+    # Span, and its highlighting.
+    if t.js:
+        styles.add((t.index, t.token_id))
+        if t.strike:
+            span = TOKEN_JS_SPAN_STRIKE
+        elif t.highlight or t.error:
+            span = TOKEN_JS_SPAN_HIGHLIGHT
+        else:
+            span = TOKEN_JS_SPAN
+    elif t.strike:
+        span = TOKEN_BASE_SPAN_STRIKE
+    else:
+        span = TOKEN_BASE_SPAN
+    out.append(span % (t.index, t.token_id, tok_str))
+
+    if show_err:
+        if t.error:  out.append(generate_token_error(t))
+        elif t.warn: out.append(generate_token_warning(t))
+
+
+# Write the html for a list of tokens, as render_token_list does.
+def _write_token_list(out, token_list, is_cmd, show_err, tt, styles):
+    for t in token_list:
+        _write_token(out, t, is_cmd, show_err, tt, styles)
+        if (is_cmd and (t.space_after or t.add_space_after)) or \
+               t.render_space_after:
+            out.append(' ')
+
+
+# Write the html for a command, as generate_cmd_html does.
+def _write_cmd(out, cmd, show_err, tt, styles):
+    if tt:
+        _write_token_list(out, cmd.cmd_list, True, show_err, tt, styles)
+        return
+    out.append(_CMD_HTML[0])
+    _write_token_list(out, cmd.cmd_list, True, show_err, tt, styles)
+    out.append(_CMD_HTML[1])
+
+
+# Write the html for an interpretation, as generate_interpret_html
+# does.
+def _write_interpret(out, cmd, show_err, tt, styles):
+    if cmd.error: out.append(_INTERPRETED_BAD_HTML[0])
+    sep = _TT_INTERPRETED_SEP if tt else _INTERPRETED_CMD_SEP
+    for i, (if_list, do_list) in enumerate(cmd.interpret):
+        if i > 0: out.append(INTERPRETATION_SEP)
+        if if_list:
+            _write_token_list(out, if_list, False, show_err, tt, styles)
+            out.append(sep)
+        _write_token_list(out, do_list, False, show_err, tt, styles)
+    if cmd.error: out.append(_INTERPRETED_BAD_HTML[1])
+
+
+# Join what was written from out[start] on into one string, as the
+# template would get it.  Token text can be utf-8 encoded, which the
+# template decodes.
+def _join_from(out, start):
+    html = ''.join(out[start:])
+    if isinstance(html, str): html = html.decode('utf-8')
+    out[start:] = [html]
+
+
+# Placeholders for splitting templates.  The nulls can't come from a
+# template.
+_MARK = u'\x00'
+
+def _placeholder(name):
+    return _MARK + name + _MARK
+
+
+def split_macro_template(render):
+    '''
+    Split a macro template into the static html between its lines.
+    render is called as render(macro, macro_style) to render the
+    template with the given template variables.
+
+    Returns a tuple of chunks for write_macro_html, or None if the
+    template can't be split, i.e. it doesn't loop over the macro lines
+    in the usual way.
+    '''
+    lines = [{'line':      _placeholder('l%d' % i),
+              'interpret': _placeholder('i%d' % i)} for i in range(3)]
+    parts = render(lines, _placeholder('s')).split(_MARK)
+    empty = render([], _placeholder('s')).split(_MARK)
+
+    # Text and placeholder names alternate.  The macro style is
+    # optional.
+    text, names = parts[0::2], parts[1::2]
+    if names[:1] == ['s']:
+        pre, text, names = text[0], text[1:], names[1:]
+        if len(empty) != 3: return None
+    else:
+        pre = None
+        if len(empty) != 1: return None
+    if names != ['l0', 'i0', 'l1', 'i1', 'l2', 'i2']: return None
+
+    # The html between lines must be the same for every line after
+    # the first.
+    first, mid_first, sep, mid, sep2, mid2, tail = text
+    if sep != sep2 or mid != mid2: return None
+    return (pre, first, mid_first, sep, mid, tail, empty)
+
+
+def write_macro_html(chunks, macro_obj, errors=True, tt=False):
+    '''
+    Write a macro's html into a template split by
+    split_macro_template.  Returns the html, exactly as
+    render_macro_html would render it with the template.
+    '''
+    pre, first, mid_first, sep, mid, tail, empty = chunks
+    styles = set()
+    out    = []
+    if pre is not None:
+        # Leave a place for the stylesheet, which is only known once
+        # every token has been written.
+        out.append(pre)
+        out.append(None)
+        style_at = 1
+    if len(macro_obj) == 0:
+        if pre is None: return empty[0]
+        return empty[0] + generate_token_styles(styles) + empty[2]
+
+    for i, cmd in enumerate(macro_obj):
+        if i == 0: out.append(first)
+        else:      out.append(sep)
+        start = len(out)
+        _write_cmd(out, cmd, errors, tt, styles)
+        _join_from(out, start)
+        if i == 0: out.append(mid_first)
+        else:      out.append(mid)
+        start = len(out)
+        _write_interpret(out, cmd, errors, tt, styles)
+        _join_from(out, start)
+    out.append(tail)
+
+    if pre is not None: out[style_at] = generate_token_styles(styles)
+    return u''.join(out)
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+'''
+Precompute the page chains for tag search.
+
+Search pages are found by keyset: each page starts after the last
+macro of the page before it.  Paging by number needs to know where
+each page starts, so this walks the results for each popular tag in
+each sort order and caches the chain of page positions in memcache
+(see SavedMacroOps.build_search_chain).  With a chain cached, any page
+of the search is one fetch, however deep.
+
+The popular tags are the classes and tags offered on the save form,
+plus any given on the command line.  Chains are cached for two hours,
+so run this hourly.  It runs through the remote API.
+'''
+
+import sys
+import time
+import getpass
+import logging
+
+from macro.render.defs               import CLASS_LIST, TAG_LIST, DEF_SEARCH_RESULTS
+from macro.data.appengine.savedmacro import SavedMacroOps, SEARCH_SORTS
+
+
+# Simple auth function.
+def auth_func():
+    return raw_input('Username:'), getpass.getpass('Password:')
+
+
+# Build the chains for each tag and sort.  Returns the number of
+# chains built.
+def build_chains(tags, num=DEF_SEARCH_RESULTS):
+    built = 0
+    for tag in tags:
+        for sort in SEARCH_SORTS:
+            start = time.time()
+            try:
+                pages = SavedMacroOps.build_search_chain(tag, sort, num)
+            except Exception, inst:
+                logging.error("Failed %s by %s: %s" % (tag, sort, inst))
+                continue
+            logging.info("%-16s %-9s %4d pages, %.2fs" % (tag, sort, pages, time.time() - start))
+            built += 1
+    return built
+
+
+#### MAIN #####
+if __name__ == "__main__":
+    # Set up the logger
+    logging.basicConfig(level=logging.INFO,
+                        format='%(message)s')
+
+    # Parse command-line options.
+    if len(sys.argv) < 3:
+        print "Usage: %s app_id host [tag ...]" % (sys.argv[0],)
+        sys.exit(1)
+    app_id = sys.argv[1]
+    host   = sys.argv[2]
+
+    # Tags are saved lowercased, classes included.
+    tags = list(set([t.lower() for t in CLASS_LIST + TAG_LIST + sys.argv[3:]]))
+    tags.sort()
+
+    from google.appengine.ext.remote_api import remote_api_stub
+    remote_api_stub.ConfigureRemoteApi(app_id, '/remote_api', auth_func, host)
+    built = build_chains(tags)
+    logging.info("Built %s of %s search chains." % (built, len(tags) * len(SEARCH_SORTS)))
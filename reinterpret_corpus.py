@@ -0,0 +1,255 @@
+#!/usr/bin/python
+'''
+Offline re-interpretation of the saved macro corpus.
+
+Processed macros are cached in memcache under MACRO_PROC_KEY, which
+is keyed on the macro text and the app version.  When a new version goes out (i.e.
+MAJOR_VERSION/MINOR_VERSION/PATCH_VERSION in macro/render/defs.py
+change) every one of those goes stale.  This script rebuilds them in
+bulk from an export of the SavedMacro entities, without touching the
+datastore:
+
+  run  -- Shard the export across a pool of worker processes, each
+          with its own MacroInterpreter, and write one result file
+          per shard to an output directory.  Per-shard throughput
+          and latency are reported as shards finish.
+  load -- Push the results in an output directory into memcache
+          through the remote API.
+
+The export is either the csv written by
+
+  appcfg.py download_data --kind=SavedMacro --config_file=bulkloader.yaml
+
+or JSON-lines in the format read by interpret_batch.py.  By default,
+spell and item data comes from the in-process index over the data/
+csvs (see macro/data/local/wow.py).  Each result file is a stream of
+pickled (memcache key, InterpretedMacro) tuples.  Keys are built with
+the CURRENT_VERSION_ID in the environment, so set it to the version
+being deployed.
+'''
+
+import os
+import sys
+import csv
+import time
+import getpass
+import logging
+import cPickle
+import multiprocessing
+
+from macro.data.wow                  import SOURCE_TEST, SOURCE_LOCAL
+from macro.data.local.wow            import get_local_index
+from macro.data.appengine.defs       import MACRO_PROC_KEY, MEMCACHED_MACRO_PROC
+from macro.interpret.interpreter     import MacroInterpreter
+from macro.render.util               import get_macro_content_key
+from interpret_batch                 import read_macros, SOURCES
+
+
+# Export formats.
+FORMATS = ('csv', 'json')
+
+# Number of macros handed to a worker at a time.
+_SHARD_SIZE = 500
+
+# Number of entries pushed to memcache per call.
+_LOAD_BATCH = 100
+
+# Result file names, by shard number.
+_SHARD_FILE = "shard-%05d.pkl"
+
+# The interpreter for this worker process, created once by the pool.
+_worker_mi = None
+
+
+# Simple auth function.
+def auth_func():
+    return raw_input('Username:'), getpass.getpass('Password:')
+
+
+# Read (id, macro) tuples from an export.
+def read_export(in_file, format='csv'):
+    if format == 'json':
+        for i, (macro_id, macro) in enumerate(read_macros(in_file, 'json')):
+            yield (macro_id if macro_id is not None else str(i), macro)
+        return
+
+    # The bulkloader export has a header row of the column names.
+    reader = csv.reader(in_file)
+    header = reader.next()
+    key_col   = header.index('key')
+    macro_col = header.index('macro')
+    for row in reader:
+        yield (row[key_col], row[macro_col].decode('utf-8'))
+
+
+# Split an iterable of (id, macro) into lists of at most size.
+def make_shards(macros, size=_SHARD_SIZE):
+    shard = []
+    for entry in macros:
+        shard.append(entry)
+        if len(shard) >= size:
+            yield shard
+            shard = []
+    if len(shard) > 0: yield shard
+
+
+# Get the value at fraction q of a sorted list.
+def percentile(values, q):
+    if len(values) == 0: return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+# Pool initializer, creates the interpreter for a worker.
+def init_worker(source):
+    global _worker_mi
+    _worker_mi = MacroInterpreter(data_source=source)
+
+    # Build the index up front, rather than in the first shard.
+    if source == SOURCE_LOCAL: get_local_index()
+
+
+# Interpret a shard in a worker, writing the results to out_dir.
+# Returns a dict of stats for the shard.
+def run_shard(args):
+    shard_num, shard, out_dir = args
+    mi = _worker_mi or MacroInterpreter(data_source=SOURCE_TEST)
+    out_file = open(os.path.join(out_dir, _SHARD_FILE % shard_num), 'wb')
+    latency = []
+    errors  = 0
+    start   = time.time()
+    last    = start
+    macros  = (macro for macro_id, macro in shard)
+    for i, (macro, int_macro, error) in enumerate(mi.interpret_macros(macros)):
+        latency.append(time.time() - last)
+        if error is not None:
+            # Nothing is cached for macros that can't be interpreted.
+            logging.warning("Macro %s: %s" % (shard[i][0], error))
+            errors += 1
+        else:
+            cPickle.dump((MACRO_PROC_KEY % get_macro_content_key(macro), int_macro),
+                         out_file, cPickle.HIGHEST_PROTOCOL)
+        last = time.time()
+    out_file.close()
+    latency.sort()
+    return {'shard':   shard_num,
+            'pid':     os.getpid(),
+            'count':   len(shard),
+            'errors':  errors,
+            'secs':    time.time() - start,
+            'p50':     percentile(latency, 0.50),
+            'p99':     percentile(latency, 0.99),
+            'max':     percentile(latency, 1.0)}
+
+
+# Helper to print the stats for a shard.
+def str_stats(stats):
+    return "Shard %(shard)s (pid %(pid)s): %(count)s macros, %(errors)s errors, %(secs).2fs, " % stats + \
+           "%.1f/s, p50 %.2fms p99 %.2fms max %.2fms" % \
+           (stats['count'] / max(stats['secs'], 1e-6),
+            stats['p50'] * 1000, stats['p99'] * 1000, stats['max'] * 1000)
+
+
+# Interpret every macro in an export, with processes workers.
+# Returns a list of per-shard stats, in shard order.
+def run_corpus(macros, out_dir, processes=None, source=SOURCE_TEST,
+               shard_size=_SHARD_SIZE):
+    # Clear out results from any previous run.
+    if not os.path.isdir(out_dir): os.makedirs(out_dir)
+    for name in os.listdir(out_dir):
+        if name.startswith("shard-") and name.endswith(".pkl"):
+            os.remove(os.path.join(out_dir, name))
+    work = ((i, shard, out_dir) for i, shard in enumerate(make_shards(macros, shard_size)))
+    pool = multiprocessing.Pool(processes, init_worker, (source,))
+    results = []
+    try:
+        for stats in pool.imap_unordered(run_shard, work):
+            logging.info(str_stats(stats))
+            results.append(stats)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    results.sort(key=lambda s: s['shard'])
+    return results
+
+
+# Read (key, InterpretedMacro) tuples from the result files in out_dir.
+def read_results(out_dir):
+    for name in sorted(os.listdir(out_dir)):
+        if not (name.startswith("shard-") and name.endswith(".pkl")): continue
+        in_file = open(os.path.join(out_dir, name), 'rb')
+        try:
+            while True:
+                try:
+                    yield cPickle.load(in_file)
+                except EOFError:
+                    break
+        finally:
+            in_file.close()
+
+
+# Push results into memcache.  Returns (loaded, failed) counts.
+def load_results(out_dir, ttl=MEMCACHED_MACRO_PROC, batch=_LOAD_BATCH):
+    from google.appengine.api import memcache
+    loaded = 0
+    failed = 0
+    mapping = {}
+    for key, int_macro in read_results(out_dir):
+        mapping[key] = int_macro
+        if len(mapping) >= batch:
+            failed += len(memcache.set_multi(mapping, ttl))
+            loaded += len(mapping)
+            mapping = {}
+    if len(mapping) > 0:
+        failed += len(memcache.set_multi(mapping, ttl))
+        loaded += len(mapping)
+    return (loaded - failed, failed)
+
+
+# Print usage and exit.
+def usage():
+    print "Usage: %s run [csv|json] in_file out_dir [processes] [local|test|datastore]" % (sys.argv[0],)
+    print "       %s load out_dir app_id [host]" % (sys.argv[0],)
+    sys.exit(1)
+
+
+#### MAIN #####
+if __name__ == "__main__":
+    # Set up the logger
+    logging.basicConfig(level=logging.INFO,
+                        format='%(message)s')
+
+    args = sys.argv[1:]
+    if len(args) < 1: usage()
+
+    if args[0] == 'run':
+        if len(args) < 4 or args[1] not in FORMATS: usage()
+        format, in_name, out_dir = args[1:4]
+        processes = int(args[4]) if len(args) > 4 else None
+        source    = args[5].lower() if len(args) > 5 else 'local'
+        if source not in SOURCES: usage()
+
+        in_file = sys.stdin if in_name == '-' else open(in_name, 'rb')
+        start   = time.time()
+        results = run_corpus(read_export(in_file, format), out_dir,
+                             processes, SOURCES[source])
+        secs    = time.time() - start
+        count   = sum([s['count'] for s in results])
+        errors  = sum([s['errors'] for s in results])
+        logging.info("Interpreted %s macros in %s shards, %s errors, %.2fs, %.1f/s." % \
+                     (count, len(results), errors, secs, count / max(secs, 1e-6)))
+
+    elif args[0] == 'load':
+        if len(args) < 3: usage()
+        out_dir = args[1]
+        app_id  = args[2]
+        host    = args[3] if len(args) > 3 else '%s.appspot.com' % app_id
+        from google.appengine.ext.remote_api import remote_api_stub
+        remote_api_stub.ConfigureRemoteApi(app_id, '/remote_api', auth_func, host)
+        loaded, failed = load_results(out_dir)
+        logging.info("Loaded %s processed macros, %s failed." % (loaded, failed))
+
+    else:
+        usage()
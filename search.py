@@ -35,7 +35,8 @@ class MacroSearch(webapp.RequestHandler):
             page = generate_search_page(_TEMPLATE_PATH,
                                         q.strip(),
                                         self.request.get(FORM_SEARCH_PAGE),
-                                        sort=s)
+                                        sort=s,
+                                        after=self.request.get(FORM_SEARCH_CURSOR))
           
         except NoInputError, inst:
             page = generate_error_page(_TEMPLATE_PATH, error=inst)
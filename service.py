@@ -11,9 +11,10 @@ from google.appengine.ext.webapp.util import run_wsgi_app
 
 # Get macro appengine components
 from macro.util                      import decode_text
-from macro.render.defs               import URL_MACRO_XML,URL_MACRO_JSON,DO_PROFILE
+from macro.render.defs               import URL_MACRO_XML,URL_MACRO_JSON,URL_VALIDATE_XML,URL_VALIDATE_JSON,DO_PROFILE,GET_MACRO_EXPLAIN,FORM_MACRO_INPUT,HTTP_MAX_AGE_API
 from macro.render.util               import throttle_action
-from macro.render.api.response       import generate_api_response
+from macro.render.api.response       import generate_api_response, generate_validate_response
+from macro.render.conditional        import get_macro_etag, is_not_modified, set_cache_headers, send_not_modified
 from macro.exceptions                import OtherError
 
 
@@ -52,21 +53,64 @@ class MacroRemoteProcess(webapp.RequestHandler):
         # Decode request
         self.unpack_request()
 
+        # Addons fetch the same macros over and over; if the client
+        # has this one already, say so.
+        etag = get_macro_etag(self.macro_id, self.format)
+        if is_not_modified(self.request, etag):
+            send_not_modified(self.response, etag, HTTP_MAX_AGE_API)
+            return
+
         # Attempt to respond
         #try:
         self.response.out.write(generate_api_response(path     = _TEMPLATE_PATH,
                                                       macro_id = self.macro_id,
                                                       r_type   = self.format))
+        set_cache_headers(self.response, etag, HTTP_MAX_AGE_API)
 
         #except Exception, inst:
         #    logging.error("Macro: %s\nError: %s" % (m, inst))
         #    self.response.out.write('')
 
 
+class MacroRemoteValidate(webapp.RequestHandler):
+    '''
+    Handles validate-only requests: lex and parse a macro, and return
+    where its errors and warnings are, without interpreting it.  The
+    macro text is passed in, rather than a macro id, so neither the
+    datastore nor memcache is touched.
+    '''
+
+    # Validate the macro text, and write the response.
+    def validate(self, macro):
+        self.format = self.request.path[1:].split("/")[0].lower()
+        if self.format == 'json':
+            self.response.headers['Content-Type'] = 'application/json'
+        else:
+            self.response.headers['Content-Type'] = 'text/xml'
+        try:
+            self.response.out.write(generate_validate_response(path   = _TEMPLATE_PATH,
+                                                               macro  = macro,
+                                                               r_type = self.format))
+        except OtherError, inst:
+            self.error(400)
+
+    # Macro passed as a GET parameter.
+    def get(self):
+        self.request.encoding = "UTF-8"
+        self.validate(self.request.get(GET_MACRO_EXPLAIN))
+
+    # Macro posted, for macros too long for a URL.
+    def post(self):
+        self.request.encoding = "UTF-8"
+        self.validate(self.request.get(FORM_MACRO_INPUT))
+
+
 ''' Register handlers for WSCGI. '''
 application = webapp.WSGIApplication(
-    [(URL_MACRO_XML,  MacroRemoteProcess),
-     (URL_MACRO_JSON, MacroRemoteProcess),
+    [(URL_MACRO_XML,     MacroRemoteProcess),
+     (URL_MACRO_JSON,    MacroRemoteProcess),
+     (URL_VALIDATE_XML,  MacroRemoteValidate),
+     (URL_VALIDATE_JSON, MacroRemoteValidate),
      ],
     debug=True)
 
@@ -0,0 +1,131 @@
+''' Test write-behind counters, with a local stand-in for memcache. '''
+
+import unittest
+from macro.data.local.cache               import LocalCache
+from macro.data.appengine.batched_counter import BatchedCounters
+
+
+class TestBatchedCounters(unittest.TestCase):
+    def setUp(self):
+        self.now     = 1000.0
+        self.cache   = LocalCache(clock=self.clock)
+        self.store   = {}
+        self.flushes = []
+        self.fail    = False
+        self.bad_key = None
+
+    def clock(self):
+        return self.now
+
+    # Stand-in for a batched datastore put.
+    def flush_def(self, deltas):
+        if self.fail or self.bad_key in deltas: raise Exception("datastore down")
+        self.flushes.append(deltas)
+        ret = {}
+        for key, counts in deltas.items():
+            entity = self.store.setdefault(key, {})
+            for name, delta in counts.items():
+                entity[name] = entity.get(name, 0) + delta
+            ret[key] = dict(entity)
+        return ret
+
+    # Helper to make the counters for a process.
+    def process(self, flush_batch=100):
+        return BatchedCounters(self.flush_def, cache=self.cache, push_interval=5,
+                               flush_interval=60, flush_batch=flush_batch,
+                               clock=self.clock)
+
+    def test_cache(self):
+        self.assertTrue(self.cache.add('a', 1, time=10))
+        self.assertFalse(self.cache.add('a', 2))
+        self.assertEqual(None, self.cache.incr('b'))
+        self.assertEqual({'a': 3, 'b': 0}, self.cache.offset_multi({'a': 2, 'b': -1}, initial_value=0))
+        self.now += 10
+        self.assertEqual({'b': 0}, self.cache.get_multi(['a', 'b']))
+
+    # Counts are buffered, then flushed in one write for all macros.
+    def test_batch(self):
+        p = self.process()
+        for i in range(50):
+            self.assertEqual(i / 10 + 1, p.incr('m%s' % (i % 10), 'views'))
+        p.incr('m0', 'rating', incr_amt=4)
+        self.assertEqual([], self.flushes)
+        self.assertEqual(5, p.get('m3', 'views'))
+
+        self.now += 5
+        p.incr('m0', 'views')
+        self.assertEqual(1, len(self.flushes))
+        self.assertEqual(10, len(self.flushes[0]))
+        self.assertEqual({'views': 6, 'rating': 4}, self.store['m0'])
+
+        # Reads use the flushed values over stale entity ones.
+        self.assertEqual(6, p.get('m0', 'views', entity_val=0))
+        self.assertEqual(7, p.incr('m0', 'views', entity_val=0))
+
+    # Only one process flushes per interval, and gets every process's
+    # deltas.
+    def test_processes(self):
+        a, b = self.process(), self.process()
+        a.incr('m1', 'views')
+        b.incr('m1', 'views')
+        b.incr('m2', 'sends')
+        self.now += 5
+        a.incr('m1', 'views')
+        b.incr('m2', 'sends')
+        self.assertEqual(1, len(self.flushes))
+        self.assertEqual(5, b.get('m1', 'views') + b.get('m2', 'sends'))
+
+        # b's push after the flush waits for the next interval.
+        self.assertEqual({'m1': {'views': 2}}, self.flushes[0])
+        self.now += 60
+        a.incr('m1', 'views')
+        self.assertEqual({'m2': {'sends': 2}, 'm1': {'views': 2}}, self.flushes[1])
+        self.assertEqual({'m1': {'views': 4}, 'm2': {'sends': 2}}, self.store)
+        self.assertEqual(4, a.get('m1', 'views'))
+
+    # Deltas pushed by a process that dies are flushed by another;
+    # failed flushes are retried.
+    def test_recovery(self):
+        a = self.process()
+        a.incr('m1', 'views')
+        self.now += 5
+        self.fail = True
+        a.incr('m1', 'views')
+        self.assertEqual({}, self.store)
+        self.assertEqual(2, a.get('m1', 'views'))
+        del a
+
+        self.fail = False
+        self.now += 60
+        b = self.process()
+        self.assertEqual(1, b.flush())
+        self.assertEqual({'m1': {'views': 2}}, self.store)
+        self.assertEqual(0, self.process().flush())
+
+    # Flushes are written in batches, and only a failed batch's
+    # deltas are put back.
+    def test_flush_batch(self):
+        a = self.process(flush_batch=2)
+        for i in range(5): a.incr('m%s' % i, 'views')
+        a.push()
+        self.bad_key = 'm3'
+        self.now += 60
+        written = a.flush()
+        self.assertEqual([], [f for f in self.flushes if len(f) > 2])
+        self.assertTrue(written in (3, 4))
+        self.assertEqual(written, len(self.store))
+        self.assertFalse('m3' in self.store)
+        self.assertEqual(1, a.get('m3', 'views'))
+
+        self.bad_key = None
+        self.now += 60
+        self.assertEqual(5 - written, a.flush())
+        self.assertEqual(5, len(self.store))
+        self.assertEqual(1, self.store['m3']['views'])
+        self.assertEqual(0, self.process().flush())
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestBatchedCounters)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,87 @@
+''' Test the memo of interpreted conditions. '''
+
+import unittest
+from macro.exceptions            import *
+from macro.data.wow              import SOURCE_TEST
+from macro.interpret.interpreter import MacroInterpreter
+from macro.interpret.cond_cache  import CondCache
+from macro.render.util           import render_macro_html
+from interpret_batch             import read_macros
+
+
+# Reduce an interpretation to something comparable, tokens and all.
+def fingerprint(mi, macro):
+    try:
+        int_macro = mi.interpret_macro(macro)
+    except BaseException, inst:
+        return (inst.__class__.__name__, str(inst))
+    cmds = []
+    for cmd in int_macro:
+        cmds.append([[t.get_list() + [t.index, t.strike, t.js, t.warn is not None,
+                                      t.error is not None, t.get_render_desc()]
+                      for t in tok_list]
+                     for if_do in cmd.interpret for tok_list in if_do])
+        cmds.append([t.get_list() + [t.strike, t.js, t.get_render_desc()] for t in cmd.cmd_list])
+    return (render_macro_html(int_macro, 'templates'), cmds,
+            int_macro.macro_len, int_macro.macro_good)
+
+
+class TestCondCache(unittest.TestCase):
+    def setUp(self):
+        self.mi = MacroInterpreter(data_source=SOURCE_TEST)
+        self.mi.cond_cache = CondCache()
+        return
+
+    # Memoized conditions give the same interpretation as fresh ones,
+    # on a first pass and on a pass of nothing but hits.
+    def test_matches_fresh(self):
+        fresh = MacroInterpreter(data_source=SOURCE_TEST)
+        fresh.cond_cache = None
+        macros = [m for i, m in read_macros(open('tests/test_macros.txt'), 'blocks')]
+        expected = [fingerprint(fresh, m) for m in macros]
+        for i in range(2):
+            for macro, result in zip(macros, expected):
+                self.assertEqual(result, fingerprint(self.mi, macro), macro)
+        self.assertTrue(self.mi.cond_cache.get_stats()['hits'] > len(macros))
+
+    # A hit hands out the command's own tokens, and copies of anything
+    # else.
+    def test_rebind(self):
+        macro = "/cast [@mouseover,help,nodead][] Flash Heal\n/cast [mod:alt][@mouseover,help,nodead] Renew"
+        int_macro = self.mi.interpret_macro(macro)
+        self.assertEqual(1, self.mi.cond_cache.get_stats()['hits'])
+        first, second = list(int_macro)
+        tokens = [t for if_do in second.interpret for tok_list in if_do for t in tok_list]
+        self.assertTrue(len([t for t in tokens if t.data == 'mouseover']) > 0)
+        for t in tokens:
+            if t.token_id >= 0:
+                self.assertTrue(t in second.cmd_list, t)
+            if t.index >= 0:
+                self.assertEqual(1, t.index)
+        for t in [t for if_do in first.interpret for tok_list in if_do for t in tok_list]:
+            if t.token_type != "TXT": self.assertFalse(t in tokens, t)
+
+    # Conditions are keyed on the verb traits they depend on.
+    def test_verb_traits(self):
+        self.mi.interpret_macro("/cast [@focus,harm] Polymorph")
+        self.mi.interpret_macro("/cast [@focus,harm] Frostbolt")
+        self.mi.interpret_macro("#showtooltip [@focus,harm] Polymorph")
+        self.mi.interpret_macro("/use [@focus,harm] Polymorph")
+        stats = self.mi.cond_cache.get_stats()
+        self.assertEqual((1, 3), (stats['hits'], stats['misses']))
+
+    def test_evict(self):
+        cache = CondCache(max_conditions=1)
+        cache.put("a", ((), ()))
+        cache.put("b", ((), ()))
+        self.assertEqual(None, cache.get("a"))
+        self.assertTrue(cache.get("b") is not None)
+        stats = cache.get_stats()
+        self.assertEqual((1, 1, 1, 1), (stats['hits'], stats['misses'],
+                                        stats['evictions'], stats['entries']))
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestCondCache)
+    unittest.TextTestRunner(verbosity=2).run(suite)
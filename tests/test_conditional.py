@@ -0,0 +1,59 @@
+''' Test conditional GET for saved macro responses. '''
+
+import unittest
+from macro.render.conditional import get_macro_etag, etag_matches, is_not_modified, send_not_modified, LAST_MODIFIED
+
+
+# Just enough of a webapp request and response.
+class FakeRequest(object):
+    def __init__(self, headers={}):
+        self.headers = headers
+
+class FakeResponse(object):
+    def __init__(self):
+        self.headers = {}
+        self.status  = 200
+    def set_status(self, status):
+        self.status = status
+
+
+class TestConditional(unittest.TestCase):
+    # ETags are strong, and differ by macro and by kind of response.
+    def test_etag(self):
+        etag = get_macro_etag('m1Ab', 'tt')
+        self.assertEqual(etag, get_macro_etag(u'm1Ab', 'tt'))
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+        self.assertNotEqual(etag, get_macro_etag('m1AB', 'tt'))
+        self.assertNotEqual(etag, get_macro_etag('m1Ab', 'xml'))
+        self.assertNotEqual(get_macro_etag('m1Ab', 'xml'), get_macro_etag('m1Ab', 'json'))
+
+    def test_matches(self):
+        etag = get_macro_etag('m1Ab', 'tt')
+        self.assertTrue(etag_matches(etag, etag))
+        self.assertTrue(etag_matches('"x", %s' % etag, etag))
+        self.assertTrue(etag_matches('W/%s' % etag, etag))
+        # "*" only matches something known to exist.
+        self.assertFalse(etag_matches('*', etag))
+        self.assertTrue(etag_matches('*', etag, exists=True))
+        self.assertFalse(is_not_modified(FakeRequest({'If-None-Match': '*'}), etag))
+        self.assertFalse(etag_matches(None, etag))
+        self.assertFalse(etag_matches('', etag))
+        self.assertFalse(etag_matches(etag.strip('"'), etag))
+        self.assertFalse(etag_matches(get_macro_etag('m1Ab', 'json'), etag))
+
+    def test_not_modified(self):
+        etag = get_macro_etag('m1Ab', 'json')
+        self.assertTrue(is_not_modified(FakeRequest({'If-None-Match': etag}), etag))
+        self.assertFalse(is_not_modified(FakeRequest(), etag))
+        response = FakeResponse()
+        send_not_modified(response, etag, 60)
+        self.assertEqual(304, response.status)
+        self.assertEqual(etag, response.headers['ETag'])
+        self.assertEqual(LAST_MODIFIED, response.headers['Last-Modified'])
+        self.assertEqual('public, max-age=60', response.headers['Cache-Control'])
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestConditional)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -12,7 +12,7 @@ from macro.interpret.interpreter import get_test_mi
 from macro.interpret.obj import InterpretedMacro
 from macro.util import generate_test_function
 from macro.parse.parser import MacroParser
-from macro.lex.lexer import MacroCommandTokenizer,GLOBAL_MACRO_TOKENIZER
+from macro.lex.lexer import MacroCommandTokenizer
 from macro.lex.token import MacroToken
 
 
@@ -25,7 +25,8 @@ UPDATE = False
 class TestEngine(unittest.TestCase):
     def setUp(self):
         self.DEBUG  = DEBUG
-        self.parser = MacroParser(debug=DEBUG)
+        self.lexer  = MacroCommandTokenizer(debug=DEBUG)
+        self.parser = MacroParser(lexer_obj=self.lexer, debug=DEBUG)
         self.mi = get_test_mi(debug=DEBUG, test=False)
         return
 
@@ -37,7 +38,7 @@ class TestEngine(unittest.TestCase):
     def macro_test_update(self, macro):    
         # Get the lexed version of the macro.
         self.parser.lex_macro(macro, 0)
-        lex_c = "[%s]" % ", ".join([str(GLOBAL_MACRO_TOKENIZER[i].get_list()) for i in range(len(GLOBAL_MACRO_TOKENIZER))])
+        lex_c = "[%s]" % ", ".join([str(self.lexer[i].get_list()) for i in range(len(self.lexer))])
 
         # Get parse tree
         parse_c = self.parser.parse_macro()
@@ -51,8 +52,8 @@ class TestEngine(unittest.TestCase):
         
     # All in one macro check
     def macro_test_check(self, macro, lex_correct, parse_correct, int_correct):
-        # Save a reference to the global tokenizer
-        lexer = GLOBAL_MACRO_TOKENIZER
+        # Save a reference to the parser's tokenizer
+        lexer = self.lexer
 
         # Lex the macro.
         self.parser.lex_macro(macro, 0)
@@ -0,0 +1,60 @@
+''' Test the synthetic corpus generator.  Generated macros should be
+repeatable for a seed, and valid ones should lex and parse cleanly. '''
+
+import unittest
+from StringIO import StringIO
+
+from macro.exceptions import *
+from macro.parse.parser import MacroParser
+from macro.interpret.errors import MAX_LEN_ALLOWED
+from interpret_batch import read_macros
+from gen_corpus import MacroGenerator, write_corpus
+
+
+class TestGenCorpus(unittest.TestCase):
+    def setUp(self):
+        self.parser = MacroParser()
+        return
+
+    # Helper to check that a macro lexes and parses.
+    def parses(self, macro):
+        try:
+            for line in macro.split('\n'):
+                self.parser.lex_and_parse_macro(line)
+        except MacroError:
+            return False
+        return len(macro) <= MAX_LEN_ALLOWED
+
+    def test_seed(self):
+        a = list(MacroGenerator(42).generate(50))
+        b = list(MacroGenerator(42).generate(50))
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, list(MacroGenerator(43).generate(50)))
+
+    def test_valid(self):
+        gen = MacroGenerator(1, error_rate=0, lines=6, clauses=3, conditions=2)
+        for macro in gen.generate(300):
+            self.assert_(self.parses(macro), macro)
+
+    def test_errors(self):
+        gen = MacroGenerator(1, error_rate=1)
+        bad = len([m for m in gen.generate(300) if not self.parses(m)])
+        self.assert_(bad > 100, bad)
+
+    def test_verb_mix(self):
+        gen = MacroGenerator(1, {'/cast': 1}, show_rate=0, error_rate=0)
+        for macro in gen.generate(50):
+            for line in macro.split('\n'):
+                self.assert_(line.startswith('/cast'), line)
+
+    def test_write(self):
+        for format in ('json', 'blocks'):
+            out_file = StringIO()
+            write_corpus(out_file, MacroGenerator(7), 20, format)
+            macros = [m for i, m in read_macros(StringIO(out_file.getvalue()), format)]
+            self.assertEqual([m.rstrip('\n') for m in macros],
+                             list(MacroGenerator(7).generate(20)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+''' Test incremental re-interpretation for live editing. '''
+
+import unittest
+from macro.exceptions            import *
+from macro.data.wow              import SOURCE_TEST
+from macro.interpret.interpreter import MacroInterpreter
+from macro.interpret.line_cache  import LineCache
+from macro.render.util           import render_macro_html
+from interpret_batch             import read_macros
+
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.mi    = MacroInterpreter(data_source=SOURCE_TEST)
+        self.cache = LineCache()
+
+    # Helper to interpret incrementally against the test cache.
+    def inc(self, macro):
+        return self.mi.interpret_macro_incremental(macro, self.cache)
+
+    # Same results as interpreting the whole macro.  The test data
+    # source echoes names in whatever case it first saw them, so the
+    # rendered html is compared ignoring case.
+    def test_matches_full(self):
+        for macro_id, macro in read_macros(open('tests/test_macros.txt'), 'blocks'):
+            try:
+                full = self.mi.interpret_macro(macro)
+            except BaseException:
+                self.assertRaises(BaseException, self.inc, macro)
+                continue
+            for i in range(2):
+                int_macro, keys = self.inc(macro)
+                self.assertEqual(len(full), len(keys))
+                self.assertEqual(full.macro_len,     int_macro.macro_len, macro)
+                self.assertEqual(full.macro_good,    int_macro.macro_good, macro)
+                self.assertEqual(full.macro_changed, int_macro.macro_changed, macro)
+                self.assertEqual(render_macro_html(full, 'templates').lower(),
+                                 render_macro_html(int_macro, 'templates').lower(), macro)
+
+    # Editing a line only changes the keys it affects.
+    def test_keys(self):
+        old  = self.inc("#showtooltip\n/cast Heal\n/use 13")[1]
+        new  = self.inc("#showtooltip\n/cast Flash Heal\n/use 13")[1]
+        self.assertEqual([True, False, True], [a == b for a, b in zip(old, new)])
+
+        # Adding a line changes whether the old last line is last.
+        more = self.inc("#showtooltip\n/cast Flash Heal\n/use 13\n/use 14")[1]
+        self.assertEqual(new[:2], more[:2])
+        self.assertNotEqual(new[2], more[2])
+
+    # Single-use verbs seen earlier are part of a line's context.
+    def test_single_use(self):
+        a = self.inc("/targetenemy\n/cast Heal\n/targetenemy")[1]
+        b = self.inc("/cast Heal\n/cast Heal\n/targetenemy")[1]
+        self.assertNotEqual(a[2], b[2])
+
+    def test_cache(self):
+        self.inc("/cast Heal\n/cast Renew")
+        self.assertEqual(0, self.cache.get_stats()['hits'])
+        self.inc("/cast Heal\n/cast Renew")
+        self.assertEqual(2, self.cache.get_stats()['hits'])
+
+        small = LineCache(1)
+        self.mi.interpret_macro_incremental("/cast Heal\n/cast Renew", small)
+        self.assertEqual(1, small.get_stats()['entries'])
+        self.assertEqual(1, small.get_stats()['evictions'])
+        self.assertRaises(InitError, self.inc, " ")
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestIncremental)
+    unittest.TextTestRunner(verbosity=2).run(suite)
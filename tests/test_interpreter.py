@@ -5,7 +5,8 @@ import unittest
 
 from macro.exceptions import *
 from macro.logger import *
-from macro.interpret.interpreter import get_test_mi
+from macro.interpret.interpreter import get_test_mi, MacroInterpreter
+from macro.data.wow import SOURCE_TEST, SOURCE_LOCAL
 from macro.interpret.obj import InterpretedMacro
 from macro.util import generate_test_function
 from macro.parse.parser import MacroParser
@@ -1169,6 +1170,43 @@ class TestInterpreter(unittest.TestCase):
         int_correct = [['If the currently targeted unit is an enemy and exists then:', 'Cast a random spell from a set of [ Spell on the currently targeted unit ] each time the macro is activated']]
         self.macro_test(macro, int_correct)
 
+    # Batch interpretation matches one-at-a-time interpretation, and
+    # macros that can't be interpreted come back as errors.
+    def test_batch(self):
+        macros = ['/cast [mod:shift] Polymorph; Fireball',
+                  '',
+                  '#showtooltip\n/use 13\n/use 14',
+                  '/castsequence reset=target Immolate, Corruption']
+        results = list(get_test_mi(debug=DEBUG, test=False).interpret_macros(iter(macros)))
+        self.assertEqual(len(macros), len(results))
+        for macro, (batch_macro, int_macro, error) in zip(macros, results):
+            self.assertEqual(macro, batch_macro)
+            if not macro:
+                self.assertEqual(None, int_macro)
+                self.assertTrue(isinstance(error, InitError))
+            else:
+                self.assertEqual(None, error)
+                self.assertEqual(self.mi.interpret_macro(macro).get_test_repr(),
+                                 int_macro.get_test_repr())
+
+    # Batch results don't depend on the order of the batch.
+    def test_batch_order(self):
+        macros = ['/cast fireball', '/cast FIREBALL', '/use [mod] HEARTHSTONE; hearthstone']
+        expected = [self.mi.interpret_macro(m).get_test_repr() for m in macros]
+        mi = get_test_mi(debug=DEBUG, test=False)
+        for order in (macros, list(reversed(macros))):
+            for macro, int_macro, error in mi.interpret_macros(order):
+                self.assertEqual(expected[macros.index(macro)], int_macro.get_test_repr())
+
+    # Other sources share one parameter cache across the batch.
+    def test_batch_cache(self):
+        for source, shared in ((SOURCE_TEST, False), (SOURCE_LOCAL, True)):
+            mi = MacroInterpreter(data_source=source)
+            caches = []
+            mi.interpret_macro = lambda macro, parser, param_cache: caches.append(param_cache)
+            list(mi.interpret_macros(['/cast fireball', '/cast fireball']))
+            self.assertEqual(shared, caches[0] is caches[1])
+
 
 if __name__ == '__main__':
     # Run all tests
@@ -0,0 +1,71 @@
+''' Test the process-wide cache of lexed commands. '''
+
+import unittest
+from macro.exceptions import *
+from macro.lex.lexer  import *
+from macro.lex.cache  import LexCache, LRUCache, LEX_CACHE
+
+
+class TestLexCache(unittest.TestCase):
+    def setUp(self):
+        LEX_CACHE.clear()
+        return
+
+    # Hits give the same tokens as a fresh lex, as new objects.
+    def test_hit(self):
+        command = "/cast [@mouseover,help,nodead][] Flash Heal"
+        fresh = MacroCommandTokenizer(use_cache=False)
+        fresh.reset(command, 3)
+
+        lexer = MacroCommandTokenizer()
+        before = LEX_CACHE.get_stats()
+        lexer.reset(command, 1)
+        first = lexer.get_tokens()
+        for t in first: t.strike = True
+        lexer.reset(command, 3)
+        second = lexer.get_tokens()
+        after = LEX_CACHE.get_stats()
+
+        self.assertEqual(1, after['misses'] - before['misses'])
+        self.assertEqual(1, after['hits'] - before['hits'])
+        self.assertEqual([t.get_list() + [t.index, t.strike, t.add_space_after] for t in fresh.get_tokens()],
+                         [t.get_list() + [t.index, t.strike, t.add_space_after] for t in second])
+        for a, b in zip(first, second):
+            self.assertFalse(a is b)
+
+    # Least recently used entries go first, by token count.
+    def test_evict(self):
+        lexer = MacroCommandTokenizer(use_cache=False)
+        lexer.reset("/cast Heal")
+        tokens = lexer.get_tokens()
+        cache = LexCache(max_tokens=len(tokens) * 2)
+        cache.put("a", tokens)
+        cache.put("b", tokens)
+        self.assertTrue(cache.get("a") is not None)
+        cache.put("c", tokens)
+        self.assertEqual(None, cache.get("b"))
+        self.assertTrue(cache.get("a") is not None)
+        self.assertTrue(cache.get("c") is not None)
+        stats = cache.get_stats()
+        self.assertEqual((3, 1, 1, 2), (stats['hits'], stats['misses'],
+                                        stats['evictions'], stats['entries']))
+
+    # Sizes are kept right as entries are replaced and evicted.
+    def test_lru_size(self):
+        cache = LRUCache(5, len)
+        cache.put("a", "xx")
+        cache.put("a", "xxx")
+        cache.put("b", "xx")
+        self.assertEqual((2, 5, 0), (cache.get_stats()['entries'], cache.get_stats()['size'],
+                                     cache.get_stats()['evictions']))
+        cache.put("c", "x")
+        self.assertEqual(None, cache.get("a"))
+        cache.put("d", "xxxxxx")
+        self.assertEqual(None, cache.get("d"))
+        self.assertEqual(3, cache.get_stats()['size'])
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestLexCache)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,102 @@
+''' Test that the compiled lexing engine produces exactly the same
+tokens (and the same lex errors) as the recursive engine for every
+macro command in the test file. '''
+
+import re
+import unittest
+from macro.exceptions import *
+from macro.lex.lexer  import *
+
+
+# Lex a command with an engine, returning either the token lists or
+# the error raised.
+def lex_with(engine, command, max_steps=MAX_LEX_STEPS):
+    lexer = MacroCommandTokenizer(engine=engine, use_cache=False, max_steps=max_steps)
+    try:
+        lexer.reset(command)
+    except LexerError, inst:
+        return (inst.__class__.__name__, inst.data, inst.start,
+                inst.end, inst.rule[0])
+    return [t.get_list() + [t.add_space_after] for t in lexer.get_tokens()]
+
+
+class TestLexEngine(unittest.TestCase):
+    def setUp(self):
+        return
+
+    # Compare both engines on a single command
+    def engine_test(self, command):
+        self.assertEqual(lex_with(ENGINE_RECURSIVE, command),
+                         lex_with(ENGINE_COMPILED, command),
+                         "Engines differ on: %s" % command)
+
+    # Every command in the test macro file.
+    def test_external_file(self):
+        f = open('tests/test_macros.txt', 'r')
+        count = 0
+        for line in f.readlines():
+            for command in re.split("\r*\n+", line):
+                if command.isspace() or len(command) == 0: continue
+                self.engine_test(command)
+                count += 1
+        f.close()
+        self.assertTrue(count > 0)
+
+    # Commands that fail to lex must fail the same way.
+    def test_errors(self):
+        for command in ('/cast [target=]', '/cast [mod:', '/cast ]',
+                        '/cast [] ;;', '/ [help] me', '/castsequence reset=',
+                        '/use 13 14 15', '/cast [@] Heal'):
+            self.engine_test(command)
+
+    # Default targets are lexed without positions.
+    def test_default_target(self):
+        for target in ('focus', 'party1target', 'Fitz', None):
+            self.assertEqual(
+                [t.get_list() for t in MacroCommandTokenizer(engine=ENGINE_RECURSIVE).get_default_target(target)],
+                [t.get_list() for t in MacroCommandTokenizer(engine=ENGINE_COMPILED).get_default_target(target)])
+
+    # Both engines take the same steps, and give up at the same
+    # place when over budget.
+    def test_budget(self):
+        command = '/cast [mod:shift,nocombat] Heal; [@focus] Renew; Fade'
+        steps = []
+        for engine in (ENGINE_RECURSIVE, ENGINE_COMPILED):
+            lexer = MacroCommandTokenizer(command, engine=engine, use_cache=False)
+            steps.append(lexer.steps)
+        self.assertEqual(steps[0], steps[1])
+        for budget in (1, steps[0] / 2, steps[0] - 1):
+            errors = [lex_with(engine, command, budget) \
+                      for engine in (ENGINE_RECURSIVE, ENGINE_COMPILED)]
+            self.assertEqual(errors[0][0], 'LexErrorBudgetExceeded')
+            self.assertEqual(errors[0], errors[1])
+        MacroCommandTokenizer(command, use_cache=False, max_steps=steps[0])
+
+    # Pathological input of the maximum length is cut off by the
+    # default budget, rather than lexed.
+    def test_budget_default(self):
+        command = '#showtooltip ' + ';' * 1000 + '!'
+        self.assertRaises(LexErrorBudgetExceeded,
+                          MacroCommandTokenizer(use_cache=False).reset, command)
+
+    # The worst inputs fuzz_lexer.py found for single rules lex the
+    # same on both engines, and blank commands lex to no tokens.
+    def test_pumped(self):
+        for command in ('/cast ' + ' ' * 1000 + ' x',
+                        '/cast [' + ' ' * 1000 + '[',
+                        '/target ' + ' ' * 1000 + ';',
+                        '/use ' + ' ' * 1000 + 'a, ',
+                        '/cast [no ' + ' ' * 1000 + 'harm] x, y'):
+            self.engine_test(command)
+        for engine in (ENGINE_RECURSIVE, ENGINE_COMPILED):
+            self.assertEqual([], lex_with(engine, ' ' * 8))
+
+    # Unknown engines are a configuration error.
+    def test_bad_engine(self):
+        self.assertRaises(ConfigError, MacroCommandTokenizer, engine="nope")
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestLexEngine)
+    unittest.TextTestRunner(verbosity=2).run(suite)
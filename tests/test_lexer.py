@@ -1016,6 +1016,24 @@ class TestLexer(unittest.TestCase):
         lex_correct = [['COMMAND_VERB', 0, '/castrandom', 0, 11, True],['IF', 1, '[', 12, 13, False],['TARGET', 2, 'target', 14, 20, False],['GETS', 3, '=', 21, 22, False],['TARGET_OBJ', 4, 'target', 23, 29, False],['AND', 5, ',', 29, 30, False],['OPTION_WORD', 6, 'harm', 31, 35, False],['AND', 7, ',', 36, 37, False],['OPTION_WORD', 8, 'exists', 38, 44, False],['ENDIF', 9, ']', 45, 46, False],['PARAMETER', 10, 'Spell', 47, 52, False]]
         self.macro_test(macro, lex_correct)
 
+
+    # Language attributes are shared, read-only records.
+    def test_language_attrs_read_only(self):
+        lexer = MacroCommandTokenizer(debug=DEBUG)
+        lexer.reset('/cast [mod:shift] Fireball')
+        first = [t.attrs for t in lexer.get_tokens()]
+        lexer.reset('/cast [mod:shift] Frostbolt')
+        second = [t.attrs for t in lexer.get_tokens()]
+        self.assertTrue(first[0] is second[0])
+        self.assertEqual(first[0].def_target, 'target')
+        self.assertRaises(AttributeError, setattr, first[0], 'secure', False)
+        self.assertRaises(AttributeError, setattr, first[-1], 'token', None)
+
+        # They still pickle, i.e. for memcache.
+        import cPickle
+        copy = cPickle.loads(cPickle.dumps(first[0], 2))
+        self.assertEqual(copy.def_target, 'target')
+
         
 if __name__ == '__main__':
     # Run all tests
@@ -0,0 +1,107 @@
+''' Test the in-process spell and item index. '''
+
+import os
+import cPickle
+import tempfile
+import unittest
+
+from macro.data.wow import get_wow_object, get_wow_objects, SOURCE_LOCAL
+from macro.data.local.wow import LocalIndex, get_local_index
+from macro.data.local.wowdb import MappedIndex, build_db
+from macro.interpret.interpreter import MacroInterpreter
+
+
+class TestLocalData(unittest.TestCase):
+    def setUp(self):
+        return
+
+    # Spells from data/spells.csv, by name and rank.
+    def test_spells(self):
+        index = get_local_index()
+        self.assertTrue(index.num_spells() > 0)
+        self.assertTrue(index is get_local_index())
+
+        spell = get_wow_object("Aggression (Rank 1)", src=SOURCE_LOCAL, cache={})
+        self.assertEqual(18427, spell.get_id())
+        self.assertEqual("Aggression", spell.get_name())
+        self.assertEqual("Rank 1", spell.get_rank())
+        self.assertTrue(spell.is_spell())
+        self.assertEqual(None, get_wow_object("Not A Real Spell", src=SOURCE_LOCAL, cache={}))
+
+        # Spells get pickled into memcache with interpreted macros.
+        self.assertEqual(spell.__dict__, cPickle.loads(cPickle.dumps(spell)).__dict__)
+
+    # Items from an items csv, by name and item:id.
+    def test_items(self):
+        self.item_test(self.get_item_index())
+
+    # Helper to build an index over a few items.
+    def get_item_index(self):
+        fd, path = tempfile.mkstemp()
+        os.write(fd, '"item:6292","10 Pound Mud Snapper",,,,,,,,"1-2",,,6292\n' +
+                     '"10 Pound Mud Snapper","10 Pound Mud Snapper",,,,,,,,"1-2",,,6292\n' +
+                     '"Bad Slot","Bad Slot",,,,,,,,,,,7\n')
+        os.close(fd)
+        try:
+            return LocalIndex(spell_csv=None, item_csv=path)
+        finally:
+            os.remove(path)
+
+    # Helper to check the items index.
+    def item_test(self, index):
+        self.assertEqual(0, index.num_spells())
+        self.assertEqual(3, index.num_items())
+        for key in ("item:6292", "10 pound mud snapper"):
+            item = index.get_item(key)
+            self.assertEqual(6292, item.get_id())
+            self.assertEqual([1, 2], item.get_slot())
+            self.assertTrue(item.test_item_slotid(2))
+            self.assertFalse(item.test_item_slotid(3))
+        self.assertEqual([-1], index.get_item("bad slot").get_slot())
+        self.assertEqual(None, index.get_item("nope"))
+
+    # The mapped database gives the same answers as the index it
+    # was built from.
+    def test_mapped(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            build_db(path, self.get_item_index())
+            self.item_test(MappedIndex(path))
+
+            index = LocalIndex()
+            build_db(path, index)
+            mapped = MappedIndex(path)
+            self.assertEqual(index.num_spells(), mapped.num_spells())
+            for key in index.spell_keys.keys()[:2000]:
+                self.assertEqual(index.get_spell(key).__dict__,
+                                 mapped.get_spell(key.upper()).__dict__)
+            self.assertEqual(None, mapped.get_spell("Not A Real Spell"))
+            self.assertEqual(None, mapped.get_item("Not A Real Item"))
+        finally:
+            os.remove(path)
+
+    # Batch lookups fill the cache, misses included.
+    def test_batch(self):
+        cache = {}
+        get_wow_objects([("Mana Regeneration", False), ("mana regeneration", False),
+                         ("Not A Real Spell", False), ("Not A Real Item", True)],
+                        src=SOURCE_LOCAL, cache=cache)
+        self.assertEqual(3, len(cache))
+        self.assertEqual(61268, cache["smana regeneration"].get_id())
+        self.assertEqual(None, cache["snot a real spell"])
+        self.assertTrue(get_wow_object("Mana Regeneration", src=SOURCE_LOCAL, cache=cache) is cache["smana regeneration"])
+
+    # Interpreting with the local source finds real spell data.
+    def test_interpret(self):
+        mi = MacroInterpreter(data_source=SOURCE_LOCAL)
+        int_macro = mi.interpret_macro("/cast [combat] Mana Regeneration; Nope")
+        params = [t for cmd in int_macro for t in cmd.cmd_list if t.is_param()]
+        self.assertEqual([True, False], [p.found() for p in params])
+        self.assertEqual(61268, params[0].param_data_obj.get_id())
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestLocalData)
+    unittest.TextTestRunner(verbosity=2).run(suite)
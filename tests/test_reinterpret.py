@@ -0,0 +1,63 @@
+''' Test the offline corpus re-interpreter.  Runs the test macros
+through a small process pool and checks that the result files match
+a serial run in this process. '''
+
+import shutil
+import tempfile
+import unittest
+
+from macro.exceptions import *
+from macro.data.appengine.defs import MACRO_PROC_KEY
+from macro.interpret.interpreter import get_test_mi
+from macro.render.util import get_macro_content_key
+from reinterpret_corpus import run_corpus, read_results
+
+
+# Read in the test macros.  Macros are seperated by blank lines.
+def read_macros(path='tests/test_macros.txt'):
+    macros = []
+    macro  = []
+    f = open(path, 'r')
+    for line in f.readlines():
+        if not line.isspace():
+            macro.append(line)
+        elif len(macro) > 0:
+            macros.append(''.join(macro))
+            macro = []
+    if len(macro) > 0: macros.append(''.join(macro))
+    f.close()
+    return macros
+
+
+class TestReinterpret(unittest.TestCase):
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        self.macros  = [("m%s" % i, m) for i, m in enumerate(read_macros())]
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_matches_serial(self):
+        stats = run_corpus(iter(self.macros), self.out_dir,
+                           processes=2, shard_size=25)
+        self.assertEqual(range(len(stats)), [s['shard'] for s in stats])
+        self.assertEqual(len(self.macros), sum([s['count'] for s in stats]))
+
+        results = dict(read_results(self.out_dir))
+        mi = get_test_mi(debug=False, test=False)
+        for macro_id, macro in self.macros:
+            key = MACRO_PROC_KEY % get_macro_content_key(macro)
+            try:
+                int_macro = mi.interpret_macro(macro)
+            except OtherError:
+                self.assertFalse(key in results)
+                continue
+            self.assertEqual(int_macro.get_test_repr(), results[key].get_test_repr())
+            self.assertEqual(int_macro.macro_len, results[key].macro_len)
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestReinterpret)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,68 @@
+''' Test rendering interpreted macros to html. '''
+
+import re
+import unittest
+from macro.data.wow                import SOURCE_TEST
+from macro.interpret.interpreter   import MacroInterpreter
+from macro.render.util             import render_macro_html, render_macro_line, render_macro_template_html
+from macro.render.interpretation   import generate_token_styles, TOKEN_CS_ON, TOKEN_CS_OFF
+from interpret_batch               import read_macros
+
+
+class TestRender(unittest.TestCase):
+    def setUp(self):
+        self.mi = MacroInterpreter(data_source=SOURCE_TEST)
+        return
+
+    # The highlighting for a macro is in one stylesheet, with a rule
+    # for every highlighted token.
+    def test_one_stylesheet(self):
+        int_macro = self.mi.interpret_macro("#showtooltip\n/cast [@mouseover,help,nodead][] Flash Heal")
+        styles = set()
+        lines  = ''.join([''.join(render_macro_line(cmd, styles=styles).values()) for cmd in int_macro])
+        self.assertEqual(0, lines.count("<style"))
+        classes = set(re.findall("<span class='%s-(\d+-\d+)'" % TOKEN_CS_OFF, lines))
+        style   = generate_token_styles(styles)
+        self.assertTrue(len(classes) > 5)
+        self.assertEqual(classes, set(re.findall("\.%s-(\d+-\d+)" % TOKEN_CS_ON, style)))
+        self.assertEqual(1, style.count("<style"))
+
+        # The page has the stylesheet, and each rule just once.  The
+        # other mention is the highlighting script's.
+        html = render_macro_html(int_macro, 'templates')
+        self.assertEqual(len(classes) + 1, html.count(TOKEN_CS_ON))
+        self.assertEqual('', generate_token_styles(set()))
+
+    # Without a styles set, each token has its own stylesheet.
+    def test_inline(self):
+        cmd = list(self.mi.interpret_macro("/cast [@focus] Polymorph"))[0]
+        inline = render_macro_line(cmd)
+        styles = set()
+        shared = render_macro_line(cmd, styles=styles)
+        self.assertEqual(len(styles), inline['line'].count("<style"))
+        for key in ('line', 'interpret'):
+            self.assertEqual(re.sub("<style.*?</style>", "", inline[key]), shared[key])
+
+    # The html writer gives exactly what the templates do.
+    def test_writer_matches_template(self):
+        in_file = open('tests/test_macros.txt', 'r')
+        try:
+            macros = [m for i, m in read_macros(in_file, 'blocks')]
+        finally:
+            in_file.close()
+        for m, int_macro, e in self.mi.interpret_macros(macros):
+            if int_macro is None: continue
+            for args in (('templates', True,  False, 'processed_macro.template'),
+                         ('templates', False, True,  'tooltip.template')):
+                try:
+                    html = render_macro_template_html(int_macro, *args)
+                except Exception, inst:
+                    self.assertRaises(inst.__class__, render_macro_html, int_macro, *args)
+                    continue
+                self.assertEqual(html, render_macro_html(int_macro, *args))
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestRender)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,152 @@
+''' Test keyset pagination for tag search. '''
+
+import unittest
+from google.appengine.api            import memcache
+from macro.exceptions                import InvalidSearchError
+from macro.data.appengine            import savedmacro
+from macro.data.appengine.savedmacro import SavedMacro, SavedMacroOps, fetch_after, get_position, \
+     encode_position, decode_position, get_page_position, chain_key, refresh_tag_index, publish_counts
+from macro.data.local.tagindex       import TagIndex
+
+
+# Just enough of a datastore query over a list of macros, ordered
+# the way the datastore orders them: by sort value, then key.
+class FakeKey(object):
+    def __init__(self, name): self.key_name = name
+    def name(self):           return self.key_name
+
+class FakeMacro(object):
+    def __init__(self, name, views, tags=('mage',), index=0, rating=0):
+        self.link_id = name
+        self.views   = views
+        self.tags    = list(tags)
+        self.index   = index
+        self.rating  = rating
+    def key(self): return FakeKey(self.link_id)
+
+class FakeQuery(object):
+    def __init__(self, macros, fetches):
+        self.macros  = macros
+        self.fetches = fetches
+        self.filters = []
+        self.sort    = None
+    def filter(self, f, value):
+        self.filters.append((f, value))
+    def order(self, sort):
+        self.sort = sort
+    def __match(self, m, f, value):
+        prop, op = f.split()
+        if prop == 'tags':    return value in m.tags
+        if prop == '__key__': return m.link_id > getattr(value, 'name', lambda: value[-1])()
+        v = getattr(m, prop)
+        if op == '=': return v == value
+        if op == '<': return v < value
+        return v > value
+    def fetch(self, limit):
+        ret = [m for m in self.macros if not [f for f in self.filters if not self.__match(m, f[0], f[1])]]
+        if self.sort == '__key__':
+            ret.sort(key=lambda m: m.link_id)
+        else:
+            prop = self.sort.lstrip('-')
+            ret.sort(key=lambda m: m.link_id)
+            ret.sort(key=lambda m: getattr(m, prop), reverse=self.sort.startswith('-'))
+        self.fetches.append(min(limit, len(ret)))
+        return ret[:limit]
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        # Lots of ties, so pages split runs of equal views.
+        self.macros  = [FakeMacro("m%02d" % i, i / 4) for i in range(23)]
+        self.fetches = []
+        self.all     = getattr(SavedMacro, 'all', None)
+        SavedMacro.all = classmethod(lambda cls: FakeQuery(self.macros, self.fetches))
+        memcache._d.clear()
+
+    def tearDown(self):
+        if self.all is None: del SavedMacro.all
+        else:                SavedMacro.all = self.all
+
+    # Walk every page by position, in both orders.
+    def test_keyset(self):
+        for sort in ('-views', 'views'):
+            expected = FakeQuery(self.macros, []); expected.order(sort)
+            expected = [m.link_id for m in expected.fetch(100)]
+            seen, position = [], None
+            while True:
+                page = fetch_after('mage', sort, position, 5)
+                seen.extend([m.link_id for m in page])
+                if len(page) < 5: break
+                position = get_position(page[-1], sort)
+            self.assertEqual(expected, seen)
+
+    def test_position_token(self):
+        position = (3, u'm12')
+        self.assertEqual(position, decode_position(encode_position(position), '-views'))
+        self.assertEqual((None, u'm1'), decode_position(encode_position((None, 'm1')), 'title'))
+        self.assertEqual(None, encode_position(None))
+        self.assertRaises(InvalidSearchError, decode_position, 'junk', '-views')
+        self.assertRaises(InvalidSearchError, decode_position, encode_position(('x', 'm1')), '-views')
+
+    # With a chain, any page is found without fetching.
+    def test_chain(self):
+        self.assertEqual(5, SavedMacroOps.build_search_chain('mage', '-views', 5))
+        positions, complete = memcache.get(chain_key('mage', '-views', 5))
+        self.assertTrue(complete)
+        self.assertEqual(4, len(positions))
+        del self.fetches[:]
+        self.assertEqual(positions[2], get_page_position('mage', 4, '-views', 5))
+        self.assertEqual(savedmacro._NO_PAGE, get_page_position('mage', 6, '-views', 5))
+        self.assertEqual([], self.fetches)
+
+        # A full last page has no page after it.
+        del self.macros[20:]
+        self.assertEqual(4, SavedMacroOps.build_search_chain('mage', 'views', 5))
+
+        # Chains can stop short.
+        self.assertEqual(2, SavedMacroOps.build_search_chain('mage', 'views', 5, max_pages=2))
+        self.assertFalse(memcache.get(chain_key('mage', 'views', 5))[1])
+
+    # Without a chain, pages are walked to, but not too far.
+    def test_walk(self):
+        position = get_page_position('mage', 3, '-views', 2)
+        self.assertEqual([4], self.fetches)
+        self.assertEqual(position, get_page_position('mage', 3, '-views', 2))
+        self.assertEqual([4], self.fetches)
+        # From page 3: the ties, then the rest, two pages' worth.
+        del self.fetches[:]
+        get_page_position('mage', 5, '-views', 2)
+        self.assertEqual(4, sum(self.fetches))
+        self.assertEqual(savedmacro._NO_PAGE, get_page_position('mage', 50, '-views', 2))
+
+    def test_bad_sort(self):
+        self.assertRaises(InvalidSearchError, SavedMacroOps.search, 'mage', sort='-macro')
+
+    # Single tags are left to the datastore, even with an index.
+    def test_single_tag(self):
+        get_tag_index = savedmacro.get_tag_index
+        savedmacro.get_tag_index = lambda: TagIndex([(0, ['mage'], 1, 1)])
+        try:
+            self.assertEqual(None, SavedMacroOps.search_tags('Mage'))
+            self.assertEqual(None, SavedMacroOps.search_tags('mage +'))
+        finally:
+            savedmacro.get_tag_index = get_tag_index
+
+    # Refreshes pick up macros saved and counts flushed elsewhere.
+    def test_refresh(self):
+        index = TagIndex([(i, ['mage'], 0, 0) for i in range(3)])
+        self.macros[:] = [FakeMacro("m%s" % i, 5, ('mage', 'pvp'), i, 2) for i in range(5)]
+        self.assertEqual(2, refresh_tag_index(index, force=True))
+        self.assertEqual([3, 4], list(index.query([['pvp']])))
+        self.assertEqual(0, refresh_tag_index(index))
+
+        publish_counts([FakeMacro("m1", 50, index=1, rating=9)])
+        refresh_tag_index(index, force=True)
+        self.assertEqual(([1, 3], True), index.search([['mage']], '-views', 1, 2))
+        self.assertEqual(([1], True), index.search([['mage']], '-rating', 1, 1))
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestSearch)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,116 @@
+''' Test the in-process tag dictionary for typeahead. '''
+
+import time
+import random
+import unittest
+from google.appengine.api            import memcache
+from macro.data.local                import tagdict
+from macro.data.local.tagdict        import TagDictionary
+from macro.data.local.tagindex       import TagIndex
+from macro.data.appengine            import macrotag, savedmacro
+
+
+# Just enough of a keys-only key range query over tag names.
+class FakeKey(object):
+    def __init__(self, name): self.key_name = name
+    def name(self):           return self.key_name
+
+class FakeTagQuery(object):
+    def __init__(self, tags):
+        self.tags    = tags
+        self.filters = []
+    def filter(self, f, key):
+        self.filters.append((f.split()[1], key[-1]))
+    def fetch(self, limit):
+        ret = sorted(self.tags)
+        for op, name in self.filters:
+            if op == '>=': ret = [t for t in ret if t >= name]
+            else:          ret = [t for t in ret if t < name]
+        return [FakeKey(t) for t in ret[:limit]]
+
+
+class TestTagDictionary(unittest.TestCase):
+    def setUp(self):
+        self.rand   = random.Random(3)
+        self.counts = [(u'druid', 40), (u'dps', 7), (u'death knight', 12),
+                       (u'deathcoil', 12), (u'mage', 30), (u'macro', 2),
+                       (u'\xe9clair', 1)]
+        self.dict   = TagDictionary(self.counts)
+
+    # Helper to rank by brute force.
+    def expected(self, counts, prefix, num=tagdict.MAX_COMPLETIONS):
+        ranked = sorted([(-c, t) for t, c in counts if t.startswith(prefix)])
+        return [t for c, t in ranked[:num]]
+
+    def test_complete(self):
+        self.assertEqual([u'druid', u'death knight', u'deathcoil', u'dps'],
+                         self.dict.complete('d'))
+        self.assertEqual([u'death knight', u'deathcoil'], self.dict.complete('DEA'))
+        self.assertEqual([u'druid'], self.dict.complete('d', 1))
+        self.assertEqual([u'\xe9clair'], self.dict.complete('\xc3\xa9'))
+        self.assertEqual([], self.dict.complete('x'))
+        self.assertEqual([], self.dict.complete(''))
+
+    def test_add(self):
+        self.dict.add_tags([u'dps', u'dk'])
+        self.dict.add_tags(['dk'])
+        self.assertEqual([u'dps', u'dk'], self.dict.complete('d')[-2:])
+        self.assertEqual(8, len(self.dict))
+
+    # Long runs are ranked ahead of time, and kept ranked as counts
+    # change.
+    def test_long_runs(self):
+        counts = [(u'a%04d' % i, self.rand.randint(0, 50)) for i in range(500)]
+        counts.append((u'b', 1))
+        d = TagDictionary(counts)
+        self.assertTrue(u'a' in d.top and u'a0' in d.top)
+        for prefix in (u'a', u'a0', u'a04', u'a049', u'b'):
+            self.assertEqual(self.expected(counts, prefix), d.complete(prefix))
+
+        counts = dict(counts)
+        for i in range(2000):
+            tag = self.rand.choice([u'a%04d' % self.rand.randint(0, 600), u'b'])
+            d.add_tags([tag])
+            counts[tag] = counts.get(tag, 0) + 1
+        counts = counts.items()
+        for prefix in (u'a', u'a0', u'a05', u'a059', u'b'):
+            self.assertEqual(self.expected(counts, prefix), d.complete(prefix))
+
+    # The tag index keeps its dictionary up to date.
+    def test_tag_index(self):
+        index = TagIndex([(0, ['druid', 'pvp'], 0, 0),
+                          (1, ['druid', 'pve'], 0, 0),
+                          (2, ['pve'], 0, 0)])
+        self.assertEqual([u'pve', u'pvp'], index.get_dictionary().complete('p'))
+        index.add_macro(3, ['pvp', 'pvp arenas'])
+        index.add_macro(4, ['pvp'])
+        index.add_macro(4, ['pvp'])
+        self.assertEqual([u'pvp', u'pve', u'pvp arenas'], index.get_dictionary().complete('p'))
+
+    # Typeahead completes from the index, and from the tag entities
+    # for tags the index hasn't seen yet.
+    def test_typeahead(self):
+        index = TagIndex([(0, ['druid', 'pvp'], 0, 0), (1, ['druid'], 0, 0)])
+        saved = (macrotag.get_tag_index, savedmacro._TAG_REFRESH['time'],
+                 getattr(macrotag.MacroTag, 'all', None))
+        macrotag.get_tag_index = lambda: index
+        savedmacro._TAG_REFRESH['time'] = time.time()
+        macrotag.MacroTag.all = classmethod(lambda cls, keys_only=False:
+                                            FakeTagQuery([u'druid', u'paladin', u'pve']))
+        memcache._d.clear()
+        try:
+            self.assertEqual([u'druid'], macrotag.get_macro_tags_for('DR'))
+            self.assertEqual([u'pvp'], macrotag.get_macro_tags_for('pv'))
+            self.assertEqual([u'paladin'], macrotag.get_macro_tags_for('pa'))
+            self.assertEqual([], macrotag.get_macro_tags_for(''))
+        finally:
+            macrotag.get_tag_index = saved[0]
+            savedmacro._TAG_REFRESH['time'] = saved[1]
+            if saved[2] is None: del macrotag.MacroTag.all
+            else:                macrotag.MacroTag.all = saved[2]
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestTagDictionary)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,84 @@
+''' Test the in-process tag index. '''
+
+import os
+import random
+import tempfile
+import unittest
+from array                     import array
+from StringIO                  import StringIO
+from macro.data.local.tagindex import TagIndex, load_tag_index, parse_tag_query, intersect, union
+from build_tag_index           import read_export
+
+
+class TestTagIndex(unittest.TestCase):
+    def setUp(self):
+        self.rand = random.Random(7)
+        # (index, tags, views, rating)
+        self.macros = [(0, ['druid', 'pvp'],          10, 5),
+                       (1, ['druid', 'pve'],          30, 9),
+                       (2, ['mage', 'pvp', 'focus'],  20, 9),
+                       (3, ['druid', 'pvp', 'focus'], 30, 1),
+                       (5, ['druid', 'arenas'],       0,  0)]
+        self.index = TagIndex(self.macros)
+
+    # Merges agree with set operations, for lists of very different
+    # lengths.
+    def test_merges(self):
+        for n, m in ((0, 5), (3, 1000), (200, 300), (1000, 1000)):
+            a = sorted(self.rand.sample(xrange(5000), n))
+            b = sorted(self.rand.sample(xrange(5000), m))
+            self.assertEqual(sorted(set(a) & set(b)), list(intersect(array('i', a), array('i', b))))
+            self.assertEqual(sorted(set(a) | set(b)), list(union(array('i', a), array('i', b))))
+
+    def test_parse(self):
+        self.assertEqual([['druid'], ['pvp', 'arenas'], ['focus']],
+                         parse_tag_query("Druid + pvp|Arenas + focus"))
+        self.assertEqual([['death knight']], parse_tag_query(" Death Knight +"))
+        self.assertEqual([], parse_tag_query(" + | "))
+
+    def test_query(self):
+        self.assertEqual([0, 3], list(self.index.query([['druid'], ['pvp']])))
+        self.assertEqual([0, 3, 5], list(self.index.query([['druid'], ['pvp', 'arenas']])))
+        self.assertEqual([2, 3], list(self.index.query([['focus']])))
+        self.assertEqual([], list(self.index.query([['druid'], ['nope']])))
+
+    # Pages are in sort order, ties by index.
+    def test_search(self):
+        groups = [['druid', 'mage']]
+        self.assertEqual(([1, 3], True),  self.index.search(groups, '-views', 1, 2))
+        self.assertEqual(([2, 0], True),  self.index.search(groups, '-views', 2, 2))
+        self.assertEqual(([5], False),    self.index.search(groups, '-views', 3, 2))
+        self.assertEqual(([5, 3, 0], True), self.index.search(groups, 'rating', 1, 3))
+        self.assertEqual(([], False),     self.index.search(groups, 'views', 9, 2))
+
+    def test_add(self):
+        self.index.add_macro(9, ['druid', 'pvp'])
+        self.index.add_macro(4, ['pvp'], views=50)
+        self.index.add_macro(4, ['pvp'], views=50)
+        self.assertEqual([0, 3, 9], list(self.index.query([['druid'], ['pvp']])))
+        self.assertEqual(([4], True), self.index.search([['pvp']], '-views', 1, 1))
+
+    def test_save(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self.index.save(path)
+            loaded = load_tag_index(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(self.index.postings, loaded.postings)
+        groups = [['druid'], ['pvp', 'pve']]
+        self.assertEqual(self.index.search(groups), loaded.search(groups))
+
+    def test_export(self):
+        export = StringIO("key,macro,index,tags,views,rating\r\n"
+                          "m0,/cast Moonfire,0,\"druid,pvp\",10,5\r\n"
+                          "m1,/cast Frostbolt,1,mage,,\r\n")
+        self.assertEqual([(0, [u'druid', u'pvp'], 10, 5), (1, [u'mage'], 0, 0)],
+                         list(read_export(export)))
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestTagIndex)
+    unittest.TextTestRunner(verbosity=2).run(suite)
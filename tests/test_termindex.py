@@ -0,0 +1,71 @@
+''' Test the in-process index of spells, items and options used by
+saved macros. '''
+
+import unittest
+from StringIO                        import StringIO
+from macro.data.wow                  import SOURCE_TEST
+from macro.data.local.tagindex       import parse_tag_query
+from macro.data.local                import termindex
+from macro.data.local.tagindex       import TagIndex
+from macro.data.local.termindex      import get_macro_terms, add_macro_terms
+from macro.interpret.interpreter     import MacroInterpreter
+from build_term_index                import read_export, index_shard, build_term_index
+
+
+class TestTermIndex(unittest.TestCase):
+    def setUp(self):
+        self.mi = MacroInterpreter(data_source=SOURCE_TEST)
+
+    # Helper to get the terms for a macro.
+    def terms(self, macro):
+        return get_macro_terms(self.mi.interpret_macro(macro))
+
+    def test_terms(self):
+        terms = self.terms("/cast [harm,nodead,target=mouseover] Polymorph")
+        for t in (u'verb:/cast', u'spell:polymorph', u'opt:harm',
+                  u'opt:nodead', u'target:mouseover'):
+            self.assertTrue(t in terms, t)
+        self.assertEqual(1, len([t for t in terms if t.startswith(u'spell:') and t[6:].isdigit()]))
+
+    def test_slots(self):
+        self.assertTrue(u'slot:13' in self.terms("/use 13"))
+        # A bag and slot is not an inventory slot.
+        self.assertEqual([], [t for t in self.terms("/use 0 1") if t.startswith(u'slot:')])
+
+    def test_build(self):
+        export = StringIO("key,macro,index,tags,views,rating\r\n"
+                          "m0,/cast [harm] Polymorph,0,mage,10,5\r\n"
+                          "m1,/cast [help] Arcane Intellect,1,mage,30,1\r\n"
+                          "m2,/use 13,2,,,\r\n")
+        macros = list(read_export(export))
+        self.assertEqual((2, u'/use 13', 0, 0), macros[2])
+
+        rows, errors = index_shard(macros)
+        self.assertEqual(0, errors)
+        self.assertEqual([0, 1, 2], [r[0] for r in rows])
+
+        index, count, errors = build_term_index(macros, processes=2, shard_size=1)
+        self.assertEqual((3, 0), (count, errors))
+        self.assertEqual([0], list(index.query(parse_tag_query("spell:polymorph + opt:harm"))))
+        self.assertEqual(([1, 0], False),
+                         index.search(parse_tag_query("opt:harm|opt:help + verb:/cast")))
+        self.assertEqual([2], list(index.query(parse_tag_query("slot:13"))))
+
+    # Macros that fail to interpret, including with errors that
+    # aren't Exceptions, are left out of the index.
+    def test_add_errors(self):
+        index = TagIndex([(0, [u'verb:/cast'], 0, 0)])
+        saved = termindex.get_term_index
+        termindex.get_term_index = lambda: index
+        try:
+            add_macro_terms(1, "/cast " * 1000)
+            add_macro_terms(2, "")
+        finally:
+            termindex.get_term_index = saved
+        self.assertEqual(0, index.last_index())
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestTermIndex)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,87 @@
+''' Stress test for concurrent interpretation.  Interprets every
+macro in the test file from many threads at once, sharing a single
+interpreter, and checks that the results match a serial run. '''
+
+import random
+import threading
+import traceback
+import unittest
+
+from macro.exceptions import *
+from macro.interpret.interpreter import get_test_mi
+
+
+# How many threads, and how many passes each thread makes over the
+# test macros.
+NUM_THREADS = 8
+NUM_PASSES  = 2
+
+
+# Read in the test macros.  Macros are seperated by blank lines.
+def read_macros(path='tests/test_macros.txt'):
+    macros = []
+    macro  = []
+    f = open(path, 'r')
+    for line in f.readlines():
+        if not line.isspace():
+            macro.append(line)
+        elif len(macro) > 0:
+            macros.append(''.join(macro))
+            macro = []
+    if len(macro) > 0: macros.append(''.join(macro))
+    f.close()
+    return macros
+
+
+# Reduce an interpretation to something comparable.
+def fingerprint(mi, macro):
+    try:
+        int_macro = mi.interpret_macro(macro)
+    except BaseException, inst:
+        return (inst.__class__.__name__, str(inst))
+    cmds = []
+    for cmd in int_macro:
+        cmds.append((cmd.cmd_str,
+                     [t.get_list() + [t.strike, t.found(), t.get_render_desc()] for t in cmd.cmd_list]))
+    return (int_macro.get_test_repr(), cmds,
+            int_macro.macro_len, int_macro.macro_good,
+            int_macro.macro_changed)
+
+
+class TestThreads(unittest.TestCase):
+    def setUp(self):
+        self.macros = read_macros()
+        return
+
+    def test_concurrent_matches_serial(self):
+        mi = get_test_mi(debug=False, test=False)
+        serial = [fingerprint(mi, m) for m in self.macros]
+
+        results = {}
+        errors  = []
+        def worker(seed):
+            # Each thread runs the macros in its own order.
+            order = range(len(self.macros)) * NUM_PASSES
+            random.Random(seed).shuffle(order)
+            try:
+                results[seed] = [(i, fingerprint(mi, self.macros[i])) for i in order]
+            except:
+                errors.append(traceback.format_exc())
+
+        threads = [threading.Thread(target=worker, args=(seed,)) \
+                   for seed in range(NUM_THREADS)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+
+        self.assertEqual([], errors)
+        self.assertEqual(NUM_THREADS, len(results))
+        for seed, thread_results in results.items():
+            for i, result in thread_results:
+                self.assertEqual(serial[i], result,
+                                 "\nMACRO: %s\nTHREAD: %s" % (self.macros[i], seed))
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestThreads)
+    unittest.TextTestRunner(verbosity=2).run(suite)
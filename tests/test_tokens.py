@@ -0,0 +1,58 @@
+''' Test slotted tokens and the shared TxtToken pool. '''
+
+import cPickle
+import unittest
+from macro.exceptions            import *
+from macro.data.wow              import SOURCE_TEST
+from macro.lex.lexer             import MacroCommandTokenizer
+from macro.interpret.interpreter import MacroInterpreter
+from macro.interpret.txt_token   import TxtToken, get_txt_token, set_render_space_after
+
+
+class TestTokens(unittest.TestCase):
+    # Fixed text gives the same read-only token.
+    def test_shared(self):
+        a = get_txt_token("nothing")
+        self.assert_(a is get_txt_token("nothing"))
+        self.assertFalse(a is get_txt_token("nothing", render_space_after=False))
+        self.assertRaises(AttributeError, setattr, a, 'render_space_after', False)
+
+        b = set_render_space_after(a, False)
+        self.assert_(b is get_txt_token("nothing", render_space_after=False))
+        self.assertEqual(True, a.render_space_after)
+
+        # Unshared tokens are changed in place.
+        t = TxtToken("nothing")
+        self.assert_(set_render_space_after(t, False) is t)
+        self.assertEqual(False, t.render_space_after)
+
+    # Copies keep every field, but not the object.
+    def test_copy(self):
+        lexer = MacroCommandTokenizer(use_cache=False)
+        lexer.reset("/cast [target=focus] Polymorph", 2)
+        for t in lexer.get_tokens():
+            t.strike = True
+            c = t.copy()
+            self.assertFalse(c is t)
+            self.assertEqual(t.get_list() + [t.index, t.strike, t.attrs],
+                             c.get_list() + [c.index, c.strike, c.attrs])
+            self.assertFalse(hasattr(c, '__dict__'))
+
+    # Interpretations survive pickling, and come back with the
+    # shared tokens.
+    def test_pickle(self):
+        mi = MacroInterpreter(data_source=SOURCE_TEST)
+        macro = mi.interpret_macro("#showtooltip\n/cast [mod:shift,target=focus][] Polymorph; Frostbolt")
+        copy = cPickle.loads(cPickle.dumps(macro, cPickle.HIGHEST_PROTOCOL))
+        self.assertEqual(len(macro.macro_data), len(copy.macro_data))
+        for a, b in zip(macro.macro_data, copy.macro_data):
+            self.assertEqual(repr(a.interpret), repr(b.interpret))
+        shared = get_txt_token("for the first item or spell in this macro on the action bar",
+                               render_space_after=False)
+        self.assert_(copy.macro_data[0].interpret[0][1][-1] is shared)
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestTokens)
+    unittest.TextTestRunner(verbosity=2).run(suite)
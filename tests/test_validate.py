@@ -0,0 +1,59 @@
+''' Test the validate-only pass. '''
+
+import unittest
+from macro.exceptions            import *
+from macro.data.wow              import SOURCE_TEST
+from macro.interpret.interpreter import MacroInterpreter
+from macro.interpret.errors      import MAX_LEN_ALLOWED
+from macro.parse.validate        import validate_macro
+from interpret_batch             import read_macros
+
+
+class TestValidate(unittest.TestCase):
+    # Helper to get the spans as tuples.
+    def spans(self, macro):
+        return [(s['type'], s['line'], s['start'], s['end'])
+                for s in validate_macro(macro)['spans']]
+
+    def test_valid(self):
+        result = validate_macro("#showtooltip\n/cast [mod:shift,target=focus][] Polymorph; Frostbolt")
+        self.assertEqual(True, result['macro_good'])
+        self.assertEqual([], result['spans'])
+        self.assertEqual(66, result['macro_len'])
+
+    # Lines are numbered as in the text, blank ones included.
+    def test_errors(self):
+        self.assertEqual([('error', 2, 6, 21)],
+                         self.spans("/cast Heal\r\n\n/cast [mod:shift Heal"))
+        self.assertEqual([('error', 0, 7, 13)], self.spans("/cast [nomod:] Heal"))
+        self.assertEqual([('error', 0, 14, 19)], self.spans("/castsequence reset=1 [combat] A, B"))
+        self.assertFalse(validate_macro("/cast [nomod:] Heal")['macro_good'])
+
+    def test_warn(self):
+        macro  = "/cast [mod:focuscast,target=party1] Heal"
+        result = validate_macro(macro)
+        self.assertEqual(True, result['macro_good'])
+        self.assertEqual([('warn', 0, 21, 27)], self.spans(macro))
+        self.assert_(result['spans'][0]['msg'].startswith("Setting the target to party 1"))
+
+    def test_too_long(self):
+        macro = "/cast Heal\n/cast " + "x" * MAX_LEN_ALLOWED
+        self.assertEqual([('error', 1, MAX_LEN_ALLOWED - 11, MAX_LEN_ALLOWED + 6)], self.spans(macro))
+        self.assertRaises(InitError, validate_macro, " \n")
+
+    # Anything validate calls an error, the interpreter does too.
+    def test_matches_interpreter(self):
+        mi = MacroInterpreter(data_source=SOURCE_TEST)
+        for macro_id, macro in read_macros(open('tests/test_macros.txt'), 'blocks'):
+            try:
+                int_macro = mi.interpret_macro(macro)
+            except BaseException:
+                continue
+            if not validate_macro(macro)['macro_good']:
+                self.assertFalse(int_macro.macro_good, macro)
+
+
+if __name__ == '__main__':
+    # Run all tests
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestValidate)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -8,8 +8,9 @@ import logging
 from google.appengine.ext             import webapp
 from google.appengine.ext.webapp.util import run_wsgi_app
 
-from macro.render.defs                import URL_MACRO_TT, GET_MACRO_LINK
+from macro.render.defs                import URL_MACRO_TT, GET_MACRO_LINK, HTTP_MAX_AGE_TT
 from macro.render.page.tooltip        import generate_tooltip
+from macro.render.conditional         import get_macro_etag, is_not_modified, set_cache_headers, send_not_modified
 
 
 # Save the template path from this CGI
@@ -27,15 +28,24 @@ class MacroToolTip(webapp.RequestHandler):
     '''
     Return rendered tooltip for macroid in url.
     '''
+    # Get the macro id
+    mid = self.request.get(GET_MACRO_LINK)
+
+    # Hovers fetch the same tooltips over and over; if the client
+    # has this one already, say so.
+    etag = get_macro_etag(mid, 'tt')
+    if is_not_modified(self.request, etag):
+      send_not_modified(self.response, etag, HTTP_MAX_AGE_TT)
+      return
+
     # Generate tooltip, or nothing on error.
     tt  = ''
     try:
-      # Get the macro id
-      mid = self.request.get(GET_MACRO_LINK)
       tt = generate_tooltip(_TEMPLATE_PATH, mid)
     except Exception, inst:
       logging.error(inst)
     self.response.out.write(tt)
+    if tt: set_cache_headers(self.response, etag, HTTP_MAX_AGE_TT)
 
     
 ''' Register handlers for WSCGI. '''